@@ -0,0 +1,348 @@
+import argparse
+import re
+import time
+import warnings
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from dft import (
+    parse_procedure_name,
+    parse_wait_delay,
+    parse_wait_until,
+    parse_constant_value,
+    parse_register_notation,
+    parse_force_sweep_instruction,
+    parse_force_instruction,
+    parse_savemeas,
+    parse_measurements,
+    parse_read_instruction,
+    parse_save_instruction,
+    parse_copy_instruction,
+    parse_restore_instruction,
+    parse_trigger_instruction,
+    parse_trim_instruction,
+    parse_meas_match_regex,
+    parse_calculate_expression,
+    parse_sweep_trig_store,
+    solve_formula,
+)
+from common import ivm6201_pin_check
+from regmap import parse_symbolic_register_notation, resolve_symbol
+from test_analyzer import load_test_sheet
+from variables import VariableStore
+from workbook import load_program
+
+warnings.filterwarnings('ignore')
+
+# Steps of a test that set its variables, in program order. MEASURE, READ and SAVE values are inputs of the
+# batch: measured on the bench (SaveMeas__, Sweep__Trig__Store) or read from the DUT (Read__, Save__)
+MEASURE = 'measure'
+READ = 'read'
+SAVE = 'save'
+CONSTANT = 'constant'
+CALCULATE = 'calculate'
+TRIM = 'trim'  # Calculate__MinError of a trimming test: the code of the trim sweep closest to the typical value
+INPUTS = (MEASURE, READ, SAVE)
+PROCEDURE = 'procedure'
+
+# variable is the variable set by the step, argument the formula, constant value or trim registers
+Step = namedtuple('Step', ['kind', 'variable', 'argument', 'limit_checked'])
+# limit check of a value over the DUTs: passed is 1.0 pass, 0.0 fail and NaN when the value is NaN or has no limit
+LimitResult = namedtuple('LimitResult', ['test', 'variable', 'values', 'low', 'high', 'unit', 'passed'])
+
+# First matching parser of an instruction, in the order TestAnalyzer tries them,
+# kind None for the instructions that set no variable
+TEST_PARSERS = [
+    (parse_procedure_name, PROCEDURE), (parse_wait_delay, None), (parse_wait_until, None),
+    (parse_constant_value, CONSTANT), (parse_register_notation, None), (parse_symbolic_register_notation, None),
+    (parse_force_sweep_instruction, None), (parse_force_instruction, None), (parse_savemeas, MEASURE),
+    (parse_measurements, None), (parse_read_instruction, READ), (parse_save_instruction, SAVE),
+    (parse_copy_instruction, None), (parse_restore_instruction, None), (parse_trigger_instruction, None),
+    (parse_trim_instruction, TRIM), (parse_meas_match_regex, None), (parse_calculate_expression, CALCULATE),
+    (parse_sweep_trig_store, MEASURE),
+]
+# procedures have no Read__, their Trim__ is ignored and their constants come last
+PROCEDURE_PARSERS = [
+    (parse_procedure_name, PROCEDURE), (parse_register_notation, None), (parse_symbolic_register_notation, None),
+    (parse_save_instruction, SAVE), (parse_copy_instruction, None), (parse_restore_instruction, None),
+    (parse_wait_delay, None), (parse_wait_until, None), (parse_force_instruction, None), (parse_savemeas, MEASURE),
+    (parse_measurements, None), (parse_trigger_instruction, None), (parse_trim_instruction, None),
+    (parse_meas_match_regex, None), (parse_calculate_expression, CALCULATE), (parse_sweep_trig_store, MEASURE),
+    (parse_constant_value, CONSTANT),
+]
+
+
+def _parse(instruction, parsers):
+    for parser, kind in parsers:
+        if (parsed := parser(instruction)):
+            return kind, parser, parsed
+    return None, None, None
+
+
+def _sweep_trig_store_pins(sweep_trig_store):
+    # the pin check of TestAnalyzer, the trigger signal can also be a status register of the register map
+    trig_signal = sweep_trig_store.get('trig_signal')
+    return all([
+        ivm6201_pin_check(sweep_trig_store.get('sweep_signal')) if sweep_trig_store.get('sweep_signal') else False,
+        ivm6201_pin_check(sweep_trig_store.get('sweeper_reference')) if sweep_trig_store.get('sweeper_reference') else False,
+        (ivm6201_pin_check(trig_signal) or resolve_symbol(trig_signal) is not None) if trig_signal else False,
+        ivm6201_pin_check(sweep_trig_store.get('trig_reference')) if sweep_trig_store.get('trig_reference') else False,
+    ])
+
+
+def _data_instructions(instructions, procedures_df, _stack=()):
+    # (kind, parser, parsed, in procedure) of the instructions setting variables, procedures expanded
+    found = []
+    parsers = PROCEDURE_PARSERS if _stack else TEST_PARSERS
+    for instruction in instructions.split('\n'):
+        instruction = instruction.strip()
+        if not instruction:
+            continue
+        kind, parser, parsed = _parse(instruction, parsers)
+        if kind == PROCEDURE:
+            if (parsed in procedures_df.columns and parsed not in _stack
+                    and isinstance(procedures_df.loc[0, parsed], str)):
+                found += _data_instructions(procedures_df.loc[0, parsed], procedures_df, _stack + (parsed,))
+        elif kind:
+            found.append((kind, parser, parsed, bool(_stack)))
+    return found
+
+
+def test_steps(test_name, instructions, procedures_df):
+    """
+    Compiles the instructions of a test into the steps setting its variables, in the order TestAnalyzer runs them.
+
+    The names of the unnamed variables, '<test>_test<n>', and the limit checks are worked out here:
+    they only depend on the program, not on the values of a DUT.
+
+    Args:
+        test_name (str): Name of the test.
+        instructions (str): Instructions of the test, one per line.
+        procedures_df (pandas.DataFrame): The 'Procedure' sheet.
+
+    Returns:
+        list: The Step of the test.
+    """
+    trimming = bool(re.search('trim', test_name.lower()))
+    min_error = bool(re.search('Calculate__MinError', instructions))
+    variables = set()
+    steps = []
+    measured = None  # variable of the last SaveMeas__ of the test, swept by Calculate__MinError
+    trim_registers = None
+
+    def add(kind, variable, argument=None, limit_checked=False):
+        variable = variable or f"{test_name}_test{len(variables) + 1}"
+        variables.add(variable)
+        steps.append(Step(kind, variable, argument, limit_checked))
+        return variable
+
+    for kind, parser, parsed, in_procedure in _data_instructions(instructions, procedures_df):
+        if kind == CONSTANT:
+            name = next(iter(parsed))
+            steps.append(Step(CONSTANT, name, parsed[name], False))
+        elif kind == MEASURE and parser is parse_savemeas:
+            # a single measurement is limit checked, unless it is the trim sweep
+            limit_checked = not in_procedure and len(variables) <= 1 and not trimming and not min_error
+            variable = add(MEASURE, parsed.get('save_variable'), limit_checked=limit_checked)
+            if not in_procedure:
+                measured = variable
+        elif kind == MEASURE:
+            if in_procedure or _sweep_trig_store_pins(parsed):
+                add(MEASURE, parsed.get('variable'), limit_checked=True)
+        elif kind == READ:
+            if parsed.get('read_variable'):
+                add(READ, parsed['read_variable'])
+        elif kind == SAVE:
+            add(SAVE, parsed.get('save_variable'))
+        elif kind == TRIM:
+            trim_registers = parsed.get('registers', [])
+        elif kind == CALCULATE:
+            if parsed.get('formula'):
+                add(CALCULATE, parsed.get('calculate_variable') or parsed.get('operation'), parsed['formula'], True)
+            elif (parsed.get('operation') == 'MinError' and trimming and not in_procedure
+                  and measured and trim_registers):
+                steps.append(Step(TRIM, measured, trim_registers, True))
+    return steps
+
+
+def trim_codes(registers):
+    """
+    Returns:
+        int: Number of codes of the trim registers, the columns of a trim sweep.
+    """
+    return 2 ** sum(register['msb'] - register['lsb'] + 1 for register in registers)
+
+
+def check_limits(values, min_limit, typ_limit, max_limit):
+    """
+    Checks the values of every DUT against the limits of a test, as TestAnalyzer.test_limits does for one value.
+
+    Args:
+        values (numpy.ndarray): Value per DUT.
+        min_limit, typ_limit, max_limit: Limits of the test from the sheet, NaN or text when missing.
+
+    Returns:
+        tuple: (passed, low, high), passed 1.0, 0.0 or NaN per DUT, low and high the limits recorded.
+    """
+    min_limit, typ_limit, max_limit = (pd.to_numeric(limit, errors='coerce') for limit in (min_limit, typ_limit, max_limit))
+    values = np.asarray(values, dtype=float)
+    if not pd.isna(min_limit) and not pd.isna(max_limit):
+        passed = (min_limit <= values) & (values <= max_limit)
+    elif not pd.isna(max_limit):
+        passed = values < max_limit
+    elif not pd.isna(min_limit):
+        passed = values > min_limit
+    else:
+        passed = np.full(values.shape, np.nan)
+    passed = np.where(np.isnan(values), np.nan, passed.astype(float))
+    return passed, min_limit, max_limit
+
+
+def min_error_trim(sweep, target):
+    """
+    Picks the trim code of every DUT whose measurement is closest to the target.
+
+    Args:
+        sweep (numpy.ndarray): (DUTs, codes) measurement of every trim code, NaN for the codes not measured.
+        target (float): Value the trim aims at, the typical value of the test.
+
+    Returns:
+        tuple: (codes, values), the code and its measurement per DUT, NaN for the DUTs without measurement.
+    """
+    sweep = np.asarray(sweep, dtype=float)
+    error = np.abs(sweep - target)
+    measured = ~np.isnan(error).all(axis=1)
+    codes = np.where(np.isnan(error), np.inf, error).argmin(axis=1)
+    values = np.where(measured, sweep[np.arange(len(sweep)), codes], np.nan)
+    return np.where(measured, codes, np.nan), values
+
+
+class BatchAnalyzer:
+    """
+    Runs the calculations of a test over many DUTs at once, from their measurements.
+
+    The test is compiled once into the steps setting its variables. Variables are vectors over
+    the DUTs, so every Calculate__ formula, trim and limit check is evaluated once for the batch.
+    Nothing is forced or measured: the SaveMeas__, Sweep__Trig__Store, Read__ and Save__ values
+    are given, simulated or recorded.
+    """
+
+    def __init__(self, excel_file, sheet_name, test_name, program=None):
+        """
+        Args:
+            excel_file (str): Path to the Excel file.
+            sheet_name (str): Name of the sheet to read.
+            test_name (str): Name of the test to run.
+            program (workbook.TestProgram, optional): The test sheet and the 'Procedure' sheet already loaded.
+        """
+        program = program or load_program(excel_file, [sheet_name, 'Procedure'])
+        self.test_name = test_name
+        raw_data = load_test_sheet(excel_file, sheet_name, program)
+        instructions = raw_data.loc['Instructions', test_name]
+        self.steps = test_steps(test_name, instructions if isinstance(instructions, str) else '', program.sheets['Procedure'])
+        self.limits = tuple(raw_data.loc[row, test_name] for row in ('Min', 'Typ', 'Max'))
+        unit = raw_data.loc['Unit ', test_name] if 'Unit ' in raw_data.index else ''
+        self.unit = unit.strip() if isinstance(unit, str) else ''
+
+    def inputs(self):
+        """
+        Returns:
+            dict: Input variable -> number of trim codes of its sweep, None for a value per DUT.
+        """
+        trims = {step.variable: trim_codes(step.argument) for step in self.steps if step.kind == TRIM}
+        return {step.variable: trims.get(step.variable) for step in self.steps if step.kind in INPUTS}
+
+    def run(self, measurements, duts=None):
+        """
+        Runs the test over the DUTs.
+
+        Args:
+            measurements (Mapping): Input variable -> value per DUT, (DUTs, codes) for a trim sweep, see inputs().
+            duts (int, optional): Number of DUTs, the length of the measurements if not given.
+
+        Returns:
+            tuple: (results, Vars), the LimitResult of every limit checked value and the variables of the DUTs.
+        """
+        if duts is None:
+            duts = len(next(iter(measurements.values()))) if measurements else 1
+        variables = VariableStore(sites=duts)
+        constants = VariableStore(parent=variables, sites=duts)  # constants first, then variables
+        sweeps = {}
+        results = []
+        for step in self.steps:
+            if step.kind == CONSTANT:
+                constants[step.variable] = step.argument
+                continue
+            if step.kind in INPUTS:
+                values = np.asarray(measurements.get(step.variable, np.nan), dtype=float)
+                if step.variable not in measurements:
+                    print(f'!!!!! {self.test_name} fail no measurement of {step.variable}')
+                if values.ndim == 2:
+                    sweeps[step.variable] = values
+                    values = np.nan
+            elif step.kind == CALCULATE:
+                values = solve_formula(formula_string=step.argument, variables=constants)
+                # a division by zero fails the formula of that DUT, as it does for a single value
+                values = np.where(np.isinf(values), np.nan, values) if values is not None else np.nan
+            else:
+                if (sweep := sweeps.get(step.variable)) is None:
+                    print(f'!!!!! {self.test_name} fail no trim sweep of {step.variable}')
+                    sweep = np.full((duts, trim_codes(step.argument)), np.nan)
+                # the code goes to the operation variable, as Calculate__ does without variable name
+                variables['MinError'], values = min_error_trim(sweep, pd.to_numeric(self.limits[1], errors='coerce'))
+            variables[step.variable] = values
+            if step.limit_checked:
+                values = np.broadcast_to(np.asarray(variables[step.variable], dtype=float), (duts,))
+                passed, low, high = check_limits(values, *self.limits)
+                results.append(LimitResult(self.test_name, step.variable, values, low, high, self.unit, passed))
+        return results, variables
+
+
+def simulated_measurements(analyzer, duts, seed=353):
+    """
+    Returns:
+        dict: Random inputs of a test for the DUTs around 1, trim sweeps linear in the code around the typical value.
+    """
+    rng = np.random.default_rng(seed)
+    measurements = {}
+    typical = pd.to_numeric(analyzer.limits[1], errors='coerce')
+    for variable, codes in analyzer.inputs().items():
+        if codes is None:
+            measurements[variable] = rng.normal(1.0, 0.1, duts)
+        else:
+            center = 1.0 if pd.isna(typical) else typical
+            steps = (np.arange(codes) - codes / 2) / codes
+            measurements[variable] = center * (1 + rng.normal(0, 0.1, (duts, 1)) + 0.5 * steps)
+    return measurements
+
+
+def main():
+    """
+    Main function to run tests over simulated DUTs and print their yield.
+    """
+    parser = argparse.ArgumentParser(description="Run the calculations and limit checks of tests over many DUTs at once.")
+    parser.add_argument("--excel_file", default="IVM6201_ATE_TM.xlsx", help="Path to the Excel file.")
+    parser.add_argument("--sheet_name", default="CP", help="Name of the sheet to read.")
+    parser.add_argument("--test_name", nargs='*', help="Tests to run, all tests of the sheet by default.")
+    parser.add_argument("--duts", type=int, default=10000, help="Number of simulated DUTs.")
+    args = parser.parse_args()
+
+    program = load_program(args.excel_file, [args.sheet_name, 'Procedure'])
+    raw_data = load_test_sheet(args.excel_file, args.sheet_name, program)
+    test_names = args.test_name or [test_name for test_name in raw_data.columns
+                                    if isinstance(test_name, str) and isinstance(raw_data.loc['Instructions', test_name], str)]
+    for test_name in test_names:
+        analyzer = BatchAnalyzer(args.excel_file, args.sheet_name, test_name, program)
+        measurements = simulated_measurements(analyzer, args.duts)
+        start = time.perf_counter()
+        results, _ = analyzer.run(measurements, args.duts)
+        elapsed = time.perf_counter() - start
+        for result in results:
+            checked = ~np.isnan(result.passed)
+            print(f"{test_name:30} {result.variable:30} {int(np.nansum(result.passed))}/{int(checked.sum())} passed "
+                  f"mean {np.nanmean(result.values):.4g}{result.unit}")
+        print(f"{test_name:30} {args.duts} DUTs in {elapsed * 1e3:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
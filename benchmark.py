@@ -0,0 +1,262 @@
+import argparse
+import ast
+import builtins
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+import warnings
+from collections import namedtuple
+import dft
+from dft import parse_calculate_expression, solve_formula
+from batch import BatchAnalyzer, simulated_measurements
+from bus_speed import SimulatedAdapter
+from test_analyzer import TestAnalyzer, load_test_sheet
+from workbook import load_program
+
+warnings.filterwarnings('ignore')
+
+EXCEL_FILE = 'IVM6201_ATE_TM.xlsx'
+SHEET_NAME = 'CP'
+CP_TESTS = ['NL_ron', 'PL_ron', 'NH_ron', 'PH_ron', 'CP_PGOOD', 'Startup_Current', 'IABSP2N', 'IABSN2P', 'IDISCHARGE', 'Vout_Functional']
+HISTORY_FILE = 'benchmarks.jsonl'
+# DUTs of the batch run
+BATCH_DUTS = 10000
+# a round lasts at least this long, fast benchmarks repeat their call within a round
+MIN_ROUND_TIME = 0.05
+ROUNDS = 5
+# a benchmark is reported as a regression when its median is this much slower than in the previous run
+REGRESSION_THRESHOLD = 1.2
+
+# the dft.py parsers run on every instruction line of the workbook
+PARSERS = [
+    'parse_register_notation', 'parse_wait_delay', 'parse_wait_until', 'parse_calculate_expression',
+    'parse_constant_value', 'parse_measurements', 'parse_savemeas', 'parse_read_instruction',
+    'parse_copy_instruction', 'parse_save_instruction', 'parse_restore_instruction', 'parse_force_instruction',
+    'parse_force_sweep_instruction', 'parse_trigger_instruction', 'parse_trim_instruction',
+    'parse_procedure_name', 'parse_meas_match_regex', 'parse_sweep_trig_store',
+]
+
+# times are per call in seconds
+BenchmarkResult = namedtuple('BenchmarkResult', ['name', 'min', 'median', 'mean', 'stddev', 'rounds', 'iterations'])
+# one benchmark: setup builds the arguments of function outside of the timing
+Benchmark = namedtuple('Benchmark', ['name', 'function', 'setup', 'rounds'], defaults=[None, ROUNDS])
+
+
+def run_benchmark(benchmark, min_round_time=MIN_ROUND_TIME, clock=time.perf_counter):
+    """
+    Times a benchmark over several rounds.
+
+    Without setup the number of calls per round is calibrated so that a round lasts at least
+    min_round_time. With setup every round is a single call on fresh arguments.
+
+    Args:
+        benchmark (Benchmark): The benchmark.
+        min_round_time (float): Minimum duration of a round in seconds.
+        clock (callable): Time source in seconds.
+
+    Returns:
+        BenchmarkResult: Time per call.
+    """
+    iterations = 1
+    if benchmark.setup is None:
+        while True:
+            start = clock()
+            for _ in range(iterations):
+                benchmark.function()
+            if clock() - start >= min_round_time:
+                break
+            iterations *= 2
+    times = []
+    for _ in range(benchmark.rounds):
+        args = benchmark.setup() if benchmark.setup else ()
+        start = clock()
+        for _ in range(iterations):
+            benchmark.function(*args)
+        times.append((clock() - start) / iterations)
+    return BenchmarkResult(benchmark.name, min(times), statistics.median(times), statistics.fmean(times),
+                           statistics.stdev(times) if len(times) > 1 else 0.0, benchmark.rounds, iterations)
+
+
+def instruction_corpus(excel_file=EXCEL_FILE):
+    """
+    Returns:
+        list: Every instruction line of the test sheets and procedures of the workbook.
+    """
+    instructions = []
+    for sheet_name, sheet in load_program(excel_file, header=None).sheets.items():
+        if sheet_name == 'Procedure':
+            cells = sheet.iloc[1:].to_numpy().ravel()
+        else:
+            rows = sheet[sheet.iloc[:, 0].astype(str).str.strip() == 'Instructions']
+            cells = rows.iloc[:, 1:].to_numpy().ravel()
+        for cell in cells:
+            if isinstance(cell, str):
+                instructions += [line.strip() for line in cell.split('\n') if line.strip()]
+    return instructions
+
+
+def formula_corpus(instructions):
+    """
+    Returns:
+        list: (formula, variables) of every Calculate instruction with a formula that evaluates,
+              the variables set to distinct values.
+    """
+    formulas = []
+    for instruction in instructions:
+        formula = (parse_calculate_expression(instruction) or {}).get('formula')
+        if not formula:
+            continue
+        try:
+            names = sorted({node.id for node in ast.walk(ast.parse(formula, mode='eval')) if isinstance(node, ast.Name)})
+            variables = {name: 1.0 + index for index, name in enumerate(names)}
+            solve_formula(formula, variables)
+        except Exception:
+            continue
+        formulas.append((formula, variables))
+    return formulas
+
+
+def parser_benchmark(name, instructions):
+    parse = getattr(dft, name)
+
+    def run():
+        for instruction in instructions:
+            parse(instruction)
+    return Benchmark(f'parse/{name}', run)
+
+
+def simulated_analyzers(excel_file, sheet_name, test_names):
+    """
+    Returns:
+        list: TestAnalyzer per test, on one simulated DUT without USB latency, the workbook read once.
+    """
+    dut = SimulatedAdapter(usb_latency=0).I2C_Slave(0x6C)
+    program = load_program(excel_file, [sheet_name, 'Procedure'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [TestAnalyzer(excel_file, sheet_name, test_name, dut=dut, program=program) for test_name in test_names]
+
+
+def run_analyzers(analyzers):
+    for analyzer in analyzers:
+        analyzer.analyze_test()
+
+
+def run_batch(batches):
+    for analyzer, measurements in batches:
+        analyzer.run(measurements, BATCH_DUTS)
+
+
+def build_benchmarks(excel_file=EXCEL_FILE, sheet_name=SHEET_NAME, test_names=CP_TESTS, full_runs=True):
+    """
+    Builds the suite from the workbook.
+
+    Returns:
+        list: Benchmark per parser, formula evaluation, limit check, workbook loading, batch and simulated run.
+    """
+    instructions = instruction_corpus(excel_file)
+    benchmarks = [parser_benchmark(name, instructions) for name in PARSERS]
+
+    formulas = formula_corpus(instructions)
+    benchmarks.append(Benchmark('solve_formula', lambda: [solve_formula(formula, variables) for formula, variables in formulas]))
+
+    limits_analyzer = simulated_analyzers(excel_file, sheet_name, test_names[:1])[0]
+    values = [0.5 * index for index in range(-10, 11)]
+    benchmarks.append(Benchmark('test_limits', lambda: [limits_analyzer.test_limits(value) for value in values]))
+
+    benchmarks.append(Benchmark('load/test_sheet', lambda: load_test_sheet(excel_file, sheet_name), rounds=3))
+    benchmarks.append(Benchmark('load/program', lambda: load_program(excel_file), rounds=3))
+    benchmarks.append(Benchmark('load/analyzers', lambda: simulated_analyzers(excel_file, sheet_name, test_names), rounds=1))
+    program = load_program(excel_file, [sheet_name, 'Procedure'])
+    batches = [(analyzer, simulated_measurements(analyzer, BATCH_DUTS))
+               for analyzer in (BatchAnalyzer(excel_file, sheet_name, test_name, program) for test_name in test_names)]
+    benchmarks.append(Benchmark(f'batch/{sheet_name}', lambda: run_batch(batches)))
+    if full_runs:
+        benchmarks.append(Benchmark(f'run/{sheet_name}', run_analyzers,
+                                    setup=lambda: (simulated_analyzers(excel_file, sheet_name, test_names),), rounds=3))
+    return benchmarks
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def load_history(path=HISTORY_FILE):
+    """
+    Returns:
+        list: The runs stored in the history, oldest first.
+    """
+    try:
+        with open(path) as file:
+            return [json.loads(line) for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def save_run(results, path=HISTORY_FILE):
+    """
+    Appends a run to the history, with its time, commit and host.
+    """
+    run = {'time': time.time(), 'commit': git_commit(), 'host': platform.node(),
+           'results': {result.name: result._asdict() for result in results}}
+    with open(path, 'a') as file:
+        file.write(json.dumps(run) + '\n')
+    return run
+
+
+def regressions(results, previous_run, threshold=REGRESSION_THRESHOLD):
+    """
+    Returns:
+        list: (name, previous median, median) of the benchmarks more than threshold times slower than in previous_run.
+    """
+    previous = (previous_run or {}).get('results', {})
+    return [(result.name, previous[result.name]['median'], result.median) for result in results
+            if result.name in previous and result.median > threshold * previous[result.name]['median']]
+
+
+def main():
+    """
+    Main function to run the benchmarks, store them in the history and compare them with the last run.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark parsing, formula evaluation, workbook loading and simulated test runs.")
+    parser.add_argument("--excel_file", default=EXCEL_FILE, help="Path to the Excel file.")
+    parser.add_argument("--sheet_name", default=SHEET_NAME, help="Sheet of the simulated run.")
+    parser.add_argument("--test_name", nargs='+', default=CP_TESTS, help="Tests of the simulated run.")
+    parser.add_argument("--filter", default='', help="Only run the benchmarks whose name contains this text.")
+    parser.add_argument("--no_runs", action='store_true', help="Skip the simulated test runs.")
+    parser.add_argument("--history", default=HISTORY_FILE, help="History file of the runs.")
+    parser.add_argument("--no_save", action='store_true', help="Do not store the results in the history.")
+    args = parser.parse_args()
+
+    # the simulated runs answer the operator prompts of forces and measures
+    builtins.input = lambda prompt='': '1'
+    benchmarks = [benchmark for benchmark in build_benchmarks(args.excel_file, args.sheet_name, args.test_name, not args.no_runs)
+                  if args.filter in benchmark.name]
+    # timings only compare on the same machine
+    previous_run = ([run for run in load_history(args.history) if run.get('host') == platform.node()] or [None])[-1]
+
+    results = []
+    for benchmark in benchmarks:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_benchmark(benchmark)
+        results.append(result)
+        print(f"{result.name:40} median {result.median * 1e3:10.3f}ms min {result.min * 1e3:10.3f}ms "
+              f"stddev {result.stddev * 1e3:8.3f}ms ({result.rounds}x{result.iterations})")
+
+    if previous_run:
+        slower = regressions(results, previous_run)
+        for name, before, after in slower:
+            print(f"!!!!! regression {name}: {before * 1e3:.3f}ms -> {after * 1e3:.3f}ms")
+        print(f"{len(slower)} regressions against {previous_run.get('commit') or 'the previous run'}")
+    if not args.no_save:
+        save_run(results, args.history)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import random
+import socket
+import time
+from collections import namedtuple
+import yaml
+from EasyMCP2221 import Device
+from EasyMCP2221.exceptions import NotAckError
+from recovery import RECOVERABLE_ERRORS
+from regmap import PAGE_SELECT_ADDRESS
+
+SPEED_CONFIG_FILE = 'ivm6201_config.yaml'
+# EasyMCP2221 accepts 47kHz to 400kHz
+SPEEDS = (50_000, 100_000, 200_000, 300_000, 400_000)
+DEFAULT_SPEED = 100_000
+# register accesses per speed, the page select register reads back what is written to it and is safe to rewrite
+BENCHMARK_COUNT = 200
+BENCHMARK_REGISTER = PAGE_SELECT_ADDRESS
+
+# speed in Hz, latencies in seconds per access, throughput in accesses per second,
+# errors counts failed transactions and read backs not matching the written value
+SpeedResult = namedtuple('SpeedResult', ['speed', 'read_latency', 'write_latency', 'throughput', 'errors'])
+
+
+class SimulatedAdapter:
+    """
+    Stand-in of the MCP2221 for benchmarks without hardware.
+
+    Every access costs usb_latency per USB command of the MCP2221 plus the bits on the wire
+    at the bus speed. Above max_speed the bus is not reliable and transactions fail with error_rate.
+    """
+
+    def __init__(self, usb_latency=0.5e-3, max_speed=400_000, error_rate=0.05, seed=0, sleep=time.sleep):
+        """
+        Args:
+            usb_latency (float): Time of one USB command (HID report out and back) in seconds.
+            max_speed (int): Fastest reliable bus speed in Hz.
+            error_rate (float): Fraction of failed transactions above max_speed.
+            seed (int): Seed of the error generator.
+            sleep (callable): Sleep function in seconds.
+        """
+        self.usb_latency = usb_latency
+        self.max_speed = max_speed
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.sleep = sleep
+        self.speed = DEFAULT_SPEED
+        self.registers = {}
+
+    def I2C_speed(self, speed=DEFAULT_SPEED):
+        self.speed = speed
+
+    def I2C_read(self, addr, size=1, *args, **kwargs):
+        self.transfer(commands=2, size=size)
+        return bytes(size)
+
+    def I2C_Slave(self, addr, speed=DEFAULT_SPEED, **kwargs):
+        self.I2C_speed(speed)
+        return SimulatedSlave(self, addr)
+
+    def transfer(self, commands, size):
+        # start, address byte, data bytes and stop, 9 clocks per byte with the acknowledge
+        self.sleep(commands * self.usb_latency + (9 * (size + 1) + 2) / self.speed)
+        if self.speed > self.max_speed and self.random.random() < self.error_rate:
+            raise NotAckError("I2C slave did not ACK (simulated)")
+
+
+class SimulatedSlave:
+    """
+    I2C slave of a SimulatedAdapter, its registers hold what is written to them.
+    """
+
+    def __init__(self, mcp, addr):
+        self.mcp = mcp
+        self.addr = addr
+
+    def read_register(self, register, length=1, *args, **kwargs):
+        # write of the register address without stop, read with restart, status poll
+        self.mcp.transfer(commands=3, size=1 + length)
+        return bytes(self.mcp.registers.get(register + offset, 0) for offset in range(length))
+
+    def write(self, data, *args, **kwargs):
+        self.mcp.transfer(commands=2, size=len(data))
+        for offset, byte in enumerate(data[1:]):
+            self.mcp.registers[data[0] + offset] = byte
+
+    def is_present(self):
+        try:
+            self.mcp.I2C_read(self.addr)
+            return True
+        except NotAckError:
+            return False
+
+
+def measure_speed(mcp, address, speed, register=BENCHMARK_REGISTER, count=BENCHMARK_COUNT, clock=time.perf_counter):
+    """
+    Measures register reads and writes at one bus speed.
+
+    Each access reads the register and writes the value back, so the DUT is left as it was.
+    A slave that cannot be opened at this speed counts every access as an error.
+
+    Args:
+        mcp: MCP2221 (EasyMCP2221 Device or SimulatedAdapter).
+        address (int): I2C address of the DUT.
+        speed (int): Bus speed in Hz.
+        register (int): Register read and rewritten.
+        count (int): Reads and writes to time.
+        clock (callable): Time source in seconds.
+
+    Returns:
+        SpeedResult: The measure.
+    """
+    try:
+        # opening the slave probes it, a NACK at this speed fails here
+        slave = mcp.I2C_Slave(address, speed=speed)
+    except RECOVERABLE_ERRORS:
+        return SpeedResult(speed, float('nan'), float('nan'), 0.0, count)
+    read_time = write_time = 0.0
+    errors = 0
+    value = None
+    for _ in range(count):
+        try:
+            start = clock()
+            data = slave.read_register(register)
+            read_time += clock() - start
+            if value is not None and data[0] != value:
+                errors += 1
+            value = data[0]
+            start = clock()
+            slave.write([register, value])
+            write_time += clock() - start
+        except RECOVERABLE_ERRORS:
+            errors += 1
+    total_time = read_time + write_time
+    return SpeedResult(speed, read_time / count, write_time / count,
+                       2 * count / total_time if total_time else float('inf'), errors)
+
+
+def benchmark_speeds(mcp, address, speeds=SPEEDS, register=BENCHMARK_REGISTER, count=BENCHMARK_COUNT):
+    """
+    Returns:
+        list: SpeedResult per speed, see measure_speed.
+    """
+    results = [measure_speed(mcp, address, speed, register, count) for speed in speeds]
+    # leave the bus at the default speed until the chosen one is configured
+    mcp.I2C_speed(DEFAULT_SPEED)
+    return results
+
+
+def fastest_reliable_speed(results):
+    """
+    Returns:
+        int: Speed of the best throughput without errors, DEFAULT_SPEED if every speed had errors.
+    """
+    reliable = [result for result in results if result.errors == 0]
+    if not reliable:
+        return DEFAULT_SPEED
+    return max(reliable, key=lambda result: (result.throughput, -result.speed)).speed
+
+
+def station_name():
+    return socket.gethostname()
+
+
+def configured_speed(station=None, path=SPEED_CONFIG_FILE):
+    """
+    Returns:
+        int: Bus speed stored for the station, DEFAULT_SPEED if there is none.
+    """
+    try:
+        with open(path) as file:
+            config = yaml.safe_load(file) or {}
+    except FileNotFoundError:
+        return DEFAULT_SPEED
+    return int((config.get('i2c_speed') or {}).get(station or station_name(), DEFAULT_SPEED))
+
+
+def save_speed(speed, station=None, path=SPEED_CONFIG_FILE):
+    """
+    Stores the bus speed of the station in the i2c_speed section of the configuration, other entries are kept.
+    """
+    try:
+        with open(path) as file:
+            config = yaml.safe_load(file) or {}
+    except FileNotFoundError:
+        config = {}
+    config.setdefault('i2c_speed', {})[station or station_name()] = int(speed)
+    with open(path, 'w') as file:
+        yaml.safe_dump(config, file, sort_keys=False)
+
+
+def main():
+    """
+    Main function to benchmark the bus speeds and configure the fastest reliable one.
+    """
+    # common reads the configured speed from this module, import it here to avoid the cycle
+    from common import ivm6201_config
+    parser = argparse.ArgumentParser(description="Benchmark register accesses at several I2C speeds and configure the fastest reliable one.")
+    parser.add_argument("--address", type=lambda text: int(text, 0), default=ivm6201_config.Address, help="I2C address of the DUT, the one of ivm6201.yaml by default.")
+    parser.add_argument("--speeds", type=int, nargs='+', default=list(SPEEDS), help="Bus speeds to measure in Hz.")
+    parser.add_argument("--count", type=int, default=BENCHMARK_COUNT, help="Reads and writes per speed.")
+    parser.add_argument("--station", default=None, help="Station name, the host name by default.")
+    parser.add_argument("--simulate", action='store_true', help="Use a simulated adapter even if an MCP2221 is present.")
+    parser.add_argument("--no_save", action='store_true', help=f"Do not store the chosen speed in {SPEED_CONFIG_FILE}.")
+    args = parser.parse_args()
+
+    mcp = None
+    if not args.simulate:
+        try:
+            mcp = Device(devnum=0)
+        except Exception as e:
+            print(f'!!!!!!!!!!!!!!!!!!!! fail :> MCP not present, using a simulated adapter ({e})')
+    mcp = mcp or SimulatedAdapter()
+
+    results = benchmark_speeds(mcp, args.address, args.speeds, count=args.count)
+    for result in results:
+        print(f"{result.speed / 1e3:6.0f}kHz read {result.read_latency * 1e3:7.3f}ms write {result.write_latency * 1e3:7.3f}ms "
+              f"{result.throughput:8.1f} accesses/s {result.errors} errors")
+    speed = fastest_reliable_speed(results)
+    station = args.station or station_name()
+    print(f"fastest reliable speed of {station}: {speed / 1e3:.0f}kHz")
+    if isinstance(mcp, SimulatedAdapter):
+        print("simulated adapter, the speed is not stored")
+    elif not args.no_save:
+        save_speed(speed, station)
+        print(f"stored in {SPEED_CONFIG_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ from EasyMCP2221 import Device
 from time import sleep
 from typing import Union
 import random 
+import weakref
+from regmap import PAGE_SELECT_ADDRESS, PAGE_SELECT_REGISTER
+from journal import Journal, JournalSlave, ReplaySlave
+from bus_speed import configured_speed
+from recovery import RecoveringSlave, I2CBusError, call_with_retries, retry_policy
 @ensure_annotations
 def read_yaml(path_to_yaml) -> ConfigBox:
     try:
@@ -24,6 +29,9 @@ def read_yaml(path_to_yaml) -> ConfigBox:
         raise e
     
 ivm6201_config = read_yaml('ivm6201.yaml').ivm6201
+i2c_retry_policy = retry_policy(ivm6201_config.get('I2C_recovery'))
+# bus speed of this station chosen by bus_speed.py
+i2c_speed = configured_speed()
 def ivm6201_pin_check(pin='', pins=list(ivm6201_config.pins.values()) ):
     if pin:
         return pin.lower() in ''.join(pins).lower()
@@ -31,6 +39,10 @@ def ivm6201_pin_check(pin='', pins=list(ivm6201_config.pins.values()) ):
         return None
     # return pin in pins
 
+def ivm6201_supply_check(pin=''):
+    # supplies of ivm6201.yaml, read at every call as a session reloads the configuration
+    return bool(pin) and pin.upper() in {supply.upper() for supply in ivm6201_config.get('supplies', [])}
+
 def get_device(deviceNo=0):
     if device := Device(devnum=deviceNo):
         return device
@@ -38,27 +50,108 @@ def get_device(deviceNo=0):
         print(f'!!!!!!!!!!!!!!!!!!!! fail :> MCP not presetn ')
         return None
 
-def get_slave(device: Device,address=ivm6201_config.Address):
+def get_slave(device: Device,address=ivm6201_config.Address,journal=None,policy=None):
+    # with a journal (journal.Journal) every transaction of the slave is recorded
+    # failed transactions are retried as set by policy (recovery.RetryPolicy), I2C_recovery of ivm6201.yaml by default
+    policy = policy or i2c_retry_policy
     try:
-        if device.I2C_read(address):
-            sleep(0.01)
-            return device.I2C_Slave(address)
-        else:
-            print(f'!!!!!!!!!!!!!!! fail:> slave not present with address {address}')
-            return None
-    except EasyMCP2221.exceptions.NotAckError:
-        print(f'!!!!!!!!!!!!!!! fail:> slave not present with address {address}')
+        call_with_retries(lambda: device.I2C_read(address), policy)
+        sleep(0.01)
+        # opening the slave probes it, a NACK there is retried like any transaction
+        recovering = RecoveringSlave(call_with_retries(lambda: device.I2C_Slave(address, speed=i2c_speed), policy), policy)
+        slave = JournalSlave(recovering, journal) if journal else recovering
+        # a bus reset may come with a DUT reset, forget what we know of its page and registers
+        # they are cached for the slave the tests use, the outer one
+        recovering.on_reset = lambda: (I2C_forget_page(slave), I2C_forget_shadow(slave))
+        return slave
+    except I2CBusError as e:
+        print(f'!!!!!!!!!!!!!!! fail:> slave not present with address {address} {e}')
+        return None
+
+def open_dut(journal=None, replay=None, address=None):
+    # DUT of a program run: played back from the journal file replay without hardware, or the slave
+    # on the MCP2221 with its transactions recorded to the journal file journal when given
+    address = ivm6201_config.Address if address is None else address
+    if replay:
+        return ReplaySlave(replay, addr=address)
+    try:
+        device = get_device(deviceNo=0)
+    except RuntimeError as e:
+        print(f'!!!!!!!!!!!!!!!!!!!! fail :> MCP not present ({e})')
         return None
+    return get_slave(device=device, address=address, journal=Journal(journal) if journal else None)
+
+def I2C_recovery_counters(slave):
+    # transactions, errors, retries, bus resets, reprobes and failures of the slave
+    return dict(getattr(slave, 'counters', {})) if slave else {}
+
+# page last written to the page select register (0xFE) of each slave
+selected_pages = weakref.WeakKeyDictionary()
+
+def I2C_selected_page(slave):
+    return selected_pages.get(slave) if slave else None
+
+def I2C_forget_page(slave):
+    # call after anything that may change the page behind our back (reset, power cycle, bus error)
+    if slave:
+        selected_pages.pop(slave, None)
+
+# last value read from or written to the registers of each slave, keyed by (page, address)
+register_shadows = weakref.WeakKeyDictionary()
+
+def I2C_shadow(slave):
+    return register_shadows.setdefault(slave, {}) if slave else {}
+
+def I2C_forget_shadow(slave):
+    # call after anything that may change the registers behind our back (reset, power cycle)
+    if slave:
+        register_shadows.pop(slave, None)
+
+def _shadow_update(slave, register_addr, data):
+    # only registers of a known page can be shadowed, the page select register is tracked on its own
+    page = selected_pages.get(slave)
+    if page is None or register_addr == PAGE_SELECT_ADDRESS:
+        return
+    shadow = register_shadows.setdefault(slave, {})
+    for offset, byte in enumerate(data):
+        shadow[(page, register_addr + offset)] = byte
 
 def I2C_read_register(slave,register_addr:0x00):
     try:
         if slave:
-            return int.from_bytes(slave.read_register(register_addr),'little')
+            data = slave.read_register(register_addr)
+            _shadow_update(slave, register_addr, data)
+            return int.from_bytes(data,'little')
         else :
             return None
+    except I2CBusError:
+        raise
     except Exception as e:
         print(e)
 
+def I2C_read_register_burst(slave, register_addr:int, length:int):
+    # one transaction for length consecutive registers, the register address auto increments
+    try:
+        if slave:
+            data = bytearray(slave.read_register(register_addr, length))
+            _shadow_update(slave, register_addr, data)
+            return data
+        else :
+            return None
+    except I2CBusError:
+        raise
+    except Exception as e:
+        print(e)
+
+def I2C_write_register_burst(slave, register_addr:int, data:Union[bytes,bytearray,list]):
+    # one transaction for len(data) consecutive full registers, no read-modify-write
+    if slave:
+        slave.write([register_addr, *data])
+        _shadow_update(slave, register_addr, data)
+        return len(data)
+    else:
+        return None
+
         
 def I2C_read_register_bits(slave,register_addr:Union[int,hex],msb:int,lsb: int):
     try:
@@ -68,12 +161,16 @@ def I2C_read_register_bits(slave,register_addr:Union[int,hex],msb:int,lsb: int):
             lsb = msb-8 if lsb >=8 else lsb
             bit_width = 2**(msb - lsb+1)
             mask = ((bit_width-1) << lsb)
-            device_data = int.from_bytes(slave.read_register(register_addr),'little')
+            data = slave.read_register(register_addr)
+            _shadow_update(slave, register_addr, data)
+            device_data = int.from_bytes(data,'little')
             # print(f' register read full {hex(register_addr)} {hex(device_test)}')
             device_bitmodified_data = (device_data & mask) >> lsb
             return device_bitmodified_data
         else :
             return None
+    except I2CBusError:
+        raise
     except Exception as e:
         print(e)
         
@@ -82,6 +179,10 @@ def I2C_write_register(slave,register:dict,value:Union[int,float],*args,**kwargs
         register_addr = register.get('address')
         msb = register.get('msb')
         lsb = register.get('lsb')
+        # skip page selects of the page the slave is already on
+        is_page_select = register_addr == PAGE_SELECT_ADDRESS and lsb == 0
+        if is_page_select and selected_pages.get(slave) == int(value):
+            return int(value)
         print(register,value)
         # check if the lsb and msb mentioned in absolute bit postion 
         msb = msb-8 if msb >=8 else msb
@@ -92,6 +193,8 @@ def I2C_write_register(slave,register:dict,value:Union[int,float],*args,**kwargs
         mask = ~((bit_width-1) << lsb)
         device_data = (device_data & mask) | ((int(value)) << lsb) # modify the data
         slave.write([register_addr,device_data])
+        if is_page_select:
+            selected_pages[slave] = int(value)
         device_data = I2C_read_register(slave=slave,register_addr=register_addr) # read dat back to confirm writing
         # print(f'data read {register_addr} ({hex(register_addr)})',hex(device_data))
         return device_data
@@ -144,6 +247,47 @@ def I2C_write_multiple_registers(slave, registers:[],value=Union[int|float]):
         else : return None
     else:
         return None
+def group_register_writes_by_page(writes:list, current_page=None):
+    """
+    Reorders a block of register writes so the writes of each page are done together,
+    with a single page select in front of each page.
+
+    The page of a write is its register 'page' entry, or else the page selected by the
+    last 0xFE write before it in the block. The explicit 0xFE writes of the block are
+    dropped and replaced by the ones needed. Writes keep their order within a page, so
+    only use it on blocks where the order between pages does not matter.
+
+    Args:
+        writes (list): (register, value) pairs.
+        current_page (int, optional): Page the slave is on before the block, None if unknown.
+
+    Returns:
+        list: The reordered (register, value) pairs, page selects included.
+    """
+    page = current_page
+    page_writes = {}
+    for register, value in writes:
+        if register.get('address') == PAGE_SELECT_ADDRESS:
+            page = int(value)
+            continue
+        register_page = register.get('page')
+        page_writes.setdefault(page if register_page is None else register_page, []).append((register, value))
+
+    # stay on the current page first, writes of unknown page can only go there
+    grouped_writes = page_writes.pop(current_page, [])
+    for page, writes_of_page in page_writes.items():
+        grouped_writes.append((PAGE_SELECT_REGISTER, page))
+        grouped_writes.extend(writes_of_page)
+    return grouped_writes
+
+def I2C_write_register_block(slave, writes:list, group_by_page=True):
+    if slave:
+        if group_by_page:
+            writes = group_register_writes_by_page(writes, current_page=I2C_selected_page(slave))
+        return [I2C_write_register(slave=slave, register=register, value=value) for register, value in writes]
+    else:
+        return None
+
 def device_test():
         # Connect to MCP2221
     mcp = EasyMCP2221.Device()
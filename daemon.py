@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+from common import (
+    I2C_read_register_burst, I2C_write_register, I2C_write_multiple_registers, I2C_read_multiple_registers,
+    I2C_selected_page, I2C_shadow, I2C_recovery_counters,
+)
+from regdump import dump_registers
+from regmap import resolve_symbol, PAGE_SELECT_REGISTER
+from session import Session
+
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'ivm6201.sock')
+# Python on Windows has no AF_UNIX sockets, the daemon listens on the loopback interface there
+TCP_ADDRESS = ('127.0.0.1', 6201)
+
+# request: op, payload length, JSON payload; response: status, payload length, JSON payload
+_FRAME = struct.Struct('<BI')
+# symbol is a register map name, 'Register_name' or 'Register_name.field_name'
+READ = 1  # {"address": int, "length": int, "page": int} or {"symbol": str}
+WRITE = 2  # {"symbol": str, "value": int} or {"address": int, "msb": int, "lsb": int, "value": int, "page": int}
+RUN = 3  # {"tests": [str]}
+DUMP = 4  # {"pages": [int]}
+STATUS = 5  # {}
+RESET = 6  # {}
+SHUTDOWN = 7  # {}
+OP_NAMES = {READ: 'read', WRITE: 'write', RUN: 'run', DUMP: 'dump', STATUS: 'status', RESET: 'reset', SHUTDOWN: 'shutdown'}
+
+OK = 0
+ERROR = 1
+
+
+class DaemonError(Exception):
+    """
+    Raised by the client when the daemon could not serve a request.
+    """
+
+
+def _send(sock, code, payload):
+    data = json.dumps(payload, separators=(',', ':')).encode()
+    sock.sendall(_FRAME.pack(code, len(data)) + data)
+
+
+def _receive_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def _receive(sock):
+    # (code, payload), None when the peer closed the connection
+    if (header := _receive_exactly(sock, _FRAME.size)) is None:
+        return None
+    code, length = _FRAME.unpack(header)
+    data = _receive_exactly(sock, length) if length else b'null'
+    if data is None:
+        return None
+    return code, json.loads(data)
+
+
+def _registers(request):
+    # register dictionaries of a request, symbolic or by address
+    if (symbol := request.get('symbol')):
+        if (field := resolve_symbol(symbol)) is None:
+            raise ValueError(f"{symbol} is not in the register map")
+        return [{'address': field.address, 'msb': field.msb, 'lsb': field.lsb, 'page': field.page}]
+    register = {'address': int(request['address']), 'msb': int(request.get('msb', 7)), 'lsb': int(request.get('lsb', 0))}
+    if request.get('page') is not None:
+        register['page'] = int(request['page'])
+    return [register]
+
+
+def _select_page(slave, registers):
+    pages = {register['page'] for register in registers if register.get('page') is not None}
+    if len(pages) == 1 and (page := pages.pop()) != I2C_selected_page(slave):
+        I2C_write_register(slave, PAGE_SELECT_REGISTER, page)
+
+
+class TcpDutDaemon(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class UnixDutDaemon(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while (request := _receive(self.request)) is not None:
+            op, payload = request
+            try:
+                with self.server.lock:
+                    result = dispatch(self.server.session, op, payload or {})
+                _send(self.request, OK, result)
+            except Exception as e:
+                _send(self.request, ERROR, f"{OP_NAMES.get(op, op)}: {e!r}")
+            if op == SHUTDOWN:
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+def serve(session, address=None):
+    """
+    Creates the daemon of a session, call serve_forever() on it.
+
+    Args:
+        session (session.Session): The open DUT session.
+        address (str or tuple, optional): Socket path, or (host, port) for TCP. SOCKET_PATH, or TCP_ADDRESS without AF_UNIX.
+
+    Returns:
+        socketserver.BaseServer: The daemon, it serves every client in its own thread, one request at a time on the DUT.
+    """
+    address = address or (SOCKET_PATH if hasattr(socket, 'AF_UNIX') else TCP_ADDRESS)
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.unlink(address)  # left by a daemon that did not shut down
+        server = UnixDutDaemon(address, _RequestHandler)
+    else:
+        server = TcpDutDaemon(address, _RequestHandler)
+    server.session = session
+    server.lock = threading.Lock()
+    return server
+
+
+def dispatch(session, op, request):
+    """
+    Runs a request on the session.
+
+    Returns:
+        JSON serializable result of the request.
+    """
+    slave = session.dut
+    if op == READ:
+        if 'symbol' in request:
+            registers = _registers(request)
+            _select_page(slave, registers)
+            return I2C_read_multiple_registers(slave, registers)
+        _select_page(slave, _registers(request))
+        data = I2C_read_register_burst(slave, int(request['address']), int(request.get('length', 1)))
+        return list(data) if data is not None else None
+    if op == WRITE:
+        registers = _registers(request)
+        _select_page(slave, registers)
+        # the tests of the session must not drop their writes to these registers
+        session.setup_state.forget(I2C_selected_page(slave), registers)
+        return I2C_write_multiple_registers(slave, registers, int(request['value']))
+    if op == RUN:
+        results = []
+        session.reload()
+        session.run(request.get('tests', []), record_result=lambda *result: results.append(result))
+        return [[test, value, low, high, unit, passed] for test, value, low, high, unit, passed, *_ in results]
+    if op == DUMP:
+        dump = dump_registers(slave, request.get('pages'))
+        return [[page, address, byte] for (page, address), byte in sorted((dump or {}).items())]
+    if op == STATUS:
+        return {'page': I2C_selected_page(slave), 'shadowed_registers': len(I2C_shadow(slave)),
+                'tests': list(session.test_names), 'i2c': I2C_recovery_counters(slave)}
+    if op == RESET:
+        session.reset()
+        return None
+    if op == SHUTDOWN:
+        return None
+    raise ValueError(f"unknown op {op}")
+
+
+class DutClient:
+    """
+    Client of a running daemon, the DUT session is shared with every other client.
+    """
+
+    def __init__(self, address=None, timeout=None):
+        """
+        Args:
+            address (str or tuple, optional): Socket path, or (host, port) for TCP, as given to serve().
+            timeout (float, optional): Timeout of a request in seconds, test runs can take long.
+        """
+        address = address or (SOCKET_PATH if hasattr(socket, 'AF_UNIX') else TCP_ADDRESS)
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def request(self, op, **payload):
+        _send(self.sock, op, payload)
+        if (response := _receive(self.sock)) is None:
+            raise DaemonError("daemon closed the connection")
+        status, result = response
+        if status != OK:
+            raise DaemonError(result)
+        return result
+
+    def read_register(self, address, length=1, page=None):
+        """
+        Returns:
+            list: length register bytes from address, on page if given.
+        """
+        return self.request(READ, address=address, length=length, page=page)
+
+    def read(self, symbol):
+        """
+        Returns:
+            int: Value of a symbolic register or field, 'Register_name' or 'Register_name.field_name'.
+        """
+        return self.request(READ, symbol=symbol)
+
+    def write(self, symbol, value):
+        return self.request(WRITE, symbol=symbol, value=value)
+
+    def write_register(self, address, value, msb=7, lsb=0, page=None):
+        return self.request(WRITE, address=address, msb=msb, lsb=lsb, value=value, page=page)
+
+    def run(self, tests):
+        """
+        Returns:
+            list: (test, value, low, high, unit, passed) of every limit checked value.
+        """
+        return [tuple(result) for result in self.request(RUN, tests=list(tests))]
+
+    def dump(self, pages=None):
+        """
+        Returns:
+            dict: (page, address) -> register byte, as regdump.dump_registers.
+        """
+        return {(page, address): byte for page, address, byte in self.request(DUMP, pages=pages)}
+
+    def status(self):
+        return self.request(STATUS)
+
+    def reset(self):
+        return self.request(RESET)
+
+    def shutdown(self):
+        return self.request(SHUTDOWN)
+
+
+def main():
+    """
+    Main function to open a DUT session and serve it until a client shuts it down.
+    """
+    parser = argparse.ArgumentParser(description="Serve a DUT session to local clients.")
+    parser.add_argument("--excel_file", default="IVM6201_ATE_TM.xlsx", help="Path to the Excel file.")
+    parser.add_argument("--sheet_name", default="CP", help="Name of the sheet to read.")
+    parser.add_argument("--socket", default=None, help=f"Socket path, {SOCKET_PATH} by default.")
+    parser.add_argument("--port", type=int, default=None, help="Listen on this loopback TCP port instead of a socket path.")
+    parser.add_argument("--simulate", action='store_true', help="Run on a simulated DUT.")
+    parser.add_argument("--journal", help="Record the I2C transactions to this journal file.")
+    parser.add_argument("--replay", help="Replay the I2C transactions of this journal file, without hardware.")
+    args = parser.parse_args()
+
+    session = Session(args.excel_file, args.sheet_name, simulate=args.simulate, journal=args.journal, replay=args.replay)
+    address = (TCP_ADDRESS[0], args.port) if args.port else args.socket
+    with serve(session, address) as server:
+        print(f'serving the DUT on {server.server_address}')
+        server.serve_forever()
+    if isinstance(server.server_address, str) and os.path.exists(server.server_address):
+        os.unlink(server.server_address)
+
+
+if __name__ == "__main__":
+    main()
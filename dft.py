@@ -1,4 +1,6 @@
 import re 
+from quantity import SI_PREFIXES, Unit, parse_quantity
+from regmap import parse_symbolic_register_notation
 
 def parse_register_notation(notation):
     # Regex pattern to match register addresses with optional bit fields
@@ -82,21 +84,49 @@ def parse_wait_delay(input_string):
         unit = match.group(2).lower()  # Convert to lowercase
         
         units = {
-            'm': {'name': 'milliseconds', 'multiplier': 10**-3},
-            'u': {'name': 'microseconds', 'multiplier': 10**-6},
-            'n': {'name': 'nanoseconds', 'multiplier': 10**-9}
+            'm': 'milliseconds',
+            'u': 'microseconds',
+            'n': 'nanoseconds'
         }
         
-        unit_info = units[unit]
-        
         delay = {
             "value": value,
-            "unit": unit_info['name'],
-            "absValue": value * unit_info['multiplier']
+            "unit": units[unit],
+            "absValue": parse_quantity(f'{match.group(1)}{unit}s').value
         }
     
     return delay
 
+def parse_wait_until(input_string):
+    """
+    Parse Wait__until__<register>__<value>__<timeout> notation, like
+    'Wait__until__0x12[0:0]__1__10ms' or 'Wait__until__PGOOD_status.pgood__1__10ms'.
+
+    The register is written as in a hex or symbolic register write, several registers
+    can be chained MSB first, the value is hexadecimal.
+
+    Args:
+        input_string (str): Input notation string
+
+    Returns:
+        dict: {'registers': [...], 'value': int, 'timeout': float (seconds)}, empty if no match.
+    """
+    input_string = re.sub(r'\s*"[^"]*"', '', input_string).strip() # remove comments from instruction
+    match = re.match(r'^Wait__until__(.+)__([^_\s]+)$', input_string)
+    if not match:
+        return {}
+    timeout = parse_quantity(match.group(2))
+    if timeout is None or timeout.unit not in (Unit.SECOND, Unit.NONE):
+        return {}
+    register_data = parse_register_notation(match.group(1)) or parse_symbolic_register_notation(match.group(1))
+    if not register_data:
+        return {}
+    return {
+        'registers': register_data['registers'],
+        'value': register_data['value'],
+        'timeout': timeout.value
+    }
+
 def parse_calculate_expression(input_string):
     """
     Parse Calculate__<operation>[__<calculate_variable>] notation.
@@ -150,33 +180,16 @@ def parse_constant_value(input_string):
     Returns:
         dict or None: Dictionary with parsed components, or None if parsing fails.
     """
-    pattern = r"^Const__([a-zA-Z0-9_]+)=\s*([-+]?\d*\.?\d+)([mupkMVAHzOhmdegC]+)\s*(?:\"[^\"]*\" *)?$"
+    pattern = r"^Const__([a-zA-Z0-9_]+)=\s*([-+]?\d*\.?\d+)([pnumkKMGVAHzOhmdegC]+)\s*(?:\"[^\"]*\" *)?$"
     match = re.match(pattern, input_string)
 
     if match:
-        name = match.group(1)
-        value = float(match.group(2))
-        unit_str = match.group(3)
-
-        multiplier_map = {
-            'm': 1e-3, 'u': 1e-6, 'p': 1e-12,
-            'k': 1e3, 'K': 1e3, 'M': 1e6
-        }
-        unit_type_map = {
-            'A': 'current', 'V': 'voltage',
-            'Ohm': 'resistance', 'Hz': 'frequency'
-        }
-
-        multiplier = multiplier_map.get(unit_str[0], 1.0)  # Get multiplier, default to 1
-        unit = unit_str[1:] if len(unit_str) > 1 else unit_str #remove the first chararacter
-        calculated_value = value * multiplier
-
-        unit_type = unit_type_map.get(unit, 'unknown')
-
+        # a suffix that is not a unit ('32C') leaves the value as written
+        quantity = parse_quantity(match.group(2) + match.group(3)) or parse_quantity(match.group(2))
         return {
-            name: calculated_value,
-            'unit': unit_type,
-            'multiplier': multiplier
+            match.group(1): quantity.value,
+            'unit': quantity.unit.kind,
+            'multiplier': quantity.multiplier
         }
     else:
         return None
@@ -465,7 +478,7 @@ def parse_force_instruction(input_string):
         dict: A dictionary containing the parsed information.
     """
     # Updated regex to capture primary and secondary signals, values, and other details
-    regex = r'Force__([A-Za-z0-9_(.+?)]+)(?:__(.+?))?__(-?[\d.]+|OPEN|CLOSE)([KMmunp])?([VAHz])?(?:\s*"([^"]*)")?'
+    regex = r'Force__([A-Za-z0-9_(.+?)]+)(?:__(.+?))?__(-?[\d.]+|OPEN|CLOSE)([pnumkKMG])?(Hz|[VA])?(?:\s*"([^"]*)")?'
 
     match = re.match(regex, input_string, re.IGNORECASE) #Using match instead of findall
     if match:
@@ -484,16 +497,6 @@ def parse_force_instruction(input_string):
         if secondary_signal_part and (re.match(r'^[A-Za-z0-9_\+\-]+$', secondary_signal_part)): #Checking if the secondary Signal exist
           secondary_signal = secondary_signal_part
 
-        # Multiplier conversion dictionary
-        multipliers = {
-            'K': 10**3,   # Kilo
-            'M': 10**6,   # Mega
-            'm': 10**-3,  # Milli
-            'u': 10**-6,  # Micro
-            'n': 10**-9,  # Nano
-            'p': 10**-12  # Pico
-        }
-
         # Handle OPEN/CLOSE scenarios
         if value.upper() == 'OPEN':
             absolute_value = 'OPEN'
@@ -503,10 +506,9 @@ def parse_force_instruction(input_string):
             value = 'CLOSE'
         else:
             # Calculate absolute value for numeric inputs
-            try:
-              absolute_value = float(value) * multipliers.get(multiplier, 1)
-            except ValueError:
+            if (quantity := parse_quantity(value + multiplier)) is None:
               return {} # If it cannot convert the value, its an invalid input
+            absolute_value = quantity.value
 
         force_data = {
             "primary_signal": primary_signal,
@@ -536,27 +538,14 @@ def parse_force_sweep_instruction(text):
     """
     # Comprehensive regex pattern breakdown:
     # 1. Force__Sweep__: Literal instruction start
-    # 2. ([A-Za-z]+): Primary signal capture
-    # 3. (?:__([A-Za-z0-9\+]+))?: Optional reference signal (defaults to GND)
+    # 2. ([A-Za-z][A-Za-z0-9]*): Primary signal capture, pins like A5V hold digits
+    # 3. (?:__(?![-+]?\d)([A-Za-z0-9\+]+))?: Optional reference signal (defaults to GND), never a value
     # 4. Value patterns with optional multiplier prefixes
-    pattern = r'Force__Sweep__([A-Za-z]+)(?:__([A-Za-z0-9\+]+))?__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?[VAHz])__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?[VAHz])(?:__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?[VAHzS]))?(?:__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?[VAHzS]))?'
+    pattern = r'Force__Sweep__([A-Za-z][A-Za-z0-9]*)(?:__(?![-+]?\d)([A-Za-z0-9\+]+))?__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?(?:Hz|[VA]))__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?(?:Hz|[VA]))(?:__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?(?:Hz|[VAS])))?(?:__([-+]?\d+(?:\.\d+)?[KMGTmupnk]?(?:Hz|[VAS])))?'
 
     match = re.match(pattern, text)
 
     if match:
-        # Extended multiplier mapping with comprehensive prefixes
-        multipliers = {
-            'p': 1e-12,  # Pico
-            'n': 1e-9,   # Nano
-            'u': 1e-6,   # Micro
-            'm': 1e-3,   # Milli
-            'k': 1e3,    # Kilo
-            'K': 1e3,    # Alternative Kilo
-            'M': 1e6,    # Mega
-            'G': 1e9,    # Giga
-            'T': 1e12    # Tera
-        }
-
         def parse_value_with_multiplier(value):
             """
             Parse numeric value with multiplier and unit
@@ -570,27 +559,17 @@ def parse_force_sweep_instruction(text):
             if not value:
                 return None
 
-            # Advanced regex-based parsing
-            numeric_match = re.match(r'([-+]?\d+(?:\.\d+)?)', value)  # Allow negative numbers
-            multiplier_match = re.search(r'[KMGTmupnk]', value)
-            unit_match = re.search(r'[VAHzS]', value)
-
-            if not (numeric_match and unit_match):
+            quantity = parse_quantity(value)
+            if quantity is None or quantity.unit is Unit.NONE:
                 return None
 
-            numeric_value = float(numeric_match.group(1))
-            multiplier_prefix = multiplier_match.group(0) if multiplier_match else ''
-            unit = unit_match.group(0)
-
-            # Determine multiplier with fallback
-            multiplier = multipliers.get(multiplier_prefix, 1)
-
             return {
-                'raw_value': numeric_value,
-                'multiplier': multiplier,
-                'unit': unit,
-                'final_value': numeric_value * multiplier,
-                'multiplier_prefix': multiplier_prefix
+                'raw_value': quantity.raw_value,
+                'multiplier': quantity.multiplier,
+                'unit': quantity.unit.value,
+                'final_value': quantity.value,
+                'multiplier_prefix': quantity.prefix,
+                'quantity': quantity
             }
 
         # Extract and parse instruction components
@@ -624,13 +603,14 @@ def parse_trigger_instruction(text):
         dict: Parsed trigger details
     """
     # Regex pattern to match Trigger instruction
-    pattern = r'Trigger__([A-Z]+)(?:__(\d+))?'
+    pattern = r'Trigger__([A-Z]+)(?:__(\d+))?(?:__([A-Za-z0-9_\+\-]+))?'
     
     match = re.match(pattern, text)
     
     if match:
         action = match.group(1)
         value = int(match.group(2)) if match.group(2) else None
+        signal = match.group(3)
         
         # Define action-specific details
         trigger_map = {
@@ -650,7 +630,10 @@ def parse_trigger_instruction(text):
             }
         }
         
-        return trigger_map.get(action, {})
+        trigger = trigger_map.get(action, {})
+        if trigger:
+            trigger['signal'] = signal  # Trigger signal, None if not given
+        return trigger
     
     return {}
 
@@ -739,43 +722,101 @@ def parse_multiplier_value(input_value):
     Returns:
         float or str: Calculated value or original input
     """
-    # If input is already int or float
+    # If input is already int or float, the sheet holds it in base units
     if isinstance(input_value, (int, float)):
-        # If value is above 1000, divide by 1000
-        return float(input_value / 1000 if input_value > 1000 else input_value)
+        return float(input_value)
     
     # If input is not a string, return as-is
     if not isinstance(input_value, str):
         return input_value
     
-    # Multiplier mapping
-    multiplier_map = {
-        'm': 1e-3,   # mili
-        'u': 1e-6,   # micro
-        'p': 1e-12,  # pico
-        'K': 1e3,    # kilo
-        'M': 1e6,    # mega
-        'G': 1e9     # Giga
-    }
-    
-    # Regular expression to extract number and multiplier
-    match = re.match(r'^(\d*\.?\d+)([mpuKM])$', input_value)  # Modified regex
-    
-    if match:
-        try:
-            number = float(match.group(1))
-            multiplier = match.group(2)
-            
-            # Calculate final value
-            final_value = number * multiplier_map.get(multiplier, 1)
-            
-            return final_value
-        except ValueError:
-            return input_value
+    # Number with optional multiplier and unit, like '0.6u' or '10mV'
+    if (quantity := parse_quantity(input_value)) is not None:
+        return quantity.value
     
     # If string doesn't match pattern, return original string
     return input_value
 
+import pandas as pd
+
+# '0.6u', '-10', '24M', '300mV', '1e-3'; '2.4/2.8' or 'HL= 3.3' do not match
+LIMIT_PATTERN = r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([pnuμmkKMGT]?)([A-Za-zΩ]*)\s*$'
+LIMIT_ROWS = ['Typ', 'Min', 'Max']
+
+
+def parse_limit_values(values):
+    """
+    Parse limit cells, a whole row or sheet at once.
+
+    Numbers are kept as they are, strings are split into number, SI prefix and unit.
+
+    Args:
+        values (pandas.Series): Limit cells, numbers or strings.
+
+    Returns:
+        pandas.DataFrame: Same index as values, with 'value' (float64, NaN where the cell
+                          is not a limit) and 'unit' (unit written after the number, '' if none).
+    """
+    values = pd.Series(values)
+    numeric = pd.to_numeric(values.where(values.map(type) != str), errors='coerce').astype('float64')
+    parts = values.where(values.map(type) == str).str.extract(LIMIT_PATTERN)
+    scaled = parts[0].astype('float64') * parts[1].map(SI_PREFIXES).astype('float64')
+    return pd.DataFrame({
+        'value': numeric.fillna(scaled),
+        'unit': parts[2].fillna('')
+    }, index=values.index)
+
+
+def parse_limit_rows(raw_data, rows=LIMIT_ROWS):
+    """
+    Replaces the limit rows of a test sheet by their values, in place.
+
+    Cells that are not a single limit, like 'HL= 3\nLH= 3.3', are left as they are.
+
+    Args:
+        raw_data (pandas.DataFrame): Test sheet indexed by parameter row.
+        rows (list): Limit rows to parse.
+
+    Returns:
+        pandas.DataFrame: raw_data.
+    """
+    rows = [row for row in rows if row in raw_data.index]
+    cells = raw_data.loc[rows]
+    if (stacked := cells.stack()).empty:
+        return raw_data
+    values = parse_limit_values(stacked)['value'].unstack().reindex(index=rows, columns=cells.columns)
+    raw_data.loc[rows] = cells.mask(values.notna(), values)
+    return raw_data
+
+
+def sheet_limits(raw_data):
+    """
+    Typed limits of every test of a sheet.
+
+    Args:
+        raw_data (pandas.DataFrame): Test sheet indexed by parameter row.
+
+    Returns:
+        pandas.DataFrame: One row per test with 'Min', 'Typ', 'Max' (float64, NaN if not a single
+                          value) and 'Unit', from the Unit row or else the unit written in the limits.
+    """
+    index = pd.Series(raw_data.index, index=raw_data.index).astype(str).str.strip()
+    rows = [row for row in LIMIT_ROWS if row in index.values]
+    cells = raw_data.loc[index.index[index.isin(rows)]]
+    cells.index = index[index.isin(rows)].values
+    parsed = parse_limit_values(cells.stack())
+    if parsed.empty:
+        parsed = pd.DataFrame({'value': pd.Series(dtype='float64'), 'unit': pd.Series(dtype=str)},
+                              index=pd.MultiIndex.from_arrays([[], []]))
+    limits = parsed['value'].unstack(0).reindex(index=raw_data.columns, columns=['Min', 'Typ', 'Max'])
+    written_units = parsed['unit'].replace('', pd.NA).groupby(level=1).first()
+    unit_rows = index.index[index == 'Unit']
+    units = raw_data.loc[unit_rows[0]] if len(unit_rows) else pd.Series(pd.NA, index=raw_data.columns)
+    units = units.where(units.map(type) == str).str.strip().replace('', pd.NA)
+    limits['Unit'] = units.fillna(written_units.reindex(raw_data.columns)).fillna('')
+    return limits
+
+
 def parse_meas_match_regex(input_string):
     """
     Parse Meas__Match__ instruction.
@@ -794,38 +835,18 @@ def parse_meas_match_regex(input_string):
         unit = match.group(1)  # e.g., Current, Voltage
         primary_signal = match.group(2)  # e.g., SDWN, Vbat
         secondary_signal = match.group(3) if match.group(3) else 'GND'  # Default to GND
-        value = float(match.group(4))
-        unit_str = match.group(5)
-
-        multiplier_map = {
-            'm': 1e-3, 'u': 1e-6, 'p': 1e-12,
-            'k': 1e3, 'K': 1e3, 'M': 1e6, 'n': 1e-9
-        }
-        unit_type_map = {
-            'A': 'Current', 'V': 'Voltage',
-            'Ohm': 'Resistance', 'Hz': 'Frequency'
-        }
+        quantity = parse_quantity(match.group(4) + match.group(5))
 
-        multiplier = multiplier_map.get(unit_str[0], 1.0)  # Get multiplier, default to 1
-        calculated_value = value * multiplier
-
-        unit_name = unit_type_map.get(unit_str[-1], unit) #takes the right most character from unit_str to assign it a name
-        # Verify the units match
-        unit_check = (
-            (unit.lower() == "current" and unit_str[-1] == "A") or
-            (unit.lower() == "voltage" and unit_str[-1] == "V") or
-            (unit.lower() == "resistance" and unit_str[-1] in ["m","u","p","k","M","O","h","m"]) or
-            (unit.lower() == "frequency" and unit_str[-1] == "z")
-        )
-
-        if not unit_check:
+        # Verify the units match, resistances may be written without 'Ohm' ('10k')
+        if quantity is None or (quantity.unit.kind != unit.lower() and
+                                not (unit.lower() == 'resistance' and quantity.unit is Unit.NONE)):
             return None
 
         return {
-            'unit': unit_name,
+            'unit': unit.capitalize(),
             'primary_signal': primary_signal,
             'secondary_signal': secondary_signal,
-            'value': calculated_value
+            'value': quantity.value
         }
     else:
         return None
@@ -837,9 +858,9 @@ def parse_sweep_trig_store(text):
     Sweep__Trig__Store___                             # Start:  Sweep__Trig__Store___
     Sweep__Signal__([A-Za-z0-9\_\+\-]+)__                 # Sweep Signal: Capture alphanumeric + underscore
     Sweeper__Reference__([A-Za-z0-9\_\+\-]+)__           # Sweeper Reference: Capture alphanumeric + underscore
-    ([-+]?\d+(?:\.\d+)?[KMGTmunp]?[VAHzOhm]?)__       # Initial Value
-    ([-+]?\d+(?:\.\d+)?[KMGTmunp]?[VAHzOhm]?)__       # Final Value
-    ([-+]?\d+(?:\.\d+)?[KMGTmunp]?[VAHzOhm]?)?(?:__([-+]?\d+(?:\.\d+)?[KMGTmunp]?[VAHzSOhm]?))?___       # Step Size and Sweep Time (optional)
+    ([-+]?\d+(?:\.\d+)?[KMGTkmunp]?(?:Ohm|Hz|[VA])?)__       # Initial Value
+    ([-+]?\d+(?:\.\d+)?[KMGTkmunp]?(?:Ohm|Hz|[VA])?)__       # Final Value
+    ([-+]?\d+(?:\.\d+)?[KMGTkmunp]?(?:Ohm|Hz|[VA])?)?(?:__([-+]?\d+(?:\.\d+)?[KMGTkmunp]?(?:Ohm|Hz|[VAS])?))?___       # Step Size and Sweep Time (optional)
     Trig__Signal__([A-Za-z0-9\_\+\-]+)__                # Trig Signal
     Trig__Reference__([A-Za-z0-9\_\+\-]+)__           # Trig reference: Capture alphanumeric + underscore
     TrigState__([A-Za-z0-9_]+)___                  # Trig State
@@ -870,31 +891,9 @@ def parse_sweep_trig_store(text):
 
         # Try to extract value and multiplier and the unit
         def extract_value_unit(value_str):
-            if value_str is None:
+            if value_str is None or (quantity := parse_quantity(value_str)) is None:
                 return (None, None, None)
-            unit_match = re.search(r"[VAHzOhm]$", value_str)  # Unit at the END
-            unit = unit_match.group(0) if unit_match else None
-            multiplier_match = re.search(r"[KMGTmunp]", value_str)
-            multiplier = multiplier_match.group(0) if multiplier_match else None
-            numeric_value_match = re.search(r"[-+]?\d+(?:\.\d+)?", value_str) #Get number string
-
-            numeric_value = safe_convert_to_float(numeric_value_match.group(0) if numeric_value_match else None)  # convert to float
-
-            #Helper method to map a numeric number based on unit.
-            multipliers = {
-                'K': 10**3,   # Kilo
-                'M': 10**6,   # Mega
-                'G': 10**9,   # Giga
-                'T': 10**12,  # Tera
-                'm': 10**-3,  # Milli
-                'u': 10**-6,  # Micro
-                'n': 10**-9,  # Nano
-                'p': 10**-12  # Pico
-            }
-            multiplier_value = multipliers.get(multiplier, 1) if multiplier else 1
-            numeric_value = numeric_value * multiplier_value if numeric_value else None #Map it again
-
-            return (numeric_value, unit, multiplier)
+            return (quantity.value, quantity.unit.value or None, quantity.prefix or None)
 
 
         # Extract values, units and multipliers
@@ -942,6 +941,7 @@ def parse_sweep_trig_store(text):
 
 import ast
 import operator
+from collections.abc import Mapping
 
 def solve_formula(formula_string, variables=None):
     """
@@ -949,7 +949,7 @@ def solve_formula(formula_string, variables=None):
 
     Args:
         formula_string: The mathematical formula as a string (e.g., "a + b * 2").
-        variables: A dictionary containing variable names and their values
+        variables: A mapping (dict or VariableStore) of variable names to their values
                    (e.g., {"a": 10, "b": 5}).  If None, no variables are used.
 
     Returns:
@@ -957,12 +957,12 @@ def solve_formula(formula_string, variables=None):
         Returns None if the formula is invalid or contains disallowed operations.
 
     Raises:
-        TypeError: If variables is not a dictionary.
+        TypeError: If variables is not a mapping.
         NameError: If a variable in the formula is not found in the variables dictionary.
     """
 
-    if variables is not None and not isinstance(variables, dict):
-        raise TypeError("Variables must be a dictionary.")
+    if variables is not None and not isinstance(variables, Mapping):
+        raise TypeError("Variables must be a mapping.")
 
     # Define allowed operators (safer than eval() directly)
     safe_operators = {
@@ -12,9 +12,7 @@ def rename_column_with_testname_data(file_path:str,sheet_name:str):
         raw_data.iloc[2,1] = 'Parameter'
         raw_data.columns = [ x.strip().replace(' ', '_') if isinstance(x, str) else x for x in raw_data.iloc[2].tolist()]
         raw_data.set_index('Parameter', inplace=True)
-        raw_data.loc['Typ'] = raw_data.loc['Typ'].apply(lambda x : parse_multiplier_value(x))
-        raw_data.loc['Min'] = raw_data.loc['Min'].apply(lambda x : parse_multiplier_value(x))
-        raw_data.loc['Max'] = raw_data.loc['Max'].apply(lambda x : parse_multiplier_value(x))
+        parse_limit_rows(raw_data)
         # with pd.ExcelWriter(file_path, mode='a', if_sheet_exists='replace') as writer:
         #     # Write the new DataFrame to the specified sheet
         #     raw_data.to_excel(writer, sheet_name='Reference', index=False)
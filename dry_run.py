@@ -0,0 +1,355 @@
+import argparse
+import re
+import warnings
+import pandas as pd
+from dft import (
+    parse_procedure_name,
+    parse_wait_delay,
+    parse_wait_until,
+    parse_constant_value,
+    parse_register_notation,
+    parse_force_sweep_instruction,
+    parse_force_instruction,
+    parse_savemeas,
+    parse_measurements,
+    parse_read_instruction,
+    parse_save_instruction,
+    parse_copy_instruction,
+    parse_restore_instruction,
+    parse_trigger_instruction,
+    parse_trim_instruction,
+    parse_meas_match_regex,
+    parse_calculate_expression,
+    parse_sweep_trig_store,
+)
+from poll import worst_case_wait
+from regmap import parse_symbolic_register_notation, PAGE_SELECT_REGISTER
+from snapshot import contiguous_runs, register_masks
+from test_analyzer import load_test_sheet
+from sweep import sweep_point_count
+
+warnings.filterwarnings('ignore')
+
+# Time of a single MCP2221 I2C transaction (USB HID request and response), in seconds
+I2C_TRANSACTION_TIME = 1e-3
+# Dwell per sweep point when a sweep instruction gives no sweep time, in seconds
+SWEEP_STEP_TIME = 1e-3
+
+COST_KEYS = ('delay_time', 'sweep_time', 'sweep_points', 'i2c_reads', 'i2c_writes', 'forces', 'measurements')
+
+
+def new_cost():
+    """
+    Returns an empty cost record.
+
+    Returns:
+        dict: One zeroed counter per entry of COST_KEYS.
+    """
+    return {key: 0 for key in COST_KEYS}
+
+
+def add_cost(total, cost):
+    """
+    Adds the counters of cost into total in place.
+
+    Args:
+        total (dict): Cost record that is accumulated.
+        cost (dict): Cost record to add.
+
+    Returns:
+        dict: The updated total.
+    """
+    for key in COST_KEYS:
+        total[key] += cost.get(key, 0)
+    return total
+
+
+def register_write_cost(registers):
+    """
+    I2C traffic of I2C_write_multiple_registers for the given registers.
+
+    Every register is a read-modify-write followed by a read back, and the whole
+    group is read once more to return the final value.
+
+    Args:
+        registers (list): Register dictionaries with 'address', 'msb' and 'lsb'.
+
+    Returns:
+        dict: Cost record.
+    """
+    cost = new_cost()
+    cost['i2c_reads'] = 3 * len(registers)
+    cost['i2c_writes'] = len(registers)
+    return cost
+
+
+def save_cost(registers):
+    """
+    I2C traffic of a Save__ snapshot, one burst read per run of consecutive addresses.
+
+    Args:
+        registers (list): Register dictionaries of the save instruction.
+
+    Returns:
+        dict: Cost record.
+    """
+    cost = new_cost()
+    cost['i2c_reads'] = len(contiguous_runs(sorted(register_masks(registers))))
+    return cost
+
+
+def copy_cost(copy_data):
+    """
+    I2C traffic of a Copy__, the copied register is read and written to the other register.
+
+    Args:
+        copy_data (dict): Parsed data from the copy instruction.
+
+    Returns:
+        dict: Cost record.
+    """
+    cost = register_write_cost([copy_data.get('paste_register')])
+    cost['i2c_reads'] += 1
+    return cost
+
+
+class DryRunEstimator:
+    """
+    Estimates the time and I2C traffic of tests without hardware.
+    """
+
+    def __init__(self, excel_file, sheet_name, i2c_transaction_time=I2C_TRANSACTION_TIME, sweep_step_time=SWEEP_STEP_TIME):
+        """
+        Initializes the estimator with the Excel file and the sheet holding the tests.
+
+        Args:
+            excel_file (str): Path to the Excel file.
+            sheet_name (str): Name of the sheet to read.
+            i2c_transaction_time (float): Time of one I2C transaction in seconds.
+            sweep_step_time (float): Dwell per sweep point when no sweep time is given, in seconds.
+        """
+        self.excel_file = excel_file
+        self.sheet_name = sheet_name
+        self.i2c_transaction_time = i2c_transaction_time
+        self.sweep_step_time = sweep_step_time
+        self.procedures_df = pd.read_excel(self.excel_file, sheet_name='Procedure')
+        self.raw_data = load_test_sheet(self.excel_file, self.sheet_name)
+        self._procedure_costs = {}
+
+    def test_names(self):
+        """
+        Returns:
+            list: Names of the columns holding instructions in the test sheet.
+        """
+        return [test_name for test_name in self.raw_data.columns
+                if isinstance(test_name, str) and isinstance(self.raw_data.loc['Instructions', test_name], str)]
+
+    def _sweep_cost(self, points, sweep_time):
+        cost = new_cost()
+        cost['sweep_points'] = points
+        cost['sweep_time'] = points * (sweep_time if sweep_time else self.sweep_step_time)
+        return cost
+
+    def _wait_until_cost(self, wait):
+        # worst case, the device is ready at the timeout, polled as poll.wait_until does
+        registers = wait.get('registers', [])
+        read_time = len(registers) * self.i2c_transaction_time
+        result = worst_case_wait(wait.get('timeout', 0), read_time)
+        cost = new_cost()
+        cost['delay_time'] = max(result.elapsed - result.polls * read_time, 0)
+        cost['i2c_reads'] = result.polls * len(registers)
+        # symbolic fields select their page first
+        cost['i2c_writes'] = int(bool(registers) and registers[0].get('page') is not None)
+        return cost
+
+    def estimate_instruction(self, instruction, _stack=()):
+        """
+        Estimates one instruction of a test, dispatching in the same order as TestAnalyzer._process_instruction.
+
+        Args:
+            instruction (str): The instruction string.
+
+        Returns:
+            dict: Cost record of the instruction.
+        """
+        instruction = instruction.strip()
+        cost = new_cost()
+        # skip empty lines and quoted comments
+        if not instruction or re.match(r'"(?:[^\\"]|\\.)*"', instruction):
+            return cost
+
+        if (procedure := parse_procedure_name(instruction)):
+            if procedure in self.procedures_df.columns.to_list():
+                return self.estimate_procedure(procedure, _stack)
+            print(f'!!!!!Procedure Failed {procedure}!!!!!!!!!')
+        elif (delay := parse_wait_delay(instruction)):
+            cost['delay_time'] = delay.get('absValue', 0)
+        elif (wait := parse_wait_until(instruction)):
+            cost = self._wait_until_cost(wait)
+        elif parse_constant_value(instruction):
+            pass
+        elif (register_data := parse_register_notation(instruction)):
+            cost = register_write_cost(register_data.get('registers', []))
+        elif (register_data := parse_symbolic_register_notation(instruction)):
+            # worst case, a page select in front of every symbolic write
+            cost = register_write_cost(register_data.get('registers', []) + [PAGE_SELECT_REGISTER])
+        elif (force_sweep := parse_force_sweep_instruction(instruction)):
+            initial_value = force_sweep.get('initial_value') or {}
+            final_value = force_sweep.get('final_value') or {}
+            step_size = force_sweep.get('step_size') or {}
+            sweep_time = force_sweep.get('sweep_time') or {}
+            points = sweep_point_count(initial_value.get('final_value'), final_value.get('final_value'),
+                                       step_size.get('final_value'))
+            cost = self._sweep_cost(points, sweep_time.get('final_value'))
+            cost['forces'] = points
+        elif parse_force_instruction(instruction):
+            cost['forces'] = 1
+        elif parse_savemeas(instruction) or parse_measurements(instruction):
+            cost['measurements'] = 1
+        elif (read_data := parse_read_instruction(instruction)):
+            cost['i2c_reads'] = len(read_data.get('registers', []))
+        elif (save_data := parse_save_instruction(instruction)):
+            cost = save_cost(save_data.get('registers', []))
+        elif (copy_data := parse_copy_instruction(instruction)):
+            cost = copy_cost(copy_data)
+        elif (restore_data := parse_restore_instruction(instruction)):
+            cost = register_write_cost(restore_data.get('registers', []))
+        elif (parse_trigger_instruction(instruction) or parse_trim_instruction(instruction)
+              or parse_meas_match_regex(instruction) or parse_calculate_expression(instruction)):
+            # the sweep they stop is counted with it, calculations take no bench or bus time
+            pass
+        elif (sweep_trig_store := parse_sweep_trig_store(instruction)):
+            points = sweep_point_count(sweep_trig_store.get('initial_value'), sweep_trig_store.get('final_value'),
+                                       sweep_trig_store.get('step_size'))
+            cost = self._sweep_cost(points, sweep_trig_store.get('sweep_time'))
+            cost['forces'] = points
+            cost['measurements'] = points
+        return cost
+
+    def estimate_procedure_line(self, instruction, _stack=()):
+        """
+        Estimates one line of a procedure, dispatching in the same order as
+        TestAnalyzer._parse_and_execute_procedure_line. Its order differs from the one of the tests,
+        a force sweep line is taken as a force and Measure__ and Read__ lines do nothing.
+
+        Args:
+            instruction (str): The instruction string.
+
+        Returns:
+            dict: Cost record of the instruction.
+        """
+        instruction = instruction.strip()
+        cost = new_cost()
+        if not instruction:
+            return cost
+
+        if (procedure := parse_procedure_name(instruction)):
+            if procedure in self.procedures_df.columns.to_list():
+                return self.estimate_procedure(procedure, _stack)
+            print(f'!!!!!Procedure Failed {procedure}!!!!!!!!!')
+        elif (register_data := parse_register_notation(instruction)):
+            cost = register_write_cost(register_data.get('registers', []))
+        elif (register_data := parse_symbolic_register_notation(instruction)):
+            cost = register_write_cost(register_data.get('registers', []) + [PAGE_SELECT_REGISTER])
+        elif (save_data := parse_save_instruction(instruction)):
+            cost = save_cost(save_data.get('registers', []))
+        elif (copy_data := parse_copy_instruction(instruction)):
+            cost = copy_cost(copy_data)
+        elif (restore_data := parse_restore_instruction(instruction)):
+            cost = register_write_cost(restore_data.get('registers', []))
+        elif (delay := parse_wait_delay(instruction)):
+            cost['delay_time'] = delay.get('absValue', 0)
+        elif (wait := parse_wait_until(instruction)):
+            cost = self._wait_until_cost(wait)
+        elif parse_force_instruction(instruction):
+            cost['forces'] = 1
+        elif parse_savemeas(instruction):
+            cost['measurements'] = 1
+        elif (parse_measurements(instruction) or parse_trigger_instruction(instruction) or parse_trim_instruction(instruction)
+              or parse_meas_match_regex(instruction) or parse_calculate_expression(instruction)):
+            pass
+        elif (sweep_trig_store := parse_sweep_trig_store(instruction)):
+            points = sweep_point_count(sweep_trig_store.get('initial_value'), sweep_trig_store.get('final_value'),
+                                       sweep_trig_store.get('step_size'))
+            cost = self._sweep_cost(points, sweep_trig_store.get('sweep_time'))
+            cost['forces'] = points
+            cost['measurements'] = points
+        return cost
+
+    def estimate_procedure(self, procedure_name, _stack=()):
+        """
+        Estimates a procedure, including the procedures it runs. Results are cached per procedure.
+
+        Args:
+            procedure_name (str): The name of the procedure.
+
+        Returns:
+            dict: Cost record of the procedure.
+        """
+        if procedure_name in self._procedure_costs:
+            return self._procedure_costs[procedure_name]
+        if procedure_name in _stack:
+            print(f'!!!!! Procedure {procedure_name} runs itself: {" -> ".join(_stack)}')
+            return new_cost()
+
+        cost = new_cost()
+        instructions = self.procedures_df.loc[0, procedure_name]
+        if isinstance(instructions, str):
+            for instruction in instructions.split('\n'):
+                add_cost(cost, self.estimate_procedure_line(instruction, _stack + (procedure_name,)))
+        self._procedure_costs[procedure_name] = cost
+        return cost
+
+    def estimate_test(self, test_name):
+        """
+        Estimates a test of the sheet.
+
+        Args:
+            test_name (str): Name of the test to estimate.
+
+        Returns:
+            dict: Cost record with the derived 'i2c_time' and 'total_time' in seconds.
+        """
+        cost = new_cost()
+        for instruction in self.raw_data.loc['Instructions', test_name].split('\n'):
+            add_cost(cost, self.estimate_instruction(instruction))
+        cost['i2c_time'] = (cost['i2c_reads'] + cost['i2c_writes']) * self.i2c_transaction_time
+        cost['total_time'] = cost['delay_time'] + cost['sweep_time'] + cost['i2c_time']
+        return cost
+
+    def report(self, test_names=None):
+        """
+        Estimates several tests, slowest first.
+
+        Args:
+            test_names (list, optional): Tests to estimate, all tests of the sheet by default.
+
+        Returns:
+            pandas.DataFrame: One row per test indexed by test name.
+        """
+        test_names = test_names if test_names else self.test_names()
+        report = pd.DataFrame.from_dict({test_name: self.estimate_test(test_name) for test_name in test_names},
+                                        orient='index')
+        return report.sort_values('total_time', ascending=False)
+
+
+def main():
+    """
+    Main function to parse command line arguments and print the dry-run report.
+    """
+    parser = argparse.ArgumentParser(description="Estimate test time and I2C traffic without hardware.")
+    parser.add_argument("--excel_file", default="IVM6201_ATE_TM.xlsx", help="Path to the Excel file.")
+    parser.add_argument("--sheet_name", default="CP", help="Name of the sheet to read.")
+    parser.add_argument("--test_name", nargs='*', help="Tests to estimate, all tests of the sheet by default.")
+    parser.add_argument("--i2c_time", type=float, default=I2C_TRANSACTION_TIME, help="Time of one I2C transaction in seconds.")
+    args = parser.parse_args()
+
+    estimator = DryRunEstimator(args.excel_file, args.sheet_name, i2c_transaction_time=args.i2c_time)
+    report = estimator.report(args.test_name)
+    print(report.to_string())
+    print(f"total: {report['total_time'].sum():.3f}s, "
+          f"I2C transactions: {int(report['i2c_reads'].sum() + report['i2c_writes'].sum())}")
+
+
+if __name__ == "__main__":
+    main()
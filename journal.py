@@ -0,0 +1,202 @@
+import argparse
+import struct
+import time
+from collections import namedtuple
+
+JOURNAL_MAGIC = b'IVMJ'
+JOURNAL_VERSION = 1
+# magic, version, start of the session (epoch seconds)
+_HEADER = struct.Struct('<4sBd')
+# op, device address, register, time since the start of the session in ns, data length
+_ENTRY = struct.Struct('<BBBQH')
+
+READ_REGISTER = 1
+WRITE = 2
+READ = 3
+OP_NAMES = {READ_REGISTER: 'read_register', WRITE: 'write', READ: 'read'}
+
+# One I2C transaction, data is what was read or written (register address excluded)
+JournalEntry = namedtuple('JournalEntry', ['op', 'address', 'register', 'data', 'timestamp_ns'])
+
+
+class ReplayMismatch(Exception):
+    """
+    Raised when the replayed program does not do the transactions of the journal.
+    """
+
+
+class Journal:
+    """
+    Append-only binary journal of I2C transactions.
+
+    Every transaction is flushed to the file as it is appended, a crash loses at most the one being written.
+    """
+
+    def __init__(self, path, clock_ns=time.perf_counter_ns):
+        """
+        Args:
+            path (str): Path of the journal file, a new session is appended to an existing file.
+            clock_ns (callable): Time source in nanoseconds.
+        """
+        self.path = path
+        self.clock_ns = clock_ns
+        self.file = open(path, 'ab')
+        self.file.write(_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, time.time()))
+        self.file.flush()
+        self.start_ns = clock_ns()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, op, address, register, data=b''):
+        data = bytes(data)
+        self.file.write(_ENTRY.pack(op, address & 0xFF, register & 0xFF, self.clock_ns() - self.start_ns, len(data)) + data)
+        # an I2C transaction takes far longer than the write to the OS buffers
+        self.file.flush()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_journal(path):
+    """
+    Reads the transactions of a journal, session after session.
+
+    Args:
+        path (str): Path of the journal file.
+
+    Yields:
+        JournalEntry: One per transaction, timestamps restart at 0 with every session. A last transaction
+                      cut short, by a crash while it was written, is left out.
+    """
+    with open(path, 'rb') as file:
+        while chunk := file.read(1):
+            # ops are small numbers, a session header starts with the magic
+            if chunk == JOURNAL_MAGIC[:1]:
+                header = chunk + file.read(_HEADER.size - 1)
+                if len(header) < _HEADER.size:
+                    return
+                magic, version, _ = _HEADER.unpack(header)
+                if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+                    raise ValueError(f"{path} is not an I2C journal (version {JOURNAL_VERSION})")
+                continue
+            entry = chunk + file.read(_ENTRY.size - 1)
+            if len(entry) < _ENTRY.size:
+                return
+            op, address, register, timestamp_ns, length = _ENTRY.unpack(entry)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            yield JournalEntry(op, address, register, data, timestamp_ns)
+
+
+class JournalSlave:
+    """
+    I2C slave that records every transaction of the slave it wraps into a journal.
+    """
+
+    def __init__(self, slave, journal):
+        """
+        Args:
+            slave: I2C slave of the DUT (EasyMCP2221 I2C_Slave).
+            journal (Journal): Journal the transactions go to.
+        """
+        self.slave = slave
+        self.journal = journal
+        self.addr = getattr(slave, 'addr', 0)
+
+    def read_register(self, register, length=1, *args, **kwargs):
+        data = self.slave.read_register(register, length, *args, **kwargs)
+        self.journal.append(READ_REGISTER, self.addr, register, data)
+        return data
+
+    def write(self, data, *args, **kwargs):
+        result = self.slave.write(data, *args, **kwargs)
+        self.journal.append(WRITE, self.addr, data[0], data[1:])
+        return result
+
+    def read(self, length=1, *args, **kwargs):
+        data = self.slave.read(length, *args, **kwargs)
+        self.journal.append(READ, self.addr, 0, data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.slave, name)
+
+
+class ReplaySlave:
+    """
+    I2C slave that plays back a journal without hardware, at full speed.
+
+    Reads return the recorded data. Every transaction must match the next one of the journal,
+    a read of another register or a write of other data raises ReplayMismatch.
+    """
+
+    def __init__(self, source, addr=None):
+        """
+        Args:
+            source (str or iterable): Path of the journal file, or JournalEntry items.
+            addr (int, optional): Only replay the transactions of this device address.
+        """
+        entries = read_journal(source) if isinstance(source, str) else iter(source)
+        self.entries = (entry for entry in entries if addr is None or entry.address == addr)
+        self.addr = addr
+        self.replayed = 0
+
+    def _next(self, op, register):
+        entry = next(self.entries, None)
+        if entry is None:
+            raise ReplayMismatch(f"journal ended after {self.replayed} transactions, "
+                                 f"{OP_NAMES[op]} 0x{register:02X} not recorded")
+        if entry.op != op or entry.register != register & 0xFF:
+            raise ReplayMismatch(f"transaction {self.replayed}: {OP_NAMES[op]} 0x{register:02X}, "
+                                 f"recorded {OP_NAMES.get(entry.op, entry.op)} 0x{entry.register:02X}")
+        self.replayed += 1
+        return entry
+
+    def read_register(self, register, length=1, *args, **kwargs):
+        entry = self._next(READ_REGISTER, register)
+        if len(entry.data) != length:
+            raise ReplayMismatch(f"transaction {self.replayed - 1}: read of {length} bytes at 0x{register:02X}, "
+                                 f"recorded {len(entry.data)}")
+        return entry.data
+
+    def write(self, data, *args, **kwargs):
+        entry = self._next(WRITE, data[0])
+        if entry.data != bytes(data[1:]):
+            raise ReplayMismatch(f"transaction {self.replayed - 1}: write {bytes(data[1:]).hex()} at 0x{data[0]:02X}, "
+                                 f"recorded {entry.data.hex()}")
+
+    def read(self, length=1, *args, **kwargs):
+        return self._next(READ, 0).data
+
+    def remaining(self):
+        """
+        Returns:
+            int: Transactions of the journal that were not replayed, consumes them.
+        """
+        return sum(1 for _ in self.entries)
+
+
+def main():
+    """
+    Main function to print the transactions of a journal.
+    """
+    parser = argparse.ArgumentParser(description="Print the transactions of an I2C journal.")
+    parser.add_argument("journal", help="Path of the journal file.")
+    args = parser.parse_args()
+
+    for entry in read_journal(args.journal):
+        print(f"{entry.timestamp_ns / 1e6:12.3f}ms 0x{entry.address:02X} {OP_NAMES.get(entry.op, entry.op):13} "
+              f"0x{entry.register:02X} {entry.data.hex()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+from collections import namedtuple
+
+# First poll interval, doubled after every poll that is not ready, in seconds
+POLL_INTERVAL = 200e-6
+# Longest interval between two polls, in seconds
+MAX_POLL_INTERVAL = 20e-3
+BACKOFF = 2.0
+
+# ready: condition met before the timeout, value: last value read, elapsed: seconds waited, polls: reads done
+PollResult = namedtuple('PollResult', ['ready', 'value', 'elapsed', 'polls'])
+
+
+def wait_until(read, condition, timeout, interval=POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL,
+               backoff=BACKOFF, clock=time.perf_counter, sleep=time.sleep):
+    """
+    Polls read() until condition(value) is met or the timeout expires.
+
+    The first read is done at once, so a device that is already ready costs one read and no wait.
+    The next read comes after interval, the interval then grows by backoff up to max_interval
+    so slow settling does not flood the bus. The last poll is done at the timeout, never after it.
+
+    Args:
+        read (callable): read() -> value, None when the read failed.
+        condition (callable): condition(value) -> bool.
+        timeout (float): Longest wait in seconds.
+        interval (float): First poll interval in seconds.
+        max_interval (float): Longest poll interval in seconds.
+        backoff (float): Growth factor of the interval.
+        clock (callable): Time source in seconds.
+        sleep (callable): Sleep function in seconds.
+
+    Returns:
+        PollResult: Outcome of the wait.
+    """
+    start = clock()
+    deadline = start + timeout
+    polls = 0
+    while True:
+        value = read()
+        polls += 1
+        now = clock()
+        if value is not None and condition(value):
+            return PollResult(True, value, now - start, polls)
+        if now >= deadline:
+            return PollResult(False, value, now - start, polls)
+        sleep(min(interval, deadline - now))
+        interval = min(interval * backoff, max_interval)
+
+
+
+def worst_case_wait(timeout, read_time=0.0, interval=POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL, backoff=BACKOFF):
+    """
+    Runs wait_until on a simulated clock with a condition that is never met, the longest a wait can take.
+
+    Args:
+        timeout (float): Longest wait in seconds.
+        read_time (float): Time of one read in seconds.
+        interval (float): First poll interval in seconds.
+        max_interval (float): Longest poll interval in seconds.
+        backoff (float): Growth factor of the interval.
+
+    Returns:
+        PollResult: Not ready, elapsed is the time waited including the reads, polls the reads done.
+    """
+    now = [0.0]
+
+    def advance(seconds):
+        now[0] += seconds
+
+    return wait_until(lambda: advance(read_time), lambda value: False, timeout, interval, max_interval, backoff,
+                      clock=lambda: now[0], sleep=advance)
@@ -0,0 +1,139 @@
+import re
+from enum import Enum
+from functools import lru_cache
+import numpy as np
+
+# SI prefixes of the instruction values, kilo is written both 'k' and 'K'
+SI_PREFIXES = {
+    'p': 1e-12,  # pico
+    'n': 1e-9,   # nano
+    'u': 1e-6,   # micro
+    'μ': 1e-6,   # micro
+    'm': 1e-3,   # milli
+    '': 1.0,
+    'k': 1e3,    # kilo
+    'K': 1e3,    # kilo
+    'M': 1e6,    # mega
+    'G': 1e9,    # giga
+    'T': 1e12    # tera
+}
+
+
+class Unit(Enum):
+    """
+    Units of the instruction values, the value is the symbol written in the sheets.
+    """
+    NONE = ''
+    VOLT = 'V'
+    AMPERE = 'A'
+    OHM = 'Ohm'
+    HERTZ = 'Hz'
+    SECOND = 'S'
+    CELSIUS = 'degC'
+
+    @property
+    def kind(self):
+        """
+        Returns:
+            str: Physical quantity of the unit, 'voltage', 'current', ... or 'unknown'.
+        """
+        return _UNIT_KINDS.get(self, 'unknown')
+
+
+_UNIT_KINDS = {
+    Unit.VOLT: 'voltage',
+    Unit.AMPERE: 'current',
+    Unit.OHM: 'resistance',
+    Unit.HERTZ: 'frequency',
+    Unit.SECOND: 'time',
+    Unit.CELSIUS: 'temperature'
+}
+# symbols as written in the sheets -> Unit
+_UNIT_SYMBOLS = {'': Unit.NONE, 'V': Unit.VOLT, 'A': Unit.AMPERE, 'Ohm': Unit.OHM, 'ohm': Unit.OHM, 'Ω': Unit.OHM,
+                 'Hz': Unit.HERTZ, 'S': Unit.SECOND, 's': Unit.SECOND, 'degC': Unit.CELSIUS}
+
+# '100mA', '-0.01V', '10mS', '1.5MHz', '10kOhm', '2', '1e-3V'
+QUANTITY_PATTERN = re.compile(
+    r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([pnuμmkKMGT]?)(Ohm|ohm|Ω|Hz|degC|V|A|S|s|)\s*$')
+
+
+class Quantity:
+    """
+    Immutable value with its unit, in base units (a '100mA' quantity holds 0.1 A).
+
+    The value is a float64, or a float64 NumPy array for vectorized sweeps.
+    prefix keeps the SI prefix the value was written with.
+    """
+    __slots__ = ('value', 'unit', 'prefix')
+
+    def __init__(self, value, unit=Unit.NONE, prefix=''):
+        """
+        Args:
+            value (float or array-like): Value in base units.
+            unit (Unit): Unit of the value.
+            prefix (str): SI prefix the value was written with.
+        """
+        value = np.asarray(value, dtype=np.float64)
+        object.__setattr__(self, 'value', float(value) if value.ndim == 0 else value)
+        object.__setattr__(self, 'unit', unit)
+        object.__setattr__(self, 'prefix', prefix)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Quantity is immutable, cannot set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Quantity is immutable, cannot delete {name}")
+
+    @property
+    def multiplier(self):
+        """
+        Returns:
+            float: Multiplier of the SI prefix the value was written with.
+        """
+        return SI_PREFIXES[self.prefix]
+
+    @property
+    def raw_value(self):
+        """
+        Returns:
+            float or numpy.ndarray: Value as written, before the SI prefix is applied.
+        """
+        return self.value / self.multiplier
+
+    def __float__(self):
+        return float(self.value)
+
+    def __eq__(self, other):
+        if not isinstance(other, Quantity):
+            return NotImplemented
+        return self.unit == other.unit and np.array_equal(self.value, other.value)
+
+    def __hash__(self):
+        return hash((self.unit, self.value if isinstance(self.value, float) else self.value.tobytes()))
+
+    def __repr__(self):
+        return f"Quantity({self.value!r}, {self.unit})"
+
+    def __str__(self):
+        return f"{self.value}{self.unit.value}"
+
+
+@lru_cache(maxsize=4096)
+def parse_quantity(text):
+    """
+    Parse a number with optional SI prefix and unit, like '100mA' or '-0.01V'.
+
+    The same strings come back for every instruction of a sheet, so results are cached;
+    Quantity is immutable so the cached instances can be shared.
+
+    Args:
+        text (str): Value as written in the instruction.
+
+    Returns:
+        Quantity or None: None if text is not a value.
+    """
+    match = QUANTITY_PATTERN.match(text)
+    if not match:
+        return None
+    number, prefix, symbol = match.groups()
+    return Quantity(float(number) * SI_PREFIXES[prefix], _UNIT_SYMBOLS[symbol], prefix)
@@ -0,0 +1,146 @@
+import time
+from collections import Counter, namedtuple
+from EasyMCP2221.exceptions import NotAckError, TimeoutError as I2CTimeoutError, LowSCLError, LowSDAError
+
+# Errors a transaction is retried on: no acknowledge, I2C engine timeout, stuck bus lines,
+# USB transfer errors of the HID layer (OSError) and the MCP2221 engine refusing to cancel (RuntimeError)
+RECOVERABLE_ERRORS = (NotAckError, I2CTimeoutError, LowSCLError, LowSDAError, OSError, RuntimeError)
+
+# retries: attempts after the first one, delay: wait before the first retry in seconds, multiplied by backoff
+# at each retry, reset_bus: release the MCP2221 I2C engine before retrying, reprobe: check the slave answers
+RetryPolicy = namedtuple('RetryPolicy', ['retries', 'delay', 'backoff', 'reset_bus', 'reprobe'],
+                         defaults=[3, 1e-3, 2.0, True, True])
+NO_RETRY = RetryPolicy(retries=0, reset_bus=False, reprobe=False)
+
+
+class I2CBusError(Exception):
+    """
+    Raised when an I2C transaction still fails after the retries of the policy.
+    """
+
+
+def retry_policy(config=None):
+    """
+    Builds a RetryPolicy from the I2C_recovery section of the DUT configuration.
+
+    Args:
+        config (dict, optional): retries, delay, backoff, reset_bus and reprobe entries, missing ones keep their default.
+
+    Returns:
+        RetryPolicy: The policy.
+    """
+    return RetryPolicy(**{field: value for field, value in (config or {}).items() if field in RetryPolicy._fields})
+
+
+def call_with_retries(call, policy, counters=None, recover=None, sleep=time.sleep):
+    """
+    Runs an I2C transaction, retrying it on the recoverable errors.
+
+    Args:
+        call (callable): The transaction, without arguments.
+        policy (RetryPolicy): Retries and backoff.
+        counters (collections.Counter, optional): Incremented with transactions, errors, retries and failures.
+        recover (callable, optional): Called before each retry, with the error, to bring the bus back.
+        sleep (callable): Sleep function in seconds.
+
+    Returns:
+        The result of call.
+
+    Raises:
+        I2CBusError: The transaction failed on every attempt.
+    """
+    counters = Counter() if counters is None else counters
+    counters['transactions'] += 1
+    delay = policy.delay
+    for attempt in range(policy.retries + 1):
+        try:
+            return call()
+        except RECOVERABLE_ERRORS as error:
+            counters['errors'] += 1
+            counters[type(error).__name__] += 1
+            if attempt == policy.retries:
+                counters['failures'] += 1
+                raise I2CBusError(f"I2C transaction failed after {attempt + 1} attempts: {error!r}") from error
+            counters['retries'] += 1
+            sleep(delay)
+            delay *= policy.backoff
+            if recover:
+                recover(error)
+
+
+class RecoveringSlave:
+    """
+    I2C slave that retries the failed transactions of the slave it wraps.
+
+    Before each retry the MCP2221 I2C engine is released (bus reset) and the slave is probed,
+    as set by the policy. The page and register shadows of the slave are dropped through on_reset
+    since the state of the DUT is not known after a bus error. Writes are retried as well, a write
+    that failed on its data byte may have reached the DUT, so only full register writes are safe to repeat.
+    """
+
+    def __init__(self, slave, policy=RetryPolicy(), on_reset=None, sleep=time.sleep):
+        """
+        Args:
+            slave: I2C slave of the DUT (EasyMCP2221 I2C_Slave).
+            policy (RetryPolicy): Retries and backoff.
+            on_reset (callable, optional): Called after every bus reset, to forget the cached DUT state.
+            sleep (callable): Sleep function in seconds.
+        """
+        self.slave = slave
+        self.policy = policy
+        self.on_reset = on_reset
+        self.sleep = sleep
+        self.addr = getattr(slave, 'addr', 0)
+        self.counters = Counter()
+
+    def reset_bus(self):
+        """
+        Cancels the transfer in progress of the MCP2221 and waits for SDA and SCL to be released.
+        """
+        self.counters['bus_resets'] += 1
+        mcp = getattr(self.slave, 'mcp', None)
+        try:
+            if mcp is not None:
+                # private API of EasyMCP2221, the only way to cancel a transfer
+                mcp._i2c_release()
+        except RECOVERABLE_ERRORS as error:
+            self.counters['failed_bus_resets'] += 1
+            print(f'!!!!!!!!!!!!!!! fail:> I2C bus reset {error!r}')
+        if self.on_reset:
+            self.on_reset()
+
+    def reprobe(self):
+        """
+        Returns:
+            bool: True if the slave acknowledges its address.
+        """
+        self.counters['reprobes'] += 1
+        try:
+            present = self.slave.is_present() if hasattr(self.slave, 'is_present') else True
+        except RECOVERABLE_ERRORS:
+            present = False
+        if not present:
+            self.counters['reprobe_failures'] += 1
+            print(f'!!!!!!!!!!!!!!! fail:> slave not present with address {self.addr}')
+        return present
+
+    def _recover(self, error):
+        if self.policy.reset_bus:
+            self.reset_bus()
+        if self.policy.reprobe:
+            self.reprobe()
+
+    def _transaction(self, call):
+        return call_with_retries(call, self.policy, self.counters, self._recover, self.sleep)
+
+    def read_register(self, register, length=1, *args, **kwargs):
+        return self._transaction(lambda: self.slave.read_register(register, length, *args, **kwargs))
+
+    def write(self, data, *args, **kwargs):
+        return self._transaction(lambda: self.slave.write(data, *args, **kwargs))
+
+    def read(self, length=1, *args, **kwargs):
+        return self._transaction(lambda: self.slave.read(length, *args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.slave, name)
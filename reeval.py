@@ -0,0 +1,193 @@
+import argparse
+import contextlib
+import csv
+import time
+import warnings
+from collections import Counter, namedtuple
+import numpy as np
+from batch import BatchAnalyzer
+from results import RESULTS_FILE, ResultsDB
+from test_analyzer import load_test_sheet
+from workbook import load_program
+
+warnings.filterwarnings('ignore')
+
+# DUTs re-evaluated at once, their raw values and old results are held in memory together
+CHUNK_DUTS = 1000
+
+# raw values of a chunk of DUTs of one wafer; tests: test -> (indexes of the DUTs of duts that ran it, variable -> values)
+DutChunk = namedtuple('DutChunk', ['lot', 'wafer', 'duts', 'tests'])
+# verdict of a limit checked value of a DUT that changed, the old or new side is None when it has no result
+VerdictChange = namedtuple('VerdictChange', ['lot', 'wafer', 'dut', 'test', 'variable',
+                                             'old_value', 'new_value', 'old_passed', 'new_passed'])
+# re-evaluation of a chunk: results are (DUT identifiers, batch.LimitResult) per limit checked value
+ChunkVerdicts = namedtuple('ChunkVerdicts', ['lot', 'wafer', 'duts', 'results', 'changes'])
+
+
+def _chunk(lot, wafer, duts, values):
+    tests = {}
+    for test, variables in values.items():
+        indexes = sorted({index for by_dut in variables.values() for index in by_dut})
+        positions = {index: position for position, index in enumerate(indexes)}
+        columns = {}
+        for variable, by_dut in variables.items():
+            column = np.full(len(indexes), np.nan)
+            column[[positions[index] for index in by_dut]] = list(by_dut.values())
+            columns[variable] = column
+        tests[test] = (indexes, columns)
+    return DutChunk(lot, wafer, duts, tests)
+
+
+def dut_chunks(rows, chunk_duts=CHUNK_DUTS):
+    """
+    Groups streamed raw values into chunks of DUTs, a chunk holds DUTs of one wafer.
+
+    Args:
+        rows (iterable): (lot, wafer, dut, test, variable, value) ordered by DUT, see ResultsDB.iter_measurements.
+        chunk_duts (int): DUTs per chunk at most.
+
+    Yields:
+        DutChunk: The values of the DUTs, the last one when a DUT was tested again.
+    """
+    wafer_key, duts, values = None, [], {}
+    for lot, wafer, dut, test, variable, value in rows:
+        if (lot, wafer) != wafer_key or (dut != duts[-1] and len(duts) == chunk_duts):
+            if duts:
+                yield _chunk(*wafer_key, duts, values)
+            wafer_key, duts, values = (lot, wafer), [], {}
+        if not duts or dut != duts[-1]:
+            duts.append(dut)
+        values.setdefault(test, {}).setdefault(variable, {})[len(duts) - 1] = np.nan if value is None else value
+    if duts:
+        yield _chunk(*wafer_key, duts, values)
+
+
+class Reevaluator:
+    """
+    Runs the calculations and limit checks of the tests again from the raw values of a results database,
+    with the formulas and limits of a workbook version.
+
+    A test is re-evaluated for the DUTs with raw values recorded for it, tests without raw values
+    and tests not in the sheets are skipped. Old results recorded without their variable are not compared.
+    """
+
+    def __init__(self, excel_file, sheet_names, program=None):
+        """
+        Args:
+            excel_file (str): Path to the Excel file, the new workbook version.
+            sheet_names (list): Sheets holding the tests, the first sheet holding a test is used.
+            program (workbook.TestProgram, optional): The sheets and the 'Procedure' sheet already loaded.
+        """
+        self.excel_file = excel_file
+        self.program = program or load_program(excel_file, list(sheet_names) + ['Procedure'])
+        self.sheets = {}  # test name -> sheet
+        for sheet_name in reversed(sheet_names):
+            raw_data = load_test_sheet(excel_file, sheet_name, self.program)
+            self.sheets.update({test_name: sheet_name for test_name in raw_data.columns
+                                if isinstance(test_name, str) and isinstance(raw_data.loc['Instructions', test_name], str)})
+        self.analyzers = {}
+        self.skipped = set()
+
+    def analyzer(self, test_name):
+        """
+        Returns:
+            batch.BatchAnalyzer: The compiled test, None if it is in none of the sheets.
+        """
+        if test_name not in self.analyzers:
+            sheet_name = self.sheets.get(test_name)
+            self.analyzers[test_name] = BatchAnalyzer(self.excel_file, sheet_name, test_name, self.program) if sheet_name else None
+        return self.analyzers[test_name]
+
+    def evaluate(self, chunk):
+        """
+        Returns:
+            list: (DUT identifiers, batch.LimitResult) of every limit checked value of the tests of the chunk.
+        """
+        results = []
+        for test_name, (indexes, values) in chunk.tests.items():
+            if (analyzer := self.analyzer(test_name)) is None:
+                self.skipped.add(test_name)
+                continue
+            duts = [chunk.duts[index] for index in indexes]
+            test_results, _ = analyzer.run(values, len(duts))
+            results += [(duts, result) for result in test_results]
+        return results
+
+    def run(self, results_db, lot=None, wafer=None, chunk_duts=CHUNK_DUTS):
+        """
+        Re-evaluates the DUTs of a results database chunk by chunk, without loading all their values.
+
+        Args:
+            results_db (results.ResultsDB): Database holding the raw values and the old results.
+            lot (str, optional): Lot to re-evaluate, all lots if None.
+            wafer (str, optional): Wafer to re-evaluate, all wafers if None.
+            chunk_duts (int): DUTs re-evaluated at once.
+
+        Yields:
+            ChunkVerdicts: The new results of a chunk and the verdicts that changed.
+        """
+        for chunk in dut_chunks(results_db.iter_measurements(lot, wafer), chunk_duts):
+            results = self.evaluate(chunk)
+            new = {}
+            for duts, result in results:
+                for dut, value, passed in zip(duts, result.values, result.passed):
+                    if not np.isnan(value):
+                        new[(dut, result.test, result.variable)] = (float(value), None if np.isnan(passed) else bool(passed))
+            old = {}
+            for dut, test, variable, value, passed in results_db.dut_results(
+                    chunk.lot, chunk.wafer, chunk.duts, columns=('dut', 'test', 'variable', 'value', 'passed')):
+                if variable and test in chunk.tests and test not in self.skipped:
+                    old[(dut, test, variable)] = (value, None if passed is None else bool(passed))
+            changes = []
+            for key in sorted(old.keys() | new.keys()):
+                old_value, old_passed = old.get(key, (None, None))
+                new_value, new_passed = new.get(key, (None, None))
+                if (key in old) != (key in new) or old_passed != new_passed:
+                    changes.append(VerdictChange(chunk.lot, chunk.wafer, *key, old_value, new_value, old_passed, new_passed))
+            yield ChunkVerdicts(chunk.lot, chunk.wafer, chunk.duts, results, changes)
+
+
+def main():
+    """
+    Main function to re-evaluate a results database against a workbook and report the verdicts that changed.
+    """
+    parser = argparse.ArgumentParser(description="Re-evaluate stored raw values with the formulas and limits of a workbook.")
+    parser.add_argument("--excel_file", default="IVM6201_ATE_TM.xlsx", help="Path to the Excel file, the new workbook version.")
+    parser.add_argument("--sheet_name", nargs='+', default=['CP'], help="Sheets holding the tests.")
+    parser.add_argument("--db", default=RESULTS_FILE, help="Results database holding the raw values.")
+    parser.add_argument("--lot", help="Lot to re-evaluate, all lots by default.")
+    parser.add_argument("--wafer", help="Wafer to re-evaluate, all wafers by default.")
+    parser.add_argument("--chunk_duts", type=int, default=CHUNK_DUTS, help="DUTs re-evaluated at once.")
+    parser.add_argument("--output", help="Results database receiving the new results.")
+    parser.add_argument("--diff_file", help="CSV file receiving the verdicts that changed.")
+    args = parser.parse_args()
+
+    reevaluator = Reevaluator(args.excel_file, args.sheet_name)
+    start = time.perf_counter()
+    duts = 0
+    changed = Counter()  # (test, old verdict, new verdict) -> DUTs
+    with ResultsDB(args.db) as results_db, \
+            (ResultsDB(args.output) if args.output else contextlib.nullcontext()) as output, \
+            (open(args.diff_file, 'w', newline='') if args.diff_file else contextlib.nullcontext()) as diff_file:
+        diff_writer = csv.writer(diff_file) if diff_file else None
+        if diff_writer:
+            diff_writer.writerow(VerdictChange._fields)
+        for verdicts in reevaluator.run(results_db, args.lot, args.wafer, args.chunk_duts):
+            duts += len(verdicts.duts)
+            if output:
+                for chunk_duts, result in verdicts.results:
+                    output.record_batch(verdicts.lot, verdicts.wafer, chunk_duts, result)
+            if diff_writer:
+                diff_writer.writerows(verdicts.changes)
+            changed.update((change.test, change.old_passed, change.new_passed) for change in verdicts.changes)
+
+    verdict = {True: 'pass', False: 'fail', None: 'none'}
+    for (test, old_passed, new_passed), count in sorted(changed.items(), key=lambda item: (item[0][0], str(item[0][1:]))):
+        print(f"{test:30} {verdict[old_passed]:>4} -> {verdict[new_passed]:4} {count} results")
+    for test_name in sorted(reevaluator.skipped):
+        print(f'!!!!! {test_name} not in {", ".join(args.sheet_name)}, skipped')
+    print(f"{duts} DUTs re-evaluated in {time.perf_counter() - start:.3f}s, {sum(changed.values())} verdicts changed")
+
+
+if __name__ == "__main__":
+    main()
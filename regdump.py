@@ -0,0 +1,220 @@
+import argparse
+import json
+from collections import namedtuple
+from functools import lru_cache
+from common import (
+    I2C_read_register_burst, I2C_write_register, I2C_selected_page, get_device, get_slave, ivm6201_config
+)
+from regmap import REGMAP_FILE, PAGE_SELECT_ADDRESS, PAGE_SELECT_REGISTER, load_registers, load_register_map
+from snapshot import contiguous_runs
+
+# Bits that can be read without side effects (clear on read 'C' registers are never dumped)
+READABLE_ATTRIBUTES = 'NRULIJKP'
+# Bits compared against the reference, push buttons clear themselves
+COMPARED_ATTRIBUTES = 'NRULIJK'
+
+# Plan of a register dump: readable addresses of every page and the burst runs covering them
+DumpPlan = namedtuple('DumpPlan', ['pages', 'masks'])
+
+
+def attribute_mask(attribute, attributes):
+    """
+    Mask of the bits whose access character is in attributes.
+
+    Args:
+        attribute (str): One access character per bit, bit 7 first (e.g. '0000NNNN').
+        attributes (str): Access characters to select.
+
+    Returns:
+        int: Bit mask.
+    """
+    return sum(1 << (7 - index) for index, access in enumerate(attribute[:8]) if access in attributes)
+
+
+@lru_cache(maxsize=None)
+def dump_plan(path=REGMAP_FILE):
+    """
+    Works out once which registers of the register map are dumped and how.
+
+    Args:
+        path (str): Path to the register map.
+
+    Returns:
+        DumpPlan: pages maps page -> tuple of (start_address, length) burst runs,
+                  masks maps (page, address) -> compared bits.
+    """
+    addresses = {}
+    masks = {}
+    for register in load_registers(path):
+        if register.address == PAGE_SELECT_ADDRESS or 'C' in register.attribute:
+            continue
+        if not attribute_mask(register.attribute, READABLE_ATTRIBUTES):
+            continue
+        addresses.setdefault(register.page, set()).add(register.address)
+        masks[(register.page, register.address)] = attribute_mask(register.attribute, COMPARED_ATTRIBUTES)
+    pages = {page: tuple(contiguous_runs(sorted(page_addresses))) for page, page_addresses in sorted(addresses.items())}
+    return DumpPlan(pages, masks)
+
+
+def dump_registers(slave, pages=None, path=REGMAP_FILE):
+    """
+    Reads every readable register of the register map, one burst per run of consecutive
+    addresses, page by page. The page selected before the dump is selected again after it.
+
+    Args:
+        slave: I2C slave of the DUT.
+        pages (iterable, optional): Pages to dump, all pages of the register map by default.
+        path (str): Path to the register map.
+
+    Returns:
+        dict or None: (page, address) -> register byte, None if the slave is missing.
+    """
+    if not slave:
+        return None
+    plan = dump_plan(path)
+    initial_page = I2C_selected_page(slave)
+    dump = {}
+    for page, runs in plan.pages.items():
+        if pages is not None and page not in pages:
+            continue
+        I2C_write_register(slave, PAGE_SELECT_REGISTER, page)
+        for start, length in runs:
+            if (data := I2C_read_register_burst(slave, start, length)) is None:
+                print(f'!!!!!!!!!! fail dump read of {length} registers from {hex(start)} page {page}')
+                continue
+            dump.update(((page, start + offset), byte) for offset, byte in enumerate(data))
+    if initial_page is not None:
+        I2C_write_register(slave, PAGE_SELECT_REGISTER, initial_page)
+    return dump
+
+
+def default_image(path=REGMAP_FILE):
+    """
+    Returns:
+        dict: (page, address) -> default_hex value of every dumped register of the register map.
+    """
+    masks = dump_plan(path).masks
+    return {(register.page, register.address): register.default
+            for register in load_registers(path) if (register.page, register.address) in masks}
+
+
+def save_golden(dump, golden_file):
+    """
+    Saves a register dump as a golden image, {"page": {"0xADDRESS": "0xVALUE"}}.
+
+    Args:
+        dump (dict): (page, address) -> register byte.
+        golden_file (str): Path of the JSON file to write.
+    """
+    image = {}
+    for (page, address), byte in sorted(dump.items()):
+        image.setdefault(str(page), {})[f'0x{address:02X}'] = f'0x{byte:02X}'
+    with open(golden_file, 'w') as file:
+        json.dump(image, file, indent=2)
+
+
+def load_golden(golden_file):
+    """
+    Loads a golden image written by save_golden.
+
+    Returns:
+        dict: (page, address) -> register byte.
+    """
+    with open(golden_file) as file:
+        image = json.load(file)
+    return {(int(page), int(address, 16)): int(byte, 16)
+            for page, registers in image.items() for address, byte in registers.items()}
+
+
+@lru_cache(maxsize=None)
+def _register_fields(path=REGMAP_FILE):
+    # (page, address) -> (register name, [(field name, RegisterField)])
+    fields = {}
+    for symbol, field in load_register_map(path).items():
+        register_name, _, field_name = symbol.partition('.')
+        entry = fields.setdefault((field.page, field.address), (register_name, []))
+        if field_name:
+            entry[1].append((field_name, field))
+    return fields
+
+
+def clear_dump_caches():
+    """
+    Drops the dump plans and register fields worked out so far, call after the register map file changed.
+    """
+    dump_plan.cache_clear()
+    _register_fields.cache_clear()
+
+
+def diff_registers(dump, reference=None, path=REGMAP_FILE):
+    """
+    Compares a register dump with a reference image and decodes the differing fields.
+
+    Args:
+        dump (dict): (page, address) -> register byte, from dump_registers.
+        reference (dict, optional): (page, address) -> expected byte, the register map defaults by default.
+        path (str): Path to the register map.
+
+    Returns:
+        list: One dict per differing register with 'register', 'page', 'address', 'expected',
+              'actual' and 'fields', a list of (field_name, expected, actual) field values.
+    """
+    reference = reference if reference is not None else default_image(path)
+    masks = dump_plan(path).masks
+    register_fields = _register_fields(path)
+    differences = []
+    for key, actual in dump.items():
+        if (expected := reference.get(key)) is None:
+            continue
+        changed = (expected ^ actual) & masks.get(key, 0xFF)
+        if not changed:
+            continue
+        register_name, fields = register_fields.get(key, (hex(key[1]), []))
+        differences.append({
+            'register': register_name,
+            'page': key[0],
+            'address': key[1],
+            'expected': expected,
+            'actual': actual,
+            'fields': [(field_name, (expected & field.mask) >> field.lsb, (actual & field.mask) >> field.lsb)
+                       for field_name, field in fields if changed & field.mask]
+        })
+    return differences
+
+
+def print_differences(differences):
+    """
+    Prints the differences found by diff_registers.
+    """
+    if not differences:
+        print('PASS: registers match the reference')
+        return
+    for difference in differences:
+        print(f"FAIL: {difference['register']} page {difference['page']} {hex(difference['address'])} "
+              f"expected {difference['expected']:#04x} read {difference['actual']:#04x}")
+        for field_name, expected, actual in difference['fields']:
+            print(f"    {field_name}: expected {hex(expected)} read {hex(actual)}")
+
+
+def main():
+    """
+    Main function to dump the DUT registers and compare them with the defaults or a golden image.
+    """
+    parser = argparse.ArgumentParser(description="Dump the DUT registers and diff them against a reference.")
+    parser.add_argument("--golden", help="Golden image to compare with, the register map defaults by default.")
+    parser.add_argument("--save_golden", help="Save the dump as golden image to this file.")
+    parser.add_argument("--regmap", default=REGMAP_FILE, help="Path to the register map.")
+    args = parser.parse_args()
+
+    slave = get_slave(device=device, address=ivm6201_config.Address) if (device := get_device()) else None
+    if (dump := dump_registers(slave, path=args.regmap)) is None:
+        print('!!!!!!!!!! fail dut not present')
+        return
+    if args.save_golden:
+        save_golden(dump, args.save_golden)
+    reference = load_golden(args.golden) if args.golden else None
+    print_differences(diff_registers(dump, reference, path=args.regmap))
+
+
+if __name__ == "__main__":
+    main()
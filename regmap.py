@@ -0,0 +1,266 @@
+import re
+import struct
+from collections import namedtuple
+from functools import lru_cache
+import yaml
+
+REGMAP_FILE = 'ivm6201_config.json'
+# compiled binary form of the register map, see pack_regmap
+REGMAP_BINARY_FILE = 'ivm6201_config.bin'
+REGMAP_MAGIC = b'IVMR'
+REGMAP_VERSION = 1
+PAGE_SELECT_ADDRESS = 0xFE
+# i2c_page_sel is bit 0 of the page selection register, the register itself is reachable from every page
+PAGE_SELECT_REGISTER = {'address': PAGE_SELECT_ADDRESS, 'msb': 0, 'lsb': 0, 'page': None}
+
+# Location of a register or of a bit field inside a register, msb/lsb are bit positions in the register
+RegisterField = namedtuple('RegisterField', ['address', 'page', 'msb', 'lsb', 'mask'])
+# A register of the map, attribute holds one access character per bit, bit 7 first
+RegisterInfo = namedtuple('RegisterInfo', ['name', 'address', 'page', 'default', 'attribute'])
+
+
+def register_page(register, address):
+    # registers without a 'page' entry are on page 0, the page select register is on every page
+    return None if address == PAGE_SELECT_ADDRESS else int(register.get('page', 0))
+
+
+def pack_regmap(content):
+    """
+    Packs a register map into its compiled binary form.
+
+    Layout (little endian): magic, version, device address, register count, then per register
+    address, page (0xFF when not given), default, 8 attribute characters and the name, followed
+    by its fields as position, msb, lsb (0xFF for none), bit attribute and name.
+
+    Args:
+        content (dict): Register map as loaded from the YAML form.
+
+    Returns:
+        bytes: The packed register map.
+    """
+    registers = content.get('registers', {})
+    packed = bytearray(struct.pack('<4sBBH', REGMAP_MAGIC, REGMAP_VERSION, int(content.get('device_address', 0)), len(registers)))
+    for register_name, register in registers.items():
+        address = int(str(register['address']), 16)
+        page = register.get('page')
+        name = register_name.encode()
+        packed += struct.pack('<BBB8sB', address, 0xFF if page is None else int(page),
+                              int(str(register.get('default_hex', '0x00')), 16),
+                              str(register.get('attribute', 'NNNNNNNN')).encode()[:8], len(name)) + name
+        bits = [bit for bit in (register.get('bits') or {}).values() if bit and bit.get('field_name')]
+        packed += struct.pack('<B', len(bits))
+        for bit in bits:
+            field_name = str(bit['field_name']).encode()
+            packed += struct.pack('<BBBcB', int(bit['position']),
+                                  0xFF if bit.get('msb') is None else int(bit['msb']),
+                                  0xFF if bit.get('lsb') is None else int(bit['lsb']),
+                                  str(bit.get('bit_attribute', 'N')).encode()[:1], len(field_name)) + field_name
+    return bytes(packed)
+
+
+def unpack_regmap(packed):
+    """
+    Unpacks the compiled binary form of the register map.
+
+    Args:
+        packed (bytes): Output of pack_regmap.
+
+    Returns:
+        dict: Register map in the same layout as the YAML form.
+    """
+    magic, version, device_address, count = struct.unpack_from('<4sBBH', packed, 0)
+    if magic != REGMAP_MAGIC or version != REGMAP_VERSION:
+        raise ValueError(f"not a compiled register map (version {REGMAP_VERSION})")
+    offset = struct.calcsize('<4sBBH')
+    registers = {}
+    for _ in range(count):
+        address, page, default, attribute, name_length = struct.unpack_from('<BBB8sB', packed, offset)
+        offset += struct.calcsize('<BBB8sB')
+        register_name = packed[offset:offset + name_length].decode()
+        offset += name_length
+        (field_count,) = struct.unpack_from('<B', packed, offset)
+        offset += 1
+        bits = {f'bit{position}': {} for position in range(8)}
+        for _ in range(field_count):
+            position, msb, lsb, bit_attribute, field_length = struct.unpack_from('<BBBcB', packed, offset)
+            offset += struct.calcsize('<BBBcB')
+            bits[f'bit{position}'] = {
+                'bit_attribute': bit_attribute.decode(),
+                'field_name': packed[offset:offset + field_length].decode(),
+                'lsb': None if lsb == 0xFF else lsb,
+                'msb': None if msb == 0xFF else msb,
+                'position': position
+            }
+            offset += field_length
+        registers[register_name] = {
+            'address': f'0x{address:02X}',
+            'attribute': attribute.decode(),
+            'bits': bits,
+            'default_bin': f'{default:08b}',
+            'default_hex': f'0x{default:02X}',
+        }
+        if page != 0xFF:
+            registers[register_name]['page'] = page
+    return {'device_address': device_address, 'registers': registers}
+
+
+@lru_cache(maxsize=None)
+def _read_regmap(path):
+    if path.endswith('.bin'):
+        with open(path, 'rb') as regmap_file:
+            return unpack_regmap(regmap_file.read())
+    with open(path) as regmap_file:
+        return yaml.safe_load(regmap_file)
+
+
+@lru_cache(maxsize=None)
+def load_registers(path=REGMAP_FILE):
+    """
+    Loads the registers of the register map.
+
+    Args:
+        path (str): Path to the register map (ivm6201_config.json).
+
+    Returns:
+        tuple: RegisterInfo of every register, in file order.
+    """
+    content = _read_regmap(path)
+    registers = []
+    for register_name, register in content.get('registers', {}).items():
+        address = int(str(register['address']), 16)
+        registers.append(RegisterInfo(register_name, address, register_page(register, address),
+                                      int(str(register.get('default_hex', '0x00')), 16),
+                                      str(register.get('attribute', 'NNNNNNNN'))))
+    return tuple(registers)
+
+
+@lru_cache(maxsize=None)
+def load_register_map(path=REGMAP_FILE):
+    """
+    Loads the register map and indexes every register and bit field by its symbolic name.
+
+    Registers are indexed as 'Register_name' and fields as 'Register_name.field_name'.
+    Registers without a 'page' entry are on page 0.
+
+    Args:
+        path (str): Path to the register map (ivm6201_config.json).
+
+    Returns:
+        dict: Symbolic name -> RegisterField.
+    """
+    content = _read_regmap(path)
+    fields = {}
+    for register_name, register in content.get('registers', {}).items():
+        address = int(str(register['address']), 16)
+        page = register_page(register, address)
+        fields[register_name] = RegisterField(address, page, 7, 0, 0xFF)
+        for bit in (register.get('bits') or {}).values():
+            if not bit or not bit.get('field_name'):
+                continue
+            # the field is declared on its top bit, msb/lsb are the bits of the field value it holds
+            width = abs(int(bit['msb']) - int(bit['lsb'])) + 1 if bit.get('msb') is not None and bit.get('lsb') is not None else 1
+            msb = int(bit['position'])
+            lsb = msb - width + 1
+            fields[f"{register_name}.{bit['field_name']}"] = RegisterField(address, page, msb, lsb, ((1 << width) - 1) << lsb)
+    return fields
+
+
+@lru_cache(maxsize=None)
+def resolve_symbol(symbol, path=REGMAP_FILE):
+    """
+    Resolves a symbolic register or field name.
+
+    Args:
+        symbol (str): 'Register_name' or 'Register_name.field_name'.
+        path (str): Path to the register map.
+
+    Returns:
+        RegisterField or None: None if the name is not in the register map.
+    """
+    return load_register_map(path).get(symbol)
+
+
+def clear_regmap_caches():
+    """
+    Drops the register maps loaded so far, call after the register map file changed.
+    """
+    for cached in (_read_regmap, load_registers, load_register_map, resolve_symbol):
+        cached.cache_clear()
+
+
+def parse_symbolic_register_notation(notation, path=REGMAP_FILE):
+    """
+    Parse register notation written with register map names, like 'BUCK_setting_1.bck_cap_mod_sel__3'.
+
+    Several fields can be chained MSB first as in the hex notation, the value is hexadecimal.
+
+    Args:
+        notation (str): Input notation string.
+        path (str): Path to the register map.
+
+    Returns:
+        dict: {'registers': [...], 'value': int} like parse_register_notation, each register
+              carrying its 'page'. Empty if the notation does not match or a name is unknown.
+    """
+    notation = re.sub(r'\s*"[^"]*"', '', notation).strip()
+    parts = notation.split('__')
+    if len(parts) < 2:
+        return {}
+
+    registers = []
+    for part in parts[:-1]:
+        symbol = part.strip()
+        if not re.match(r'^[A-Za-z][\w/]*\.[A-Za-z]\w*$', symbol):
+            return {}
+        if (field := resolve_symbol(symbol, path)) is None:
+            print(f'!!!!!!!!!! fail register field not in register map: {symbol}')
+            return {}
+        registers.append({'address': field.address, 'msb': field.msb, 'lsb': field.lsb, 'page': field.page})
+
+    try:
+        value = int(parts[-1].strip(), 16)
+    except ValueError:
+        return {}
+
+    bit_width = sum(register['msb'] - register['lsb'] + 1 for register in registers)
+    if value >= 2**bit_width:
+        print(f'!!!!!!!!!! fail value {hex(value)} does not fit in {bit_width} bits: {notation}')
+        return {}
+
+    return {
+        'registers': registers,
+        'value': value
+    }
+
+
+def compile_register_write(registers, value, current_page=None):
+    """
+    Splits a register write into one write per register and inserts a page select
+    write (0xFE) in front of every register whose page differs from the current one.
+
+    Args:
+        registers (list): Register dictionaries, MSB first, optionally with a 'page'.
+        value (int): Value written across the registers.
+        current_page (int, optional): Page the device is on, None if unknown.
+
+    Returns:
+        tuple: (writes, page) where writes is a list of (register, value) pairs
+               and page is the page the device is on after the writes.
+    """
+    chunks = []
+    bitwidth_filled = 0
+    for register in registers[::-1]:
+        bit_width = register['msb'] - register['lsb'] + 1
+        chunks.append((register, (value >> bitwidth_filled) & ((1 << bit_width) - 1)))
+        bitwidth_filled += bit_width
+
+    writes = []
+    page = current_page
+    for register, chunk in chunks[::-1]:
+        if register.get('page') is not None and register['page'] != page:
+            page = register['page']
+            writes.append((PAGE_SELECT_REGISTER, page))
+        writes.append((register, chunk))
+        if register['address'] == PAGE_SELECT_ADDRESS:
+            page = chunk
+    return writes, page
@@ -0,0 +1,243 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+import yaml
+from regmap import REGMAP_FILE, REGMAP_BINARY_FILE, pack_regmap
+
+REGMAP_EXCEL_FILE = 'IVM6201_rev0_regmap.xlsx'
+REGMAP_SHEETS = ('PAG0', 'PAG1')
+# per sheet content hash and compiled registers of the last build
+REGMAP_CACHE_FILE = '.regmap_cache.json'
+CACHE_VERSION = 1
+DEVICE_ADDRESS = 0xD0
+
+# Bit columns of the register map sheets, bit 7 first like the Attribute string
+BIT_COLUMNS = [f'Bit{position}' for position in range(7, -1, -1)]
+# 'tdm_bclk_osr[1:0]', 'tdm_ch_i_slotting [1:0]', 'i2c_unlock', '(reserved)' and '(spare)' do not match
+FIELD_PATTERN = r'^\s*([A-Za-z_]\w*)\s*(?:\[\s*(\d+)\s*(?::\s*(\d+)\s*)?\])?\s*$'
+
+_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_RELATIONSHIP = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+_PACKAGE_RELATIONSHIP = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+
+
+def sheet_page(sheet_name):
+    """
+    Returns:
+        int: Page of a register map sheet, 'PAG1' -> 1.
+    """
+    match = re.search(r'(\d+)$', sheet_name)
+    return int(match.group(1)) if match else 0
+
+
+def sheet_digests(excel_file, sheet_names=REGMAP_SHEETS):
+    """
+    Hashes the content of the register map sheets straight from the xlsx archive, without
+    loading the workbook. A sheet hash covers its XML and the shared strings it refers to,
+    so editing a sheet does not change the hash of the other sheets.
+
+    Args:
+        excel_file (str): Path to the register map workbook.
+        sheet_names (iterable): Sheets to hash.
+
+    Returns:
+        dict: sheet name -> sha256 hex digest, sheets missing from the workbook are left out.
+    """
+    with zipfile.ZipFile(excel_file) as archive:
+        workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+        relationships = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        targets = {relationship.get('Id'): relationship.get('Target')
+                   for relationship in relationships.iter(_PACKAGE_RELATIONSHIP)}
+        parts = {sheet.get('name'): 'xl/' + targets[sheet.get(_RELATIONSHIP)].lstrip('/').removeprefix('xl/')
+                 for sheet in workbook.iter(f'{_MAIN}sheet')}
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            shared_strings = [''.join(text.text or '' for text in item.iter(f'{_MAIN}t')).encode()
+                              for item in ET.fromstring(archive.read('xl/sharedStrings.xml')).iter(f'{_MAIN}si')]
+        digests = {}
+        for sheet_name in sheet_names:
+            if sheet_name not in parts:
+                continue
+            sheet_xml = archive.read(parts[sheet_name])
+            digest = hashlib.sha256(sheet_xml)
+            for index in re.findall(rb'<c [^>]*t="s"[^>]*>\s*<v>(\d+)</v>', sheet_xml):
+                digest.update(b'\0' + shared_strings[int(index)])
+            digests[sheet_name] = digest.hexdigest()
+    return digests
+
+
+def compile_sheet(sheet, page):
+    """
+    Compiles one register map sheet into register entries, all columns at once.
+
+    Register rows are the rows whose Hex cell holds the =DEC2HEX formula, the formulas are
+    not cached in the workbook so the address is the count of register rows before them.
+
+    Args:
+        sheet (pandas.DataFrame): Sheet as read by pandas.read_excel.
+        page (int): Page of the sheet.
+
+    Returns:
+        list: (register_name, register) pairs in address order, register as in ivm6201_config.json.
+    """
+    registers = sheet.loc[sheet['Hex'].astype(str).str.startswith('=DEC2HEX')].copy()
+    registers['address'] = np.arange(len(registers))
+    registers = registers.loc[registers['Register Name'].notna()]
+    if registers.empty:
+        return []
+
+    names = registers['Register Name'].astype(str).str.strip().str.replace(' ', '_')
+    attributes = registers['Attribute'].fillna('').astype(str).str.strip().str.pad(8, side='right', fillchar='0').str[:8]
+
+    # 'Bin - Default' is read as the decimal number 110101.0, one digit per bit
+    digits = registers['Bin - Default'].fillna(0).to_numpy(dtype=np.int64)
+    defaults = ((digits[:, None] // 10 ** np.arange(8)) % 10 * (1 << np.arange(8))).sum(axis=1)
+
+    # one row per named bit cell, bit 7 first
+    cells = registers[BIT_COLUMNS].stack()
+    fields = cells.astype(str).str.extract(FIELD_PATTERN).dropna(subset=[0])
+    fields.columns = ['field_name', 'msb', 'lsb']
+    fields['position'] = fields.index.get_level_values(1).str[3:].astype(int)
+    # character i of the attribute is bit 7 - i, the same order as BIT_COLUMNS
+    bit_attributes = attributes.str.extract('(.)' * 8)
+    bit_attributes.columns = BIT_COLUMNS
+    fields['bit_attribute'] = bit_attributes.stack().reindex(fields.index)
+    fields['lsb'] = fields['lsb'].fillna(fields['msb'])
+
+    bits = {row: {f'bit{position}': {} for position in range(8)} for row in registers.index}
+    for (row, _), field in zip(fields.index, fields.itertuples(index=False)):
+        bits[row][f'bit{field.position}'] = {
+            'bit_attribute': field.bit_attribute,
+            'field_name': field.field_name,
+            'lsb': None if pd.isna(field.lsb) else int(field.lsb),
+            'msb': None if pd.isna(field.msb) else int(field.msb),
+            'position': field.position
+        }
+
+    return [(name, {
+        'address': f'0x{address:02X}',
+        'attribute': attribute,
+        'bits': bits[row],
+        'default_bin': f'{default:08b}',
+        'default_hex': f'0x{default:02X}',
+        'page': page
+    }) for row, name, address, attribute, default in zip(registers.index, names, registers['address'],
+                                                          attributes, defaults.tolist())]
+
+
+def merge_pages(compiled):
+    """
+    Merges the compiled sheets into one register map.
+
+    A register name keeps its bare form for its last occurrence on the first page it is used on,
+    like the original conversion where the last duplicate won. Other occurrences get the page
+    and address appended, 'Name_p1_7E', so every register stays reachable.
+
+    Args:
+        compiled (dict): page -> list of (register_name, register) pairs.
+
+    Returns:
+        dict: Register map content with 'device_address' and 'registers'.
+    """
+    owners = {}
+    for page in sorted(compiled):
+        for register_name, register in compiled[page]:
+            if owners.get(register_name, (page,))[0] == page:
+                owners[register_name] = (page, register['address'])
+
+    registers = {}
+    for page in sorted(compiled):
+        for register_name, register in compiled[page]:
+            if owners[register_name] != (page, register['address']) or register_name in registers:
+                register_name = f"{register_name}_p{page}_{register['address'][2:]}"
+            registers[register_name] = register
+    return {'device_address': DEVICE_ADDRESS, 'registers': registers}
+
+
+def _load_cache(cache_file, excel_file):
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != CACHE_VERSION or cache.get('excel_file') != os.path.abspath(excel_file):
+        return {}
+    return cache.get('sheets', {})
+
+
+def build_regmap(excel_file=REGMAP_EXCEL_FILE, sheet_names=REGMAP_SHEETS, yaml_file=REGMAP_FILE,
+                 binary_file=REGMAP_BINARY_FILE, cache_file=REGMAP_CACHE_FILE, force=False):
+    """
+    Builds the register map from the register map workbook, reading only the sheets
+    whose content changed since the last build.
+
+    Args:
+        excel_file (str): Path to the register map workbook.
+        sheet_names (iterable): Sheets to compile, one page each.
+        yaml_file (str, optional): Output path of the YAML register map, skipped if None.
+        binary_file (str, optional): Output path of the compiled binary register map, skipped if None.
+        cache_file (str, optional): Path of the build cache, no caching if None.
+        force (bool): Rebuild every sheet.
+
+    Returns:
+        tuple: (content, rebuilt) the register map content and the names of the rebuilt sheets.
+    """
+    digests = sheet_digests(excel_file, sheet_names)
+    if missing := [sheet_name for sheet_name in sheet_names if sheet_name not in digests]:
+        raise ValueError(f"sheets not in {excel_file}: {', '.join(missing)}")
+
+    cache = {} if force else _load_cache(cache_file, excel_file)
+    rebuilt = [sheet_name for sheet_name in sheet_names
+               if cache.get(sheet_name, {}).get('digest') != digests[sheet_name]]
+    if rebuilt:
+        sheets = pd.read_excel(excel_file, sheet_name=rebuilt)
+        for sheet_name in rebuilt:
+            cache[sheet_name] = {
+                'digest': digests[sheet_name],
+                'registers': compile_sheet(sheets[sheet_name], sheet_page(sheet_name))
+            }
+
+    content = merge_pages({sheet_page(sheet_name): [tuple(entry) for entry in cache[sheet_name]['registers']]
+                           for sheet_name in sheet_names})
+    outputs_missing = any(path and not os.path.exists(path) for path in (yaml_file, binary_file))
+    if rebuilt or outputs_missing:
+        if yaml_file:
+            with open(yaml_file, 'w') as file:
+                yaml.dump(content, file, default_flow_style=False)
+        if binary_file:
+            with open(binary_file, 'wb') as file:
+                file.write(pack_regmap(content))
+    if cache_file and rebuilt:
+        with open(cache_file, 'w') as file:
+            json.dump({'version': CACHE_VERSION, 'excel_file': os.path.abspath(excel_file),
+                       'sheets': {sheet_name: cache[sheet_name] for sheet_name in sheet_names}}, file)
+    return content, rebuilt
+
+
+def main():
+    """
+    Main function to compile the register map workbook.
+    """
+    parser = argparse.ArgumentParser(description="Compile the register map workbook into the YAML and binary register maps.")
+    parser.add_argument("--excel_file", default=REGMAP_EXCEL_FILE, help="Path to the register map workbook.")
+    parser.add_argument("--sheets", nargs='*', default=list(REGMAP_SHEETS), help="Sheets to compile, one page each.")
+    parser.add_argument("--yaml", default=REGMAP_FILE, help="Output path of the YAML register map.")
+    parser.add_argument("--binary", default=REGMAP_BINARY_FILE, help="Output path of the compiled binary register map.")
+    parser.add_argument("--cache", default=REGMAP_CACHE_FILE, help="Path of the build cache.")
+    parser.add_argument("--force", action='store_true', help="Rebuild every sheet.")
+    args = parser.parse_args()
+
+    content, rebuilt = build_regmap(args.excel_file, args.sheets, args.yaml, args.binary, args.cache, args.force)
+    print(f"{len(content['registers'])} registers, rebuilt: {', '.join(rebuilt) if rebuilt else 'nothing, up to date'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+RESULTS_FILE = 'results.db'
+# rows kept in memory before they are written in one transaction
+BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    lot TEXT NOT NULL,
+    wafer TEXT NOT NULL DEFAULT '',
+    dut TEXT NOT NULL,
+    test TEXT NOT NULL,
+    variable TEXT NOT NULL DEFAULT '',
+    value REAL,
+    low REAL,
+    high REAL,
+    unit TEXT NOT NULL DEFAULT '',
+    passed INTEGER,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_lot_test ON results (lot, test);
+CREATE INDEX IF NOT EXISTS results_dut ON results (lot, wafer, dut, test);
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    lot TEXT NOT NULL,
+    wafer TEXT NOT NULL DEFAULT '',
+    dut TEXT NOT NULL,
+    test TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS measurements_dut ON measurements (lot, wafer, dut);
+"""
+COLUMNS = ('lot', 'wafer', 'dut', 'test', 'variable', 'value', 'low', 'high', 'unit', 'passed', 'timestamp')
+MEASUREMENT_COLUMNS = ('lot', 'wafer', 'dut', 'test', 'variable', 'value')
+
+
+def _limit(value):
+    # NaN limits of the sheet are stored as NULL
+    return None if value is None or pd.isna(value) else float(value)
+
+
+class ResultsDB:
+    """
+    Results of every DUT, in a SQLite database in WAL mode so reports can read while tests write.
+
+    Rows are buffered and inserted BATCH_SIZE at a time, flush() or closing the database
+    writes the rest.
+    """
+
+    def __init__(self, path=RESULTS_FILE, batch_size=BATCH_SIZE):
+        """
+        Args:
+            path (str): Path of the database file.
+            batch_size (int): Rows buffered before they are inserted.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self._pending = []
+        self._pending_measurements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, lot, wafer, dut, test, value, low=None, high=None, unit='', passed=None, variable=''):
+        """
+        Adds the result of a test of a DUT.
+
+        Args:
+            lot (str): Lot of the DUT.
+            wafer (str): Wafer of the DUT, '' for packaged parts.
+            dut (str): DUT identifier inside the lot and wafer.
+            test (str): Test name.
+            value (float): Measured value.
+            low (float, optional): Low limit.
+            high (float, optional): High limit.
+            unit (str): Unit of the value.
+            passed (bool, optional): Limit check result, None if the test has no limits.
+            variable (str): Test variable holding the value, '' if not known.
+        """
+        self._pending.append((str(lot), str(wafer or ''), str(dut), test, variable or '', _limit(value), _limit(low),
+                              _limit(high), unit or '', None if passed is None else int(bool(passed)), time.time()))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def recorder(self, lot, wafer, dut):
+        """
+        Returns:
+            callable: record(test, value, low, high, unit, passed, variable) bound to one DUT.
+        """
+        return lambda test, value, low=None, high=None, unit='', passed=None, variable='': \
+            self.record(lot, wafer, dut, test, value, low, high, unit, passed, variable)
+
+    def record_measurement(self, lot, wafer, dut, test, variable, value):
+        """
+        Adds a raw value of a test of a DUT: measured on the bench or read from the DUT,
+        before any calculation. The calculations and limit checks can be run again from them, see reeval.
+
+        Args:
+            lot (str): Lot of the DUT.
+            wafer (str): Wafer of the DUT, '' for packaged parts.
+            dut (str): DUT identifier inside the lot and wafer.
+            test (str): Test name.
+            variable (str): Test variable holding the value.
+            value (float): The value.
+        """
+        self._pending_measurements.append((str(lot), str(wafer or ''), str(dut), test, variable, _limit(value)))
+        if len(self._pending_measurements) >= self.batch_size:
+            self.flush()
+
+    def measurement_recorder(self, lot, wafer, dut):
+        """
+        Returns:
+            callable: record(test, variable, value) bound to one DUT.
+        """
+        return lambda test, variable, value: self.record_measurement(lot, wafer, dut, test, variable, value)
+
+    def record_batch(self, lot, wafer, duts, result):
+        """
+        Adds a limit checked value of many DUTs, NaN values are not recorded as for a single DUT.
+
+        Args:
+            lot (str): Lot of the DUTs.
+            wafer (str): Wafer of the DUTs, '' for packaged parts.
+            duts (list): DUT identifiers, in the order of the values.
+            result (batch.LimitResult): Values and verdicts of the DUTs.
+        """
+        for dut, value, passed in zip(duts, result.values, result.passed):
+            if not np.isnan(value):
+                self.record(lot, wafer, dut, result.test, value, result.low, result.high, result.unit,
+                            None if np.isnan(passed) else passed, result.variable)
+
+    def flush(self):
+        """
+        Inserts the buffered rows in one transaction.
+        """
+        if not self._pending and not self._pending_measurements:
+            return
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", self._pending)
+            self.connection.executemany(
+                f"INSERT INTO measurements ({', '.join(MEASUREMENT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(MEASUREMENT_COLUMNS))})", self._pending_measurements)
+        self._pending = []
+        self._pending_measurements = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def results(self, lot=None, wafer=None, tests=None, columns=COLUMNS):
+        """
+        Reads results, filtered on the indexed columns.
+
+        Args:
+            lot (str, optional): Lot to read, all lots if None.
+            wafer (str, optional): Wafer to read, all wafers if None.
+            tests (list, optional): Tests to read, all tests if None.
+            columns (tuple): Columns to read.
+
+        Returns:
+            pandas.DataFrame: One row per result.
+        """
+        rows = self._select(columns, lot, wafer, tests).fetchall()
+        return pd.DataFrame.from_records(rows, columns=list(columns))
+
+    def iter_results(self, lot=None, wafer=None, columns=COLUMNS):
+        """
+        Streams results DUT by DUT, in test order, without loading them all.
+
+        Args:
+            lot (str, optional): Lot to read, all lots if None.
+            wafer (str, optional): Wafer to read, all wafers if None.
+            columns (tuple): Columns to read.
+
+        Yields:
+            tuple: One row per result, ordered by lot, wafer, DUT and insertion.
+        """
+        yield from self._select(columns, lot, wafer, order_by='lot, wafer, dut, id')
+
+    def iter_measurements(self, lot=None, wafer=None, columns=MEASUREMENT_COLUMNS):
+        """
+        Streams the raw values DUT by DUT, in the order they were recorded.
+
+        Args:
+            lot (str, optional): Lot to read, all lots if None.
+            wafer (str, optional): Wafer to read, all wafers if None.
+            columns (tuple): Columns to read.
+
+        Yields:
+            tuple: One row per value, ordered by lot, wafer, DUT and insertion.
+        """
+        yield from self._select(columns, lot, wafer, order_by='lot, wafer, dut, id', table='measurements')
+
+    def dut_results(self, lot, wafer, duts, columns=COLUMNS):
+        """
+        Reads the results of some DUTs of a wafer.
+
+        Returns:
+            list: One row per result, in insertion order.
+        """
+        self.flush()
+        duts = [str(dut) for dut in duts]
+        return self.connection.execute(
+            f"SELECT {', '.join(columns)} FROM results WHERE lot = ? AND wafer = ? AND dut IN ({', '.join('?' * len(duts))}) "
+            f"ORDER BY id", [str(lot), str(wafer or '')] + duts).fetchall()
+
+    def _select(self, columns, lot=None, wafer=None, tests=None, order_by=None, table='results'):
+        self.flush()
+        conditions, parameters = [], []
+        if lot is not None:
+            conditions.append('lot = ?')
+            parameters.append(str(lot))
+        if wafer is not None:
+            conditions.append('wafer = ?')
+            parameters.append(str(wafer))
+        if tests:
+            conditions.append(f"test IN ({', '.join('?' * len(tests))})")
+            parameters += list(tests)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = f" ORDER BY {order_by}" if order_by else ''
+        return self.connection.execute(f"SELECT {', '.join(columns)} FROM {table}{where}{order}", parameters)
+
+    def test_statistics(self, lot=None, wafer=None, tests=None):
+        """
+        Statistics of every limit checked value of the tests: count, mean, sigma, min, max, yield and Cpk.
+
+        A test checking several variables has one row per variable, results recorded without their
+        variable are together under ''. Cpk uses the last limits of the value, one sided when only one limit is given
+        and NaN without limits or spread. Yield is the fraction of limit checked results that passed.
+
+        Args:
+            lot (str, optional): Lot to report, all lots if None.
+            wafer (str, optional): Wafer to report, all wafers if None.
+            tests (list, optional): Tests to report, all tests if None.
+
+        Returns:
+            pandas.DataFrame: One row per test and variable.
+        """
+        data = self.results(lot, wafer, tests, columns=('test', 'variable', 'value', 'low', 'high', 'passed'))
+        if data.empty:
+            return pd.DataFrame(columns=['count', 'mean', 'sigma', 'min', 'max', 'low', 'high', 'yield', 'cpk'],
+                                index=pd.MultiIndex.from_tuples([], names=['test', 'variable']))
+        data[['value', 'low', 'high', 'passed']] = data[['value', 'low', 'high', 'passed']].astype(float)
+        statistics = data.groupby(['test', 'variable'], sort=True).agg(
+            count=('value', 'count'), mean=('value', 'mean'), sigma=('value', 'std'),
+            min=('value', 'min'), max=('value', 'max'), low=('low', 'last'), high=('high', 'last'),
+            **{'yield': ('passed', 'mean')})
+        sigma = statistics['sigma'].where(statistics['sigma'] > 0).to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cpu = (statistics['high'].to_numpy() - statistics['mean'].to_numpy()) / (3 * sigma)
+            cpl = (statistics['mean'].to_numpy() - statistics['low'].to_numpy()) / (3 * sigma)
+        # fmin keeps the defined side of one sided limits
+        statistics['cpk'] = np.fmin(cpu, cpl)
+        return statistics
+
+    def dut_yield(self, lot=None, wafer=None):
+        """
+        Fraction of DUTs that passed every limit checked test.
+
+        Args:
+            lot (str, optional): Lot to report, all lots if None.
+            wafer (str, optional): Wafer to report, all wafers if None.
+
+        Returns:
+            float: Yield, NaN if no DUT has a limit checked result.
+        """
+        data = self.results(lot, wafer, columns=('lot', 'wafer', 'dut', 'passed')).dropna(subset=['passed'])
+        if data.empty:
+            return float('nan')
+        return float(data.groupby(['lot', 'wafer', 'dut'])['passed'].min().mean())
+
+
+def main():
+    """
+    Main function to print the statistics of a lot.
+    """
+    parser = argparse.ArgumentParser(description="Print the per test and variable statistics of the results database.")
+    parser.add_argument("--db", default=RESULTS_FILE, help="Path of the results database.")
+    parser.add_argument("--lot", help="Lot to report, all lots by default.")
+    parser.add_argument("--wafer", help="Wafer to report, all wafers by default.")
+    parser.add_argument("--test_name", nargs='*', help="Tests to report, all tests by default.")
+    args = parser.parse_args()
+
+    with ResultsDB(args.db) as results:
+        print(results.test_statistics(args.lot, args.wafer, args.test_name).to_string())
+        print(f"DUT yield: {results.dut_yield(args.lot, args.wafer):.2%}")
+
+
+if __name__ == "__main__":
+    main()
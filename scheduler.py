@@ -0,0 +1,100 @@
+import time
+
+# Waits shorter than this are spun on perf_counter_ns, longer waits sleep until this close to the deadline
+SPIN_THRESHOLD_NS = 2_000_000
+
+
+def sleep_until_ns(deadline_ns, clock_ns=time.perf_counter_ns, sleep=time.sleep):
+    """
+    Waits until the clock reaches deadline_ns.
+
+    time.sleep wakes up late by the scheduling granularity of the OS, so it is only used for
+    the part of the wait before the last SPIN_THRESHOLD_NS, the rest is spun on the clock.
+
+    Args:
+        deadline_ns (int): Deadline on the clock, in nanoseconds.
+        clock_ns (callable): Time source in nanoseconds.
+        sleep (callable): Sleep function in seconds.
+
+    Returns:
+        int: Time of the clock when the wait ended, in nanoseconds.
+    """
+    now = clock_ns()
+    if deadline_ns - now > SPIN_THRESHOLD_NS:
+        sleep((deadline_ns - now - SPIN_THRESHOLD_NS) / 1e9)
+        now = clock_ns()
+    while now < deadline_ns:
+        now = clock_ns()
+    return now
+
+
+def precise_sleep(seconds):
+    """
+    Drop-in replacement of time.sleep that does not oversleep short waits.
+
+    Args:
+        seconds (float): Time to wait.
+    """
+    if seconds > 0:
+        sleep_until_ns(time.perf_counter_ns() + round(seconds * 1e9))
+
+
+class DelayScheduler:
+    """
+    Schedules the delays of a test as deadlines counted from the last hardware action.
+
+    delay() only moves the deadline, consecutive delays add up into one wait and the time
+    spent in I2C traffic or parsing since the last action counts towards the delay.
+    wait() is called before the next hardware action and waits out what is left.
+    """
+
+    def __init__(self, clock_ns=time.perf_counter_ns, sleep=time.sleep):
+        """
+        Args:
+            clock_ns (callable): Time source in nanoseconds.
+            sleep (callable): Sleep function in seconds.
+        """
+        self.clock_ns = clock_ns
+        self.sleep = sleep
+        self.last_action_ns = clock_ns()
+        self.deadline_ns = None
+
+    def mark(self):
+        """
+        Records the end of a hardware action, the next delays count from now.
+        """
+        self.last_action_ns = self.clock_ns()
+
+    def delay(self, seconds):
+        """
+        Adds a delay to the pending deadline.
+
+        Args:
+            seconds (float): Delay in seconds.
+        """
+        start_ns = self.last_action_ns if self.deadline_ns is None else self.deadline_ns
+        self.deadline_ns = start_ns + round(seconds * 1e9)
+
+    def pending(self):
+        """
+        Returns:
+            float: Time left until the pending deadline in seconds, 0 if there is none.
+        """
+        if self.deadline_ns is None:
+            return 0.0
+        return max(0, self.deadline_ns - self.clock_ns()) / 1e9
+
+    def wait(self):
+        """
+        Waits until the pending deadline, if any.
+
+        Returns:
+            float: Time waited in seconds.
+        """
+        if self.deadline_ns is None:
+            return 0.0
+        start_ns = self.clock_ns()
+        end_ns = sleep_until_ns(self.deadline_ns, self.clock_ns, self.sleep)
+        self.deadline_ns = None
+        self.last_action_ns = end_ns
+        return max(0, end_ns - start_ns) / 1e9
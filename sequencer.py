@@ -0,0 +1,341 @@
+import argparse
+import re
+import warnings
+from collections import namedtuple
+from functools import lru_cache
+from dft import (
+    parse_procedure_name,
+    parse_register_notation,
+    parse_force_sweep_instruction,
+    parse_force_instruction,
+    parse_restore_instruction,
+    parse_sweep_trig_store,
+)
+from regmap import REGMAP_FILE, PAGE_SELECT_ADDRESS, parse_symbolic_register_notation, compile_register_write, load_registers
+from regdump import attribute_mask
+from common import I2C_recovery_counters, ivm6201_supply_check, open_dut
+from snapshot import register_bit_range
+from test_analyzer import TestAnalyzer, load_test_sheet
+from workbook import load_program
+
+warnings.filterwarnings('ignore')
+
+# Bits that keep the value written to them, other bits (push buttons, status, unknown registers) are always written
+HOLDING_ATTRIBUTES = 'N'
+
+# Setup actions of a test, in program order:
+# (WRITE, registers, value), (FORCE, signal, reference, value), (RELEASE, signal), (FORGET, registers)
+WRITE = 'write'
+FORCE = 'force'
+RELEASE = 'release'  # the signal is swept, its last value is not known
+FORGET = 'forget'  # the registers are restored from a snapshot, their value is not known
+TestProfile = namedtuple('TestProfile', ['name', 'actions'])
+
+
+@lru_cache(maxsize=None)
+def holding_masks(path=REGMAP_FILE):
+    """
+    Returns:
+        dict: (page, address) -> mask of the bits that keep the value written to them.
+    """
+    return {(register.page, register.address): attribute_mask(register.attribute, HOLDING_ATTRIBUTES)
+            for register in load_registers(path)}
+
+
+def register_chunks(page, registers, value):
+    """
+    Splits a register write into the bits it sets in each register.
+
+    Args:
+        page (int or None): Page the DUT is on before the write.
+        registers (list): Register dictionaries, MSB first, optionally with a 'page'.
+        value (int): Value written across the registers.
+
+    Returns:
+        list: ((page, address), mask, bits) per register, page None when it is not known.
+    """
+    chunks = []
+    writes, _ = compile_register_write(registers, value, page)
+    for register, chunk in writes:
+        if register['address'] == PAGE_SELECT_ADDRESS:
+            page = chunk
+            continue
+        msb, lsb = register_bit_range(register)
+        mask = ((1 << (msb - lsb + 1)) - 1) << lsb
+        chunks.append(((page, register['address']), mask, (chunk << lsb) & mask))
+    return chunks
+
+
+class SetupState:
+    """
+    Register bits and forced signals in effect on the DUT, as set by the test program so far.
+    """
+
+    def __init__(self):
+        self.registers = {}  # (page, address) -> (known mask, bits)
+        self.forces = {}  # signal -> (reference, value)
+        self.page = None  # page selected by the setup actions, see apply
+
+    def copy(self):
+        state = SetupState()
+        state.registers = dict(self.registers)
+        state.forces = dict(self.forces)
+        state.page = self.page
+        return state
+
+    def write_in_effect(self, page, registers, value):
+        """
+        Returns:
+            bool: True if every bit of the write holds the value already, the write can be dropped.
+        """
+        if page is None and not all(register.get('page') is not None for register in registers):
+            return False
+        holding = holding_masks()
+        for key, mask, bits in register_chunks(page, registers, value):
+            known_mask, known_bits = self.registers.get(key, (0, 0))
+            if key[0] is None or mask & ~holding.get(key, 0) or mask & ~known_mask or (known_bits ^ bits) & mask:
+                return False
+        return True
+
+    def record_write(self, page, registers, value):
+        for key, mask, bits in register_chunks(page, registers, value):
+            if key[0] is None:
+                continue
+            known_mask, known_bits = self.registers.get(key, (0, 0))
+            self.registers[key] = (known_mask | mask, (known_bits & ~mask) | bits)
+
+    def forget(self, page, registers):
+        for register in registers:
+            self.registers.pop((register.get('page', page), register['address']), None)
+
+    def forget_registers(self):
+        # the DUT may have been reset, none of its register bits is known
+        self.registers.clear()
+        self.page = None
+
+    def force_in_effect(self, signal, reference, value):
+        return self.forces.get(signal.upper()) == ((reference or 'GND').upper(), value)
+
+    def record_force(self, signal, reference, value):
+        self.forces[signal.upper()] = ((reference or 'GND').upper(), value)
+        if ivm6201_supply_check(signal):
+            self.forget_registers()
+
+    def release(self, signal):
+        self.forces.pop(signal.upper(), None)
+        if ivm6201_supply_check(signal):
+            self.forget_registers()
+
+    def apply(self, action):
+        """
+        Applies a setup action to the state, register actions are on the page of the state.
+
+        Returns:
+            bool: True if the action changes the state and has to run.
+        """
+        kind = action[0]
+        if kind == WRITE:
+            _, registers, value = action
+            needed = not self.write_in_effect(self.page, registers, value)
+            self.record_write(self.page, registers, value)
+            _, self.page = compile_register_write(registers, value, self.page)
+            return needed
+        if kind == FORCE:
+            needed = not self.force_in_effect(*action[1:])
+            if needed:
+                self.record_force(*action[1:])
+            return needed
+        if kind == RELEASE:
+            self.release(action[1])
+        elif kind == FORGET:
+            self.forget(self.page, action[1])
+        return False
+
+
+def test_actions(instructions, procedures_df, _stack=()):
+    """
+    Setup actions of a list of instructions, procedures included, in the order TestAnalyzer runs them.
+
+    Args:
+        instructions (str): Instructions, one per line.
+        procedures_df (pandas.DataFrame): The 'Procedure' sheet.
+
+    Returns:
+        list: The setup actions.
+    """
+    actions = []
+    for instruction in instructions.split('\n'):
+        instruction = instruction.strip()
+        if not instruction or re.match(r'"(?:[^\\"]|\\.)*"', instruction):
+            continue
+        if (procedure := parse_procedure_name(instruction)):
+            if (procedure in procedures_df.columns and procedure not in _stack
+                    and isinstance(procedures_df.loc[0, procedure], str)):
+                actions += test_actions(procedures_df.loc[0, procedure], procedures_df, _stack + (procedure,))
+        elif (register_data := parse_register_notation(instruction)) or (register_data := parse_symbolic_register_notation(instruction)):
+            actions.append((WRITE, register_data.get('registers', []), register_data.get('value', 0)))
+        elif (force_sweep := parse_force_sweep_instruction(instruction)):
+            actions.append((RELEASE, force_sweep.get('primary_signal', '')))
+        elif (force := parse_force_instruction(instruction)):
+            actions.append((FORCE, force.get('primary_signal'), force.get('secondary_signal'), force.get('absValue')))
+        elif (restore_data := parse_restore_instruction(instruction)):
+            actions.append((FORGET, restore_data.get('registers', [])))
+        elif (sweep_trig_store := parse_sweep_trig_store(instruction)):
+            actions.append((RELEASE, sweep_trig_store.get('sweep_signal', '')))
+    return actions
+
+
+def profile_tests(excel_file, sheet_name, test_names, program=None):
+    """
+    Works out the setup actions of tests of a sheet.
+
+    Args:
+        excel_file (str): Path to the Excel file.
+        sheet_name (str): Name of the sheet holding the tests.
+        test_names (list): Tests to profile.
+        program (workbook.TestProgram, optional): The sheet and the 'Procedure' sheet already loaded.
+
+    Returns:
+        list: TestProfile per test, in the order of test_names.
+    """
+    program = program or load_program(excel_file, [sheet_name, 'Procedure'])
+    procedures_df = program.sheets['Procedure']
+    raw_data = load_test_sheet(excel_file, sheet_name, program)
+    return [TestProfile(test_name, test_actions(raw_data.loc['Instructions', test_name], procedures_df))
+            for test_name in test_names]
+
+
+def run_actions(state, profile):
+    """
+    Applies the setup actions of a test to state.
+
+    Returns:
+        int: Number of setup actions of the test that have to run.
+    """
+    return sum(state.apply(action) for action in profile.actions)
+
+
+def transition_cost(state, profile):
+    """
+    Returns:
+        int: Number of setup actions of the test that have to run after state, state is not changed.
+    """
+    return run_actions(state.copy(), profile)
+
+
+def order_tests(profiles, dependencies=None):
+    """
+    Orders tests so that each one runs after the test leaving the DUT closest to its setup.
+
+    Greedy nearest neighbour: from the state left by the tests so far, the test with the fewest
+    setup actions still to run goes next, ties keep the original order.
+
+    Args:
+        profiles (list): TestProfile per test, in the original order.
+        dependencies (dict, optional): test name -> names of tests that have to run before it.
+
+    Returns:
+        list: The profiles in run order.
+    """
+    dependencies = dependencies or {}
+    names = {profile.name for profile in profiles}
+    remaining = list(profiles)
+    done = set()
+    state = SetupState()
+    order = []
+    while remaining:
+        ready = [profile for profile in remaining
+                 if all(name in done or name not in names for name in dependencies.get(profile.name, ()))]
+        if not ready:
+            print(f'!!!!! circular test dependencies, keeping the original order: {[profile.name for profile in remaining]}')
+            ready = remaining[:1]
+        best = min(ready, key=lambda profile: transition_cost(state, profile))
+        run_actions(state, best)
+        remaining.remove(best)
+        done.add(best.name)
+        order.append(best)
+    return order
+
+
+def sequence_cost(profiles, drop_redundant=True):
+    """
+    Returns:
+        int: Register writes and forces run by the tests in this order, all of them if drop_redundant is False.
+    """
+    if not drop_redundant:
+        return sum(action[0] in (WRITE, FORCE) for profile in profiles for action in profile.actions)
+    state = SetupState()
+    return sum(run_actions(state, profile) for profile in profiles)
+
+
+def run_sequence(excel_file, sheet_name, test_names, optimize=True, dependencies=None, record_result=None,
+                 record_measurement=None, dut=None):
+    """
+    Runs tests of a sheet on one DUT, in the order needing the fewest setup actions,
+    dropping the register writes and forces already in effect. A DUT that stops answering
+    fails its test and the remaining tests are not run.
+
+    Args:
+        excel_file (str): Path to the Excel file.
+        sheet_name (str): Name of the sheet holding the tests.
+        test_names (list): Tests to run.
+        optimize (bool): Reorder the tests, run them in the given order if False.
+        dependencies (dict, optional): test name -> names of tests that have to run before it.
+        record_result (callable, optional): Result recorder of the DUT, see ResultsDB.recorder.
+        record_measurement (callable, optional): Raw value recorder of the DUT, see ResultsDB.measurement_recorder.
+        dut (optional): I2C slave of the DUT, see common.open_dut, opened by the first test if not given.
+
+    Returns:
+        list: The TestAnalyzer of every test, in run order.
+    """
+    # the workbook is read once for the profiles and every test
+    program = load_program(excel_file, [sheet_name, 'Procedure'])
+    profiles = profile_tests(excel_file, sheet_name, test_names, program)
+    order = order_tests(profiles, dependencies) if optimize else profiles
+    print(f'test order: {", ".join(profile.name for profile in order)}')
+    print(f'setup actions: {sequence_cost(profiles, drop_redundant=False)} as written, {sequence_cost(order)} in this order')
+
+    setup_state = SetupState()
+    analyzers = []
+    for profile in order:
+        analyzer = TestAnalyzer(excel_file=excel_file, sheet_name=sheet_name, test_name=profile.name,
+                                dut=dut, setup_state=setup_state, record_result=record_result, program=program,
+                                record_measurement=record_measurement)
+        dut = analyzer.dut
+        analyzer.analyze_test()
+        analyzers.append(analyzer)
+        if analyzer.bus_error:
+            print(f'!!!!! DUT not answering, tests not run: {", ".join(profile.name for profile in order[len(analyzers):])}')
+            break
+    if (counters := I2C_recovery_counters(dut)).get('errors'):
+        print(f'I2C recovery: {counters}')
+    return analyzers
+
+
+def main():
+    """
+    Main function to print the optimized test order, or run it.
+    """
+    parser = argparse.ArgumentParser(description="Order tests to share their setup and run them.")
+    parser.add_argument("--excel_file", default="IVM6201_ATE_TM.xlsx", help="Path to the Excel file.")
+    parser.add_argument("--sheet_name", default="CP", help="Name of the sheet to read.")
+    parser.add_argument("--test_name", nargs='+', required=True, help="Tests to order.")
+    parser.add_argument("--run", action='store_true', help="Run the tests, only print the order otherwise.")
+    parser.add_argument("--journal", help="Record the I2C transactions of the run to this journal file.")
+    parser.add_argument("--replay", help="Replay the I2C transactions of this journal file, without hardware.")
+    args = parser.parse_args()
+
+    if args.run:
+        dut = open_dut(args.journal, args.replay) if args.journal or args.replay else None
+        run_sequence(args.excel_file, args.sheet_name, args.test_name, dut=dut)
+        return
+    profiles = profile_tests(args.excel_file, args.sheet_name, args.test_name)
+    order = order_tests(profiles)
+    for profile in order:
+        print(profile.name)
+    print(f'setup actions: {sequence_cost(profiles, drop_redundant=False)} as written, '
+          f'{sequence_cost(profiles)} in the given order, {sequence_cost(order)} reordered')
+
+
+if __name__ == "__main__":
+    main()
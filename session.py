@@ -0,0 +1,217 @@
+import argparse
+import os
+import time
+from common import (
+    read_yaml, get_device, get_slave, I2C_forget_page, I2C_forget_shadow, I2C_recovery_counters,
+)
+import common
+from bus_speed import SPEED_CONFIG_FILE, SimulatedAdapter, configured_speed
+from journal import Journal, JournalSlave, ReplaySlave
+from recovery import retry_policy
+from regmap import REGMAP_FILE, clear_regmap_caches
+from regdump import clear_dump_caches
+from sequencer import SetupState, holding_masks
+from test_analyzer import TestAnalyzer, load_test_sheet
+from workbook import load_program
+
+DUT_CONFIG_FILE = 'ivm6201.yaml'
+
+
+class FileWatcher:
+    """
+    Tells which of a set of files changed since the last check, from their modification time and size.
+    """
+
+    def __init__(self, paths):
+        self.stamps = {path: self._stamp(path) for path in paths}
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def changed(self):
+        """
+        Returns:
+            list: The files that changed, created or deleted since the last call.
+        """
+        changed = []
+        for path, stamp in self.stamps.items():
+            if (new_stamp := self._stamp(path)) != stamp:
+                self.stamps[path] = new_stamp
+                changed.append(path)
+        return changed
+
+
+class Session:
+    """
+    Long-lived test session: the MCP2221 stays open and the test program is only reloaded
+    when its files change. The reload is whole-program: the workbook is read and the test sheet
+    parsed again, every test runs from this parsed sheet without reading the workbook.
+
+    The setup in effect on the DUT is kept between runs, register writes and forces already
+    in effect are dropped as in sequencer.run_sequence, reset() forgets it.
+    """
+
+    def __init__(self, excel_file, sheet_name, simulate=False, journal=None, replay=None):
+        """
+        Args:
+            excel_file (str): Path to the Excel file.
+            sheet_name (str): Name of the sheet holding the tests.
+            simulate (bool): Run on a simulated DUT, also used when no MCP2221 is present.
+            journal (str, optional): Journal file the I2C transactions are recorded to.
+            replay (str, optional): Journal file replayed instead of a DUT, without hardware.
+        """
+        self.excel_file = excel_file
+        self.sheet_name = sheet_name
+        self.config = common.ivm6201_config
+        self.journal = Journal(journal) if journal else None
+        self.mcp = None if simulate or replay else self._open_device()
+        if replay:
+            print(f'replaying {replay}')
+            self.dut = ReplaySlave(replay, addr=self.config.Address)
+        elif self.mcp is None:
+            print('running on a simulated DUT')
+            self.mcp = SimulatedAdapter(usb_latency=0)
+            self.dut = self.mcp.I2C_Slave(self.config.Address)
+            self.dut = JournalSlave(self.dut, self.journal) if self.journal else self.dut
+        else:
+            self.dut = get_slave(device=self.mcp, address=self.config.Address, journal=self.journal)
+        self.watcher = FileWatcher([excel_file, DUT_CONFIG_FILE, REGMAP_FILE, SPEED_CONFIG_FILE])
+        self.setup_state = SetupState()
+        self.program = None
+        self.raw_data = None
+        self.test_names = []
+        self.load()
+
+    @staticmethod
+    def _open_device():
+        try:
+            return get_device(deviceNo=0)
+        except Exception as e:
+            print(f'!!!!!!!!!!!!!!!!!!!! fail :> MCP not present ({e})')
+            return None
+
+    def load(self):
+        """
+        Loads the test sheet and the procedures, the whole program at once.
+        """
+        program = load_program(self.excel_file, [self.sheet_name, 'Procedure'])
+        raw_data = load_test_sheet(self.excel_file, self.sheet_name, program)
+        self.program = program
+        self.raw_data = raw_data
+        self.test_names = [test_name for test_name in raw_data.columns
+                           if isinstance(test_name, str) and isinstance(raw_data.loc['Instructions', test_name], str)]
+
+    def reload(self):
+        """
+        Reloads what changed in the watched files.
+
+        Returns:
+            list: The files that changed.
+        """
+        changed = self.watcher.changed()
+        if DUT_CONFIG_FILE in changed:
+            self._reload_dut_config()
+        if SPEED_CONFIG_FILE in changed and hasattr(self.mcp, 'I2C_speed'):
+            self.mcp.I2C_speed(configured_speed())
+            print(f'{SPEED_CONFIG_FILE} changed, I2C speed {configured_speed() / 1e3:.0f}kHz')
+        if REGMAP_FILE in changed:
+            # symbolic register writes resolve to other registers, the bits that hold their value may change
+            clear_regmap_caches()
+            clear_dump_caches()
+            holding_masks.cache_clear()
+            print(f'{REGMAP_FILE} changed')
+        if self.excel_file in changed:
+            self.load()
+        return changed
+
+    def _reload_dut_config(self):
+        config = read_yaml(DUT_CONFIG_FILE).ivm6201
+        if config.Address != self.config.Address and self.mcp is not None and not isinstance(self.mcp, SimulatedAdapter):
+            self.dut = get_slave(device=self.mcp, address=config.Address, journal=self.journal)
+            self.reset()
+        elif hasattr(self.dut, 'policy'):
+            self.dut.policy = retry_policy(config.get('I2C_recovery'))
+        common.ivm6201_config = self.config = config
+        print(f'{DUT_CONFIG_FILE} changed')
+
+    def reset(self):
+        """
+        Forgets the setup, page and register values known of the DUT, after it was power cycled or reset.
+        """
+        self.setup_state = SetupState()
+        I2C_forget_page(self.dut)
+        I2C_forget_shadow(self.dut)
+
+    def run(self, test_names, record_result=None, record_measurement=None):
+        """
+        Runs tests on the open DUT, with the test program as last loaded. A DUT that stops answering
+        fails its test and the remaining tests are not run, the next run tries the DUT again.
+
+        Args:
+            test_names (list): Tests to run, in this order.
+            record_result (callable, optional): Result recorder, see ResultsDB.recorder.
+            record_measurement (callable, optional): Raw value recorder, see ResultsDB.measurement_recorder.
+
+        Returns:
+            list: The TestAnalyzer of every test.
+        """
+        analyzers = []
+        for test_name in test_names:
+            if test_name not in self.test_names:
+                print(f'!!!!! fail :> no test {test_name} in {self.sheet_name}')
+                continue
+            analyzer = TestAnalyzer(excel_file=self.excel_file, sheet_name=self.sheet_name, test_name=test_name,
+                                    dut=self.dut, setup_state=self.setup_state, program=self.program,
+                                    raw_data=self.raw_data, record_result=record_result, record_measurement=record_measurement)
+            analyzer.analyze_test()
+            analyzers.append(analyzer)
+            if analyzer.bus_error:
+                print(f'!!!!! DUT not answering, tests not run: {", ".join(test_names[test_names.index(test_name) + 1:])}')
+                break
+        return analyzers
+
+
+def main():
+    """
+    Main function to run tests in a session that reloads the workbook when it is edited.
+    """
+    parser = argparse.ArgumentParser(description="Rerun tests on demand, reloading the test program when its files change.")
+    parser.add_argument("--excel_file", default="IVM6201_ATE_TM.xlsx", help="Path to the Excel file.")
+    parser.add_argument("--sheet_name", default="CP", help="Name of the sheet to read.")
+    parser.add_argument("--test_name", nargs='*', default=[], help="Tests run on Enter.")
+    parser.add_argument("--simulate", action='store_true', help="Run on a simulated DUT.")
+    parser.add_argument("--journal", help="Record the I2C transactions to this journal file.")
+    parser.add_argument("--replay", help="Replay the I2C transactions of this journal file, without hardware.")
+    args = parser.parse_args()
+
+    session = Session(args.excel_file, args.sheet_name, simulate=args.simulate, journal=args.journal, replay=args.replay)
+    selected = args.test_name
+    print('Enter: reload and rerun, run <tests>: select and run, tests: list, reset: forget the DUT setup, quit')
+    while True:
+        command = input(f'{" ".join(selected) or "no test selected"} :> ').split()
+        if command[:1] == ['quit']:
+            break
+        if command[:1] == ['tests']:
+            print(' '.join(session.test_names))
+            continue
+        if command[:1] == ['reset']:
+            session.reset()
+            continue
+        if command[:1] == ['run']:
+            selected = command[1:] or selected
+        start = time.perf_counter()
+        if (changed := session.reload()):
+            print(f'reloaded: {" ".join(changed)}')
+        session.run(selected)
+        print(f'done in {time.perf_counter() - start:.3f}s')
+        if (counters := I2C_recovery_counters(session.dut)).get('errors'):
+            print(f'I2C recovery: {counters}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+from common import (
+    I2C_read_register_burst, I2C_write_register_burst, I2C_write_register, I2C_selected_page, I2C_shadow
+)
+from regmap import PAGE_SELECT_REGISTER
+
+
+def register_bit_range(register):
+    """
+    Bit range of a register dictionary inside its byte.
+
+    Args:
+        register (dict): Register dictionary with 'msb' and 'lsb', absolute bit positions (>= 8) allowed.
+
+    Returns:
+        tuple: (msb, lsb) in 0..7.
+    """
+    msb = register.get('msb', 7)
+    lsb = register.get('lsb', 0)
+    msb, lsb = max(msb, lsb), min(msb, lsb)
+    return (msb % 8, lsb % 8) if msb - lsb < 8 else (7, 0)
+
+
+def register_masks(registers):
+    """
+    Bit masks of the registers touched by a list of register dictionaries.
+
+    Args:
+        registers (list): Register dictionaries, 'address' as int or hex string.
+
+    Returns:
+        dict: address -> mask, bit ranges of the same address are merged.
+    """
+    masks = {}
+    for register in registers:
+        address = register.get('address')
+        address = int(address, 16) if isinstance(address, str) else address
+        msb, lsb = register_bit_range(register)
+        masks[address] = masks.get(address, 0) | (((1 << (msb - lsb + 1)) - 1) << lsb)
+    return masks
+
+
+def contiguous_runs(addresses):
+    """
+    Splits sorted addresses into runs of consecutive addresses.
+
+    Args:
+        addresses (iterable): Sorted, unique register addresses.
+
+    Returns:
+        list: (start_address, length) pairs.
+    """
+    runs = []
+    for address in addresses:
+        if runs and runs[-1][0] + runs[-1][1] == address:
+            runs[-1][1] += 1
+        else:
+            runs.append([address, 1])
+    return [tuple(run) for run in runs]
+
+
+class RegisterSnapshot:
+    """
+    Saved state of a set of registers of one page.
+
+    The register bytes are kept in a bytearray aligned with the sorted addresses,
+    together with the mask of the bits that belong to the snapshot.
+    """
+    __slots__ = ('page', 'addresses', 'data', 'masks', '_index')
+
+    def __init__(self, page, addresses, data, masks):
+        """
+        Args:
+            page (int or None): Page the registers were read from, None if unknown.
+            addresses (tuple): Sorted register addresses.
+            data (bytearray): Register bytes, one per address.
+            masks (bytearray): Bits of each byte that belong to the snapshot.
+        """
+        self.page = page
+        self.addresses = addresses
+        self.data = data
+        self.masks = masks
+        self._index = {address: index for index, address in enumerate(addresses)}
+
+    def __contains__(self, address):
+        return address in self._index
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def byte(self, address):
+        """
+        Returns:
+            int: Saved byte of the register at address.
+        """
+        return self.data[self._index[address]]
+
+    def mask(self, address):
+        """
+        Returns:
+            int: Bits of the register at address that belong to the snapshot.
+        """
+        return self.masks[self._index[address]]
+
+    def value(self, registers):
+        """
+        Combines saved bit fields into one value, MSB register first like I2C_read_multiple_registers.
+
+        Args:
+            registers (list): Register dictionaries, all part of the snapshot.
+
+        Returns:
+            int: The combined value.
+        """
+        value = 0
+        bitwidth_filled = 0
+        for register in registers[::-1]:
+            address = register.get('address')
+            address = int(address, 16) if isinstance(address, str) else address
+            msb, lsb = register_bit_range(register)
+            bits = (self.byte(address) >> lsb) & ((1 << (msb - lsb + 1)) - 1)
+            value |= bits << bitwidth_filled
+            bitwidth_filled += msb - lsb + 1
+        return value
+
+    def subset(self, addresses):
+        """
+        Returns:
+            RegisterSnapshot: A snapshot limited to the given addresses that are part of this one.
+        """
+        addresses = set(addresses)
+        kept = tuple(address for address in self.addresses if address in addresses)
+        return RegisterSnapshot(self.page, kept,
+                                bytearray(self.byte(address) for address in kept),
+                                bytearray(self.mask(address) for address in kept))
+
+
+def capture_snapshot(slave, registers):
+    """
+    Reads a set of registers of the selected page, one burst per run of consecutive addresses.
+
+    Args:
+        slave: I2C slave of the DUT.
+        registers (list): Register dictionaries to save, bit ranges limit what is restored later.
+
+    Returns:
+        RegisterSnapshot or None: None if the slave is missing or a read fails.
+    """
+    if not slave:
+        return None
+    masks = register_masks(registers)
+    addresses = tuple(sorted(masks))
+    data = bytearray()
+    for start, length in contiguous_runs(addresses):
+        burst = I2C_read_register_burst(slave, start, length)
+        if burst is None or len(burst) != length:
+            print(f'!!!!!!!!!! fail snapshot read of {length} registers from {hex(start)}')
+            return None
+        data += burst
+    return RegisterSnapshot(I2C_selected_page(slave), addresses, data,
+                            bytearray(masks[address] for address in addresses))
+
+
+def diff_snapshot(slave, snapshot):
+    """
+    Compares a snapshot with the shadow of the slave registers, without any bus traffic.
+
+    Args:
+        slave: I2C slave of the DUT.
+        snapshot (RegisterSnapshot): Saved register state.
+
+    Returns:
+        list: (address, saved_byte, current_byte) for every register whose saved bits differ
+              from the shadow, current_byte is None when the shadow does not know the register.
+    """
+    shadow = I2C_shadow(slave)
+    differences = []
+    for address, saved, mask in zip(snapshot.addresses, snapshot.data, snapshot.masks):
+        current = shadow.get((snapshot.page, address))
+        if current is None or (current ^ saved) & mask:
+            differences.append((address, saved, current))
+    return differences
+
+
+def restore_snapshot(slave, snapshot, addresses=None):
+    """
+    Writes back the registers of a snapshot that changed since it was taken.
+
+    Only the registers that differ from the shadow are written, in bursts of consecutive
+    addresses. Registers the shadow does not know, and that are only partly covered by
+    the snapshot, are read first so the bits outside the snapshot are kept.
+
+    Args:
+        slave: I2C slave of the DUT.
+        snapshot (RegisterSnapshot): Saved register state.
+        addresses (iterable, optional): Restore only these addresses of the snapshot.
+
+    Returns:
+        int or None: Number of registers written, None if the slave is missing or a read fails.
+    """
+    if not slave:
+        return None
+    if addresses is not None:
+        snapshot = snapshot.subset(addresses)
+    if snapshot.page is not None:
+        I2C_write_register(slave, PAGE_SELECT_REGISTER, snapshot.page)
+
+    differences = diff_snapshot(slave, snapshot)
+    # partly covered registers the shadow does not know are read, the other bits must be kept
+    unknown = [address for address, _, current in differences if current is None and snapshot.mask(address) != 0xFF]
+    current_bytes = {}
+    for start, length in contiguous_runs(unknown):
+        if (burst := I2C_read_register_burst(slave, start, length)) is None:
+            print(f'!!!!!!!!!! fail snapshot read of {length} registers from {hex(start)}')
+            return None
+        current_bytes.update(zip(range(start, start + length), burst))
+
+    restored = {}
+    for address, saved, current in differences:
+        mask = snapshot.mask(address)
+        if current is None and address in current_bytes:
+            current = current_bytes[address]
+            if not (current ^ saved) & mask:
+                continue
+        restored[address] = ((current or 0) & ~mask & 0xFF) | (saved & mask)
+
+    for start, length in contiguous_runs(sorted(restored)):
+        I2C_write_register_burst(slave, start, bytes(restored[start + offset] for offset in range(length)))
+    return len(restored)
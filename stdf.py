@@ -0,0 +1,297 @@
+import argparse
+import math
+import struct
+import time
+from results import RESULTS_FILE, ResultsDB
+
+STDF_FILE = 'results.stdf'
+# write buffer of the exporter, the file grows record by record whatever the size of the lot
+WRITE_BUFFER_SIZE = 1 << 16
+
+# STDF V4 data types, little endian (CPU_TYPE 2)
+_STRUCT_TYPES = {'U1': 'B', 'U2': 'H', 'U4': 'I', 'I1': 'b', 'I2': 'h', 'R4': 'f', 'B1': 'B'}
+_MISSING = {'U1': 0, 'U2': 0, 'U4': 0, 'I1': 0, 'I2': -32768, 'R4': 0.0, 'B1': 0, 'C1': ' ', 'Cn': '', 'Bn': b''}
+
+# (REC_TYP, REC_SUB) -> record name and fields, the subset of STDF V4 written by the exporter
+RECORDS = {
+    (0, 10): ('FAR', [('CPU_TYPE', 'U1'), ('STDF_VER', 'U1')]),
+    (1, 10): ('MIR', [('SETUP_T', 'U4'), ('START_T', 'U4'), ('STAT_NUM', 'U1'), ('MODE_COD', 'C1'),
+                      ('RTST_COD', 'C1'), ('PROT_COD', 'C1'), ('BURN_TIM', 'U2'), ('CMOD_COD', 'C1'),
+                      ('LOT_ID', 'Cn'), ('PART_TYP', 'Cn'), ('NODE_NAM', 'Cn'), ('TSTR_TYP', 'Cn'),
+                      ('JOB_NAM', 'Cn')]),
+    (1, 20): ('MRR', [('FINISH_T', 'U4'), ('DISP_COD', 'C1'), ('USR_DESC', 'Cn'), ('EXC_DESC', 'Cn')]),
+    (2, 10): ('WIR', [('HEAD_NUM', 'U1'), ('SITE_GRP', 'U1'), ('START_T', 'U4'), ('WAFER_ID', 'Cn')]),
+    (2, 20): ('WRR', [('HEAD_NUM', 'U1'), ('SITE_GRP', 'U1'), ('FINISH_T', 'U4'), ('PART_CNT', 'U4'),
+                      ('RTST_CNT', 'U4'), ('ABRT_CNT', 'U4'), ('GOOD_CNT', 'U4'), ('FUNC_CNT', 'U4'),
+                      ('WAFER_ID', 'Cn')]),
+    (5, 10): ('PIR', [('HEAD_NUM', 'U1'), ('SITE_NUM', 'U1')]),
+    (5, 20): ('PRR', [('HEAD_NUM', 'U1'), ('SITE_NUM', 'U1'), ('PART_FLG', 'B1'), ('NUM_TEST', 'U2'),
+                      ('HARD_BIN', 'U2'), ('SOFT_BIN', 'U2'), ('X_COORD', 'I2'), ('Y_COORD', 'I2'),
+                      ('TEST_T', 'U4'), ('PART_ID', 'Cn'), ('PART_TXT', 'Cn'), ('PART_FIX', 'Bn')]),
+    (10, 30): ('TSR', [('HEAD_NUM', 'U1'), ('SITE_NUM', 'U1'), ('TEST_TYP', 'C1'), ('TEST_NUM', 'U4'),
+                       ('EXEC_CNT', 'U4'), ('FAIL_CNT', 'U4'), ('ALRM_CNT', 'U4'), ('TEST_NAM', 'Cn'),
+                       ('SEQ_NAM', 'Cn'), ('TEST_LBL', 'Cn'), ('OPT_FLAG', 'B1'), ('TEST_TIM', 'R4'),
+                       ('TEST_MIN', 'R4'), ('TEST_MAX', 'R4'), ('TST_SUMS', 'R4'), ('TST_SQRS', 'R4')]),
+    (15, 10): ('PTR', [('TEST_NUM', 'U4'), ('HEAD_NUM', 'U1'), ('SITE_NUM', 'U1'), ('TEST_FLG', 'B1'),
+                       ('PARM_FLG', 'B1'), ('RESULT', 'R4'), ('TEST_TXT', 'Cn'), ('ALARM_ID', 'Cn'),
+                       ('OPT_FLAG', 'B1'), ('RES_SCAL', 'I1'), ('LLM_SCAL', 'I1'), ('HLM_SCAL', 'I1'),
+                       ('LO_LIMIT', 'R4'), ('HI_LIMIT', 'R4'), ('UNITS', 'Cn')]),
+}
+RECORD_TYPES = {name: record_type for record_type, (name, _) in RECORDS.items()}
+
+# PTR TEST_FLG bits
+TEST_FAILED = 0x80
+TEST_NO_PASS_FAIL = 0x40
+# PTR OPT_FLAG bits: scaling fields invalid, no low limit, no high limit
+PTR_SCALING_INVALID = 0x01 | 0x04 | 0x08
+PTR_NO_LOW_LIMIT = 0x40
+PTR_NO_HIGH_LIMIT = 0x80
+# PRR PART_FLG bit of a failed part
+PART_FAILED = 0x08
+PASS_BIN = 1
+FAIL_BIN = 2
+
+
+def pack_record(name, **fields):
+    """
+    Packs one STDF V4 record, fields not given get their missing value.
+
+    Args:
+        name (str): Record name, 'PTR', 'PRR', ...
+        **fields: Field values by STDF field name.
+
+    Returns:
+        bytes: The record with its header.
+    """
+    record_type, record_sub = RECORD_TYPES[name]
+    body = bytearray()
+    for field, data_type in RECORDS[(record_type, record_sub)][1]:
+        value = fields.get(field, _MISSING[data_type])
+        if data_type == 'Cn':
+            encoded = str(value).encode()[:255]
+            body += bytes([len(encoded)]) + encoded
+        elif data_type == 'Bn':
+            body += bytes([len(value)]) + bytes(value[:255])
+        elif data_type == 'C1':
+            body += str(value).encode()[:1] or b' '
+        else:
+            body += struct.pack('<' + _STRUCT_TYPES[data_type], value)
+    return struct.pack('<HBB', len(body), record_type, record_sub) + body
+
+
+def unpack_record(record_type, record_sub, body):
+    """
+    Unpacks the body of a record, fields missing at the end of the record are left out.
+
+    Returns:
+        tuple: (name, fields) the record name and a dict of its fields, name None and
+               fields {'data': body} for record types this module does not know.
+    """
+    if (record_type, record_sub) not in RECORDS:
+        return None, {'data': body}
+    name, specification = RECORDS[(record_type, record_sub)]
+    fields = {}
+    offset = 0
+    for field, data_type in specification:
+        if offset >= len(body):
+            break
+        if data_type in ('Cn', 'Bn'):
+            length = body[offset]
+            value = body[offset + 1:offset + 1 + length]
+            fields[field] = value.decode(errors='replace') if data_type == 'Cn' else bytes(value)
+            offset += 1 + length
+        elif data_type == 'C1':
+            fields[field] = body[offset:offset + 1].decode(errors='replace')
+            offset += 1
+        else:
+            fields[field], = struct.unpack_from('<' + _STRUCT_TYPES[data_type], body, offset)
+            offset += struct.calcsize(_STRUCT_TYPES[data_type])
+    return name, fields
+
+
+def read_records(source):
+    """
+    Reads the records of an STDF V4 file one at a time.
+
+    Args:
+        source (str or file): Path or binary file.
+
+    Yields:
+        tuple: (name, fields) per record, see unpack_record.
+    """
+    file = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        while header := file.read(4):
+            if len(header) < 4:
+                raise ValueError('truncated STDF record header')
+            length, record_type, record_sub = struct.unpack('<HBB', header)
+            body = file.read(length)
+            if len(body) < length:
+                raise ValueError(f'truncated STDF record {record_type}/{record_sub}')
+            yield unpack_record(record_type, record_sub, body)
+    finally:
+        if file is not source:
+            file.close()
+
+
+class StdfWriter:
+    """
+    Writes STDF V4 records through a buffered file, starting with the FAR record.
+    """
+
+    def __init__(self, target, buffer_size=WRITE_BUFFER_SIZE):
+        """
+        Args:
+            target (str or file): Path or binary file.
+            buffer_size (int): Write buffer size in bytes.
+        """
+        self._owned = isinstance(target, str)
+        self.file = open(target, 'wb', buffering=buffer_size) if self._owned else target
+        self.write('FAR', CPU_TYPE=2, STDF_VER=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, name, **fields):
+        self.file.write(pack_record(name, **fields))
+
+    def ptr(self, test_num, test_txt, result, low=None, high=None, units='', passed=None, head=1, site=1):
+        """
+        Writes the parametric result of a test.
+
+        Args:
+            test_num (int): Test number.
+            test_txt (str): Test name, with the variable of the value, see test_text.
+            result (float): Measured value.
+            low (float, optional): Low limit.
+            high (float, optional): High limit.
+            units (str): Unit of the value.
+            passed (bool, optional): Limit check result, None if not checked.
+        """
+        test_flag = TEST_NO_PASS_FAIL if passed is None else (0 if passed else TEST_FAILED)
+        option_flag = PTR_SCALING_INVALID
+        if low is None or math.isnan(low):
+            option_flag |= PTR_NO_LOW_LIMIT
+            low = 0.0
+        if high is None or math.isnan(high):
+            option_flag |= PTR_NO_HIGH_LIMIT
+            high = 0.0
+        self.write('PTR', TEST_NUM=test_num, HEAD_NUM=head, SITE_NUM=site, TEST_FLG=test_flag,
+                   RESULT=float('nan') if result is None else result, TEST_TXT=test_txt, OPT_FLAG=option_flag,
+                   LO_LIMIT=low, HI_LIMIT=high, UNITS=units)
+
+    def close(self):
+        self.file.flush()
+        if self._owned:
+            self.file.close()
+
+
+def test_text(test, variable):
+    # results recorded without their variable keep the bare test name
+    return f'{test}:{variable}' if variable else test
+
+
+def export_results(results, target, lot, wafer=None, part_type='IVM6201', job_name=''):
+    """
+    Exports the results of a lot to STDF V4, streaming them DUT by DUT.
+
+    Only the DUT being written and one summary per test are held in memory. Every limit checked
+    value of a test is an STDF test of its own, named test:variable, numbered in the order they first
+    appear. A DUT passes when none of its limit checked results failed.
+
+    Args:
+        results (ResultsDB): Results database.
+        target (str or file): Path or binary file of the STDF file.
+        lot (str): Lot to export.
+        wafer (str, optional): Wafer to export, all wafers of the lot if None.
+        part_type (str): Part type of the MIR record.
+        job_name (str): Test program name of the MIR record.
+
+    Returns:
+        dict: Counts of the exported 'parts', 'good' parts and 'results'.
+    """
+    test_numbers = {}
+    summaries = {}  # (test, variable) -> [executed, failed, min, max, sum, sum of squares]
+    counts = {'parts': 0, 'good': 0, 'results': 0}
+    wafer_counts = {}
+    start = int(time.time())
+
+    def end_part(writer, part, passed, tests):
+        writer.write('PRR', HEAD_NUM=1, SITE_NUM=1, PART_FLG=0 if passed else PART_FAILED, NUM_TEST=tests,
+                     HARD_BIN=PASS_BIN if passed else FAIL_BIN, SOFT_BIN=PASS_BIN if passed else FAIL_BIN,
+                     PART_ID=part[2])
+        counts['parts'] += 1
+        counts['good'] += bool(passed)
+        wafer_count = wafer_counts.setdefault(part[1], [0, 0])
+        wafer_count[0] += 1
+        wafer_count[1] += bool(passed)
+
+    def end_wafer(writer, wafer_id):
+        if wafer_id:
+            parts, good = wafer_counts.get(wafer_id, (0, 0))
+            writer.write('WRR', HEAD_NUM=1, SITE_GRP=255, FINISH_T=int(time.time()), PART_CNT=parts,
+                         GOOD_CNT=good, WAFER_ID=wafer_id)
+
+    with StdfWriter(target) as writer:
+        writer.write('MIR', SETUP_T=start, START_T=start, STAT_NUM=1, MODE_COD='P', LOT_ID=lot,
+                     PART_TYP=part_type, JOB_NAM=job_name)
+        part = None
+        part_passed, part_tests = True, 0
+        for lot_id, wafer_id, dut, test, variable, value, low, high, unit, passed in results.iter_results(
+                lot, wafer, columns=('lot', 'wafer', 'dut', 'test', 'variable', 'value', 'low', 'high', 'unit', 'passed')):
+            if (lot_id, wafer_id, dut) != part:
+                if part is not None:
+                    end_part(writer, part, part_passed, part_tests)
+                if part is None or wafer_id != part[1]:
+                    if part is not None:
+                        end_wafer(writer, part[1])
+                    if wafer_id:
+                        writer.write('WIR', HEAD_NUM=1, SITE_GRP=255, START_T=int(time.time()), WAFER_ID=wafer_id)
+                part = (lot_id, wafer_id, dut)
+                part_passed, part_tests = True, 0
+                writer.write('PIR', HEAD_NUM=1, SITE_NUM=1)
+            test_number = test_numbers.setdefault((test, variable), len(test_numbers) + 1)
+            writer.ptr(test_number, test_text(test, variable), value, low, high, unit, None if passed is None else bool(passed))
+            part_tests += 1
+            part_passed = part_passed and passed != 0
+            counts['results'] += 1
+            if value is not None:
+                summary = summaries.setdefault((test, variable), [0, 0, math.inf, -math.inf, 0.0, 0.0])
+                summary[0] += 1
+                summary[1] += passed == 0
+                summary[2] = min(summary[2], value)
+                summary[3] = max(summary[3], value)
+                summary[4] += value
+                summary[5] += value * value
+        if part is not None:
+            end_part(writer, part, part_passed, part_tests)
+            end_wafer(writer, part[1])
+        for key, (executed, failed, minimum, maximum, total, squares) in summaries.items():
+            writer.write('TSR', HEAD_NUM=255, SITE_NUM=1, TEST_TYP='P', TEST_NUM=test_numbers[key],
+                         EXEC_CNT=executed, FAIL_CNT=failed, TEST_NAM=test_text(*key), OPT_FLAG=0x04,
+                         TEST_MIN=minimum, TEST_MAX=maximum, TST_SUMS=total, TST_SQRS=squares)
+        writer.write('MRR', FINISH_T=int(time.time()))
+    return counts
+
+
+def main():
+    """
+    Main function to export a lot of the results database to STDF.
+    """
+    parser = argparse.ArgumentParser(description="Export a lot of the results database to STDF V4.")
+    parser.add_argument("--db", default=RESULTS_FILE, help="Path of the results database.")
+    parser.add_argument("--lot", required=True, help="Lot to export.")
+    parser.add_argument("--wafer", help="Wafer to export, all wafers of the lot by default.")
+    parser.add_argument("--output", default=STDF_FILE, help="Path of the STDF file.")
+    args = parser.parse_args()
+
+    with ResultsDB(args.db) as results:
+        counts = export_results(results, args.output, args.lot, args.wafer)
+    print(f"{counts['parts']} parts ({counts['good']} good), {counts['results']} results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import math
+import time
+from collections import namedtuple
+import numpy as np
+
+LINEAR = 'linear'
+LOG = 'log'
+
+# Points visited by Sweep.run, values and measurements are views on the preallocated arrays
+SweepResult = namedtuple('SweepResult', ['values', 'measurements', 'count', 'trigger_index'])
+
+
+def sweep_point_count(initial_value, final_value, step_size):
+    """
+    Number of points a sweep from initial_value to final_value visits, end points included.
+
+    Args:
+        initial_value (float): Start of the sweep.
+        final_value (float): End of the sweep.
+        step_size (float or None): Step between points, the sign is ignored.
+
+    Returns:
+        int: Number of sweep points, 0 if the range is not defined.
+    """
+    if initial_value is None or final_value is None:
+        return 0
+    if not step_size:
+        return 1 if initial_value == final_value else 2
+    # small epsilon so 2V/10mV gives 200 steps and not 199.99999
+    return int(abs(final_value - initial_value) / abs(step_size) + 1e-9) + 1
+
+
+class Sweep:
+    """
+    Sweep from an initial to a final value, the points are computed when they are visited.
+
+    The sweep runs up or down following initial and final value, the sign of the step is
+    ignored. Linear sweeps step by step_size and stop at the last point not past the final
+    value. Logarithmic sweeps visit the same number of points spaced by a constant ratio.
+    """
+
+    def __init__(self, initial_value, final_value, step_size=None, sweep_time=None, spacing=LINEAR, points=None):
+        """
+        Args:
+            initial_value (float): Start of the sweep.
+            final_value (float): End of the sweep.
+            step_size (float, optional): Step between points, 2 points (the ends) if not given.
+            sweep_time (float, optional): Time spent on each point in seconds.
+            spacing (str): LINEAR or LOG.
+            points (int, optional): Number of points, overrides step_size.
+        """
+        if spacing not in (LINEAR, LOG):
+            raise ValueError(f"unknown sweep spacing {spacing}")
+        if spacing == LOG and (initial_value * final_value <= 0):
+            raise ValueError(f"log sweep needs both ends on the same side of 0: {initial_value} -> {final_value}")
+        self.initial_value = float(initial_value)
+        self.final_value = float(final_value)
+        self.sweep_time = sweep_time or 0
+        self.spacing = spacing
+        self.points = int(points) if points else sweep_point_count(initial_value, final_value, step_size)
+        direction = 1 if final_value >= initial_value else -1
+        if points or not step_size:
+            self.step_size = (self.final_value - self.initial_value) / (self.points - 1) if self.points > 1 else 0.0
+        else:
+            self.step_size = direction * abs(float(step_size))
+
+    @classmethod
+    def from_force_sweep(cls, force_sweep, spacing=LINEAR):
+        """
+        Builds the sweep of a parse_force_sweep_instruction result.
+        """
+        def value(key):
+            return (force_sweep.get(key) or {}).get('final_value')
+        return cls(value('initial_value'), value('final_value'), value('step_size'), value('sweep_time'), spacing)
+
+    @classmethod
+    def from_sweep_trig_store(cls, sweep_trig_store, spacing=LINEAR):
+        """
+        Builds the sweep of a parse_sweep_trig_store result.
+        """
+        return cls(sweep_trig_store.get('initial_value'), sweep_trig_store.get('final_value'),
+                   sweep_trig_store.get('step_size'), sweep_trig_store.get('sweep_time'), spacing)
+
+    def __len__(self):
+        return self.points
+
+    def __getitem__(self, index):
+        """
+        Returns:
+            float: Value of the sweep point index, computed from the index so steps do not accumulate errors.
+        """
+        if not 0 <= index < self.points:
+            raise IndexError(index)
+        if self.spacing == LOG and self.points > 1:
+            return self.initial_value * (self.final_value / self.initial_value) ** (index / (self.points - 1))
+        return self.initial_value + index * self.step_size
+
+    def __iter__(self):
+        for index in range(self.points):
+            yield self[index]
+
+    def __repr__(self):
+        return (f"Sweep({self.initial_value} -> {self.final_value}, {self.points} points, "
+                f"{self.spacing}, {self.sweep_time}s per point)")
+
+    def run(self, force, measure=None, trigger=None, clock=time.perf_counter, sleep=time.sleep):
+        """
+        Forces every point of the sweep and measures it at the end of its sweep_time slot.
+
+        The slots are counted from the start of the sweep, so the time spent forcing and measuring
+        does not add up over long sweeps. Measurements go into a preallocated array.
+
+        Args:
+            force (callable): force(value), applies a sweep point.
+            measure (callable, optional): measure() -> float, read after each point.
+            trigger (callable, optional): trigger(value, measurement) -> bool, stops the sweep when True.
+            clock (callable): Time source in seconds.
+            sleep (callable): Sleep function in seconds.
+
+        Returns:
+            SweepResult: Values and measurements of the visited points, the number of points
+                         and the index of the point that fired the trigger (None if it did not).
+        """
+        values = np.full(self.points, np.nan)
+        measurements = np.full(self.points, np.nan)
+        trigger_index = None
+        count = 0
+        start = clock()
+        for index, value in enumerate(self):
+            force(value)
+            values[index] = value
+            # each point settles until the end of its sweep_time slot before it is measured
+            if self.sweep_time and (remaining := start + (index + 1) * self.sweep_time - clock()) > 0:
+                sleep(remaining)
+            measurement = measure() if measure else math.nan
+            measurements[index] = measurement
+            count = index + 1
+            if trigger and trigger(value, measurement):
+                trigger_index = index
+                break
+        return SweepResult(values[:count], measurements[:count], count, trigger_index)
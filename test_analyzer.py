@@ -2,11 +2,11 @@ import pandas as pd
 import argparse
 import re
 import warnings
-import time
 import random
 from dft import (
     parse_procedure_name,
     parse_wait_delay,
+    parse_wait_until,
     parse_constant_value,
     parse_register_notation,
     parse_force_sweep_instruction,
@@ -19,14 +19,26 @@ from dft import (
     parse_calculate_expression,
     parse_sweep_trig_store,
     parse_multiplier_value,
+    parse_limit_rows,
     solve_formula,  # Import solve_formula
     parse_read_instruction,
-    parse_restore_instruction
+    parse_restore_instruction,
+    parse_save_instruction,
+    parse_copy_instruction
 )
 from common import (
     ivm6201_pin_check, get_device, get_slave, I2C_read_register,I2C_write_register, ivm6201_config, I2C_read_multiple_registers,
-    I2C_write_multiple_registers
+    I2C_write_multiple_registers, I2C_selected_page, I2C_forget_page, I2C_forget_shadow, ivm6201_supply_check,
+    I2C_recovery_counters, open_dut
 )
+from recovery import I2CBusError
+from regmap import parse_symbolic_register_notation, compile_register_write, resolve_symbol, PAGE_SELECT_REGISTER
+from snapshot import capture_snapshot, restore_snapshot, register_masks
+from sweep import Sweep
+from trigger import TriggerDetector, LINEAR_SEARCH, BISECT_SEARCH, find_trigger, register_probe
+from poll import wait_until
+from scheduler import DelayScheduler, precise_sleep
+from variables import VariableStore
 
 warnings.filterwarnings('ignore')
 
@@ -36,6 +48,9 @@ class DFT_Actions:
     Encapsulates actions performed based on parsed DFT instructions.
     """
 
+    def __init__(self):
+        self.scheduler = DelayScheduler()  # Wait__delay__ deadlines, counted from the last action
+
     def dft_force_action(self, force_dict):
         """
         Simulates a 'force' action by prompting the user to apply a specific force.
@@ -53,14 +68,14 @@ class DFT_Actions:
 
     def dft_delay_action(self, delay_dict):
         """
-        Introduces a delay in execution.
+        Schedules a delay, it is waited out before the next action.
 
         Args:
             delay_dict (dict): A dictionary containing the parameters of the delay action,
                                  such as absolute value in seconds.
         """
         absValue = delay_dict.get('absValue')
-        time.sleep(absValue)
+        self.scheduler.delay(absValue)
 
     def dft_savemeas_action(self, savemeas_dict):
         """
@@ -123,24 +138,92 @@ class DFT_Actions:
                 return value  # Return the float value
             except ValueError:
                 print("Invalid input. Please enter a number.")
-    def dft_force_sweep(self,force_sweep:dict):
-        {'primary_signal': 'AVDD', 'secondary_signal': 'GND', 'initial_value': {'raw_value': 14.0, 'multiplier': 1, 'unit': 'V', 'final_value': 14.0, 'multiplier_prefix': ''}, 'final_value': {'raw_value': 5.0, 'multiplier': 1, 'unit': 'V', 'final_value': 5.0, 'multiplier_prefix': ''}, 'step_size': {'raw_value': 1.0, 'multiplier': 1, 'unit': 'V', 'final_value': 1.0, 'multiplier_prefix': ''}, 'sweep_time': None}
-        primary_signal = force_sweep.get('primary_signal','')
-        secondary_signal = force_sweep.get('secondary_signal','')
-        initial_value = initial_value.get('final_value',0) if (initial_value := force_sweep.get('initial_value',None)) else 0
-        unit = unit.get('unit',0) if (unit := force_sweep.get('initial_value',None)) else 0
-        final_value = final_value.get('final_value',0) if (final_value := force_sweep.get('final_value',None)) else 0
-        step_size = step_size.get('final_value',0) if (step_size := force_sweep.get('step_size',None)) else 0
-        sweep_time = sweep_time.get('final_value',0) if (sweep_time := force_sweep.get('sweep_time',None)) else 0
-
-        input(f' Force Sweep {unit}, { primary_signal} w.r.t {secondary_signal} : initial value {initial_value} final value : {final_value} step size : {step_size} sweeptime: {sweep_time}S :>')
+    def dft_measure(self, signal, reference, unit=''):
+        """
+        Reads one sample of a signal, the operator measures it on the bench.
+
+        Args:
+            signal (str): Measured signal.
+            reference (str): Reference of the measured signal.
+            unit (str): Unit of the sample, '' for a logic level.
+
+        Returns:
+            float: The value entered by the user.
+        """
+        prompt_string = f'Measure {signal} wrt {reference} {unit if unit else "(logic level 0/1)"} :>'
+        while True:
+            try:
+                return float(input(prompt_string))
+            except ValueError:
+                print("Invalid input. Please enter a number.")
+
+    def dft_force(self, signal, reference, value, unit):
+        """
+        Applies one value on a signal, the operator applies it on the bench.
+
+        Args:
+            signal (str): Forced signal.
+            reference (str): Reference of the forced signal.
+            value (float): Value in base units.
+            unit (str): Unit of the value.
+        """
+        input(f'Force {signal} with respect to {reference} --> {value}{unit} :>')
+
+    def dft_force_sweep(self, force_sweep: dict, measure=None, trigger=None):
+        """
+        Sweeps a signal point by point from the initial to the final value of a force sweep.
+
+        Args:
+            force_sweep (dict): Result of parse_force_sweep_instruction.
+            measure (callable, optional): measure() -> float, read on every point.
+            trigger (callable, optional): trigger(value, measurement) -> bool, stops the sweep when True.
+
+        Returns:
+            SweepResult or None: The visited points, None if the sweep range is missing.
+        """
+        primary_signal = force_sweep.get('primary_signal', '')
+        secondary_signal = force_sweep.get('secondary_signal') or 'GND'
+        unit = unit.get('unit', '') if (unit := force_sweep.get('initial_value', None)) else ''
+        try:
+            sweep = Sweep.from_force_sweep(force_sweep)
+        except (TypeError, ValueError) as error:
+            print(f'!!!!! force sweep fail {primary_signal}: {error}')
+            return None
+
+        print(f' Force Sweep {unit}, {primary_signal} w.r.t {secondary_signal} : {sweep}')
+        return sweep.run(lambda value: self.dft_force(primary_signal, secondary_signal, value, unit), measure, trigger,
+                         sleep=precise_sleep)
+
+
+def load_test_sheet(excel_file, sheet_name, program=None):
+    """
+    Loads a test sheet of the ATE workbook and indexes it by parameter row.
+
+    Args:
+        excel_file (str): Path to the Excel file.
+        sheet_name (str): Name of the sheet to read.
+        program (workbook.TestProgram, optional): Sheets already loaded, the file is read if not given.
+
+    Returns:
+        pandas.DataFrame: The sheet with one column per test and the 'Typ', 'Min' and 'Max' rows parsed.
+    """
+    df = program.sheets[sheet_name] if program else pd.read_excel(excel_file, sheet_name=sheet_name)
+    raw_data = df.iloc[:, :].copy()
+    raw_data.columns = [x.strip().replace(' ', '_') if isinstance(x, str) else x for x in
+                        raw_data.iloc[3].tolist()]
+    raw_data.set_index(raw_data.columns[0], inplace=True)
+
+    # Parse the 'Typ', 'Min', and 'Max' rows in one pass
+    return parse_limit_rows(raw_data)
+
 
 class TestAnalyzer:
     """
     Analyzes test procedures defined in an Excel file.
     """
 
-    def __init__(self, excel_file, sheet_name, test_name):
+    def __init__(self, excel_file, sheet_name, test_name, dut=None, setup_state=None, record_result=None, program=None,
+                 record_measurement=None, raw_data=None, trigger_search=LINEAR_SEARCH):
         """
         Initializes the TestAnalyzer with the Excel file, sheet name, and test name.
 
@@ -148,20 +231,41 @@ class TestAnalyzer:
             excel_file (str): Path to the Excel file.
             sheet_name (str): Name of the sheet to read.
             test_name (str): Name of the test to analyze.
+            dut (optional): I2C slave of the DUT shared with the tests run before, opened if not given.
+            setup_state (sequencer.SetupState, optional): Setup in effect on the DUT, register writes
+                                                          and forces already in effect are dropped.
+            record_result (callable, optional): record(test, value, low, high, unit, passed, variable) called with every
+                                                limit checked value, see ResultsDB.recorder.
+            program (workbook.TestProgram, optional): The test sheet and the 'Procedure' sheet already loaded,
+                                                      read from excel_file if not given.
+            record_measurement (callable, optional): record(test, variable, value) called with every value measured
+                                                     or read from the DUT, see ResultsDB.measurement_recorder.
+            raw_data (pandas.DataFrame, optional): The test sheet already parsed by load_test_sheet,
+                                                   shared by the tests of a session, parsed if not given.
+            trigger_search (str): Search of Sweep__Trig__Store, trigger.LINEAR_SEARCH or BISECT_SEARCH
+                                  for triggers that change once along the sweep.
         """
         self.dut_config = ivm6201_config
-        self.mcp = get_device(deviceNo=0)
-        self.dut = get_slave(device=self.mcp,address=self.dut_config.Address) if self.mcp else None
+        self.mcp = None if dut else get_device(deviceNo=0)
+        self.dut = dut or (get_slave(device=self.mcp,address=self.dut_config.Address) if self.mcp else None)
+        self.setup_state = setup_state
+        self.record_result = record_result
+        self.record_measurement = record_measurement
         self.excel_file = excel_file
         self.sheet_name = sheet_name
         self.test_name = test_name
-        self.Vars = {}  # Dictionary to store variables and their values
-        self.Const = {}  # Dictionary to store constants and their values
+        self.program = program
+        self.Vars = VariableStore()  # Variables of the test and their values
+        self.Const = VariableStore(parent=self.Vars)  # Constants, overlaying the variables as formulas see them
+        self.snapshots = {}  # Register snapshots taken by Save__, by save variable
         self.trim_reg_data = None
         self.savemeas_data = None
+        self.pending_sweep = None  # Force__Sweep waiting for the Trigger__ or Meas__Match__ written after it
+        self.bus_error = None  # I2CBusError that stopped the test, the DUT no longer answers
+        self.trigger_search = trigger_search
         random.seed(353)
-        self.procedures_df = pd.read_excel(self.excel_file, sheet_name='Procedure')
-        self.raw_data = self._load_and_process_data()
+        self.procedures_df = program.sheets['Procedure'] if program else pd.read_excel(self.excel_file, sheet_name='Procedure')
+        self.raw_data = raw_data if raw_data is not None else self._load_and_process_data()
         self.actions = DFT_Actions()
 
     def _load_and_process_data(self):
@@ -171,17 +275,7 @@ class TestAnalyzer:
         Returns:
             pandas.DataFrame: The preprocessed DataFrame.
         """
-        df = pd.read_excel(self.excel_file, sheet_name=self.sheet_name)
-        raw_data = df.iloc[:, :].copy()
-        raw_data.columns = [x.strip().replace(' ', '_') if isinstance(x, str) else x for x in
-                            raw_data.iloc[3].tolist()]
-        raw_data.set_index(raw_data.columns[0], inplace=True)
-
-        # Apply multiplier parsing to 'Typ', 'Min', and 'Max' rows
-        for row in ['Typ', 'Min', 'Max']:
-            raw_data.loc[row] = raw_data.loc[row].apply(lambda x: parse_multiplier_value(x))
-
-        return raw_data
+        return load_test_sheet(self.excel_file, self.sheet_name, self.program)
 
     def _process_procedure(self, procedure_name):
         """
@@ -212,14 +306,19 @@ class TestAnalyzer:
         # Use a dictionary to map parsing functions to execution logic for better readability and maintainability
         instruction_parsers = {
             parse_procedure_name: lambda procedure_name : self._process_procedure(procedure_name),
-            parse_register_notation: lambda registers: I2C_write_multiple_registers(self.dut,registers.get('registers',[]),registers.get('value',0)),  # Placeholder for register notation
+            parse_register_notation: self._process_register_write,
+            parse_symbolic_register_notation: self._process_symbolic_register_write,
+            parse_save_instruction: self._process_save_register,
+            parse_copy_instruction: self._process_copy_register,
+            parse_restore_instruction: self._process_restore_register,
             parse_wait_delay: lambda delay: self.actions.dft_delay_action(delay),
-            parse_force_instruction: lambda force: self.actions.dft_force_action(force),
+            parse_wait_until: self._process_wait_until,
+            parse_force_instruction: self._process_force,
             parse_savemeas: self._process_savemeas,
             parse_measurements: lambda measurement: None,  # Placeholder for measurement
-            parse_trigger_instruction: lambda trigger: None,  # Placeholder for trigger instruction
+            parse_trigger_instruction: self._process_trigger,
             parse_trim_instruction: lambda trim: None,  # Placeholder for trim instruction
-            parse_meas_match_regex: lambda match: None,  # Placeholder for measurement match regex
+            parse_meas_match_regex: self._process_meas_match,
             parse_calculate_expression: self._process_calculate_expression,
             parse_sweep_trig_store: self._process_sweep_trig_store,
             parse_constant_value: self._process_constant_value
@@ -228,11 +327,107 @@ class TestAnalyzer:
         for parser, executor in instruction_parsers.items():
             parsed_data = parser(instruction)
             if parsed_data:
-                executor(parsed_data)
+                if parser is parse_wait_delay:
+                    executor(parsed_data)
+                else:
+                    self._run_scheduled(executor, parsed_data)
                 return  # Stop after the first successful parse
 
         print(f'Procedure Unknown instruction: {instruction}')
 
+    def _process_register_write(self, register_data):
+        """
+        Writes a hex register notation to the DUT.
+
+        Args:
+            register_data (dict): Parsed data from the register notation.
+        """
+        registers = register_data.get('registers',[])
+        value = register_data.get('value',None)
+        if value == None:
+            print(f'!!!!!!!!!!!!!! fail Value not exists')
+            return
+        page = I2C_selected_page(self.dut)
+        if self.setup_state:
+            if self.setup_state.write_in_effect(page, registers, value):
+                print(f'setup already in effect, write dropped: {register_data}')
+                return
+            self.setup_state.record_write(page, registers, value)
+        I2C_write_multiple_registers(self.dut,registers,value)
+
+    def _process_symbolic_register_write(self, register_data):
+        """
+        Writes a symbolic register notation to the DUT, selecting the page of each field first
+        when the DUT is on another page.
+
+        Args:
+            register_data (dict): Parsed data from parse_symbolic_register_notation.
+        """
+        page = I2C_selected_page(self.dut)
+        if self.setup_state:
+            if self.setup_state.write_in_effect(page, register_data.get('registers',[]), register_data.get('value',0)):
+                print(f'setup already in effect, write dropped: {register_data}')
+                return
+            self.setup_state.record_write(page, register_data.get('registers',[]), register_data.get('value',0))
+        writes, _ = compile_register_write(register_data.get('registers',[]),register_data.get('value',0),page)
+        for register, value in writes:
+            I2C_write_register(self.dut,register,value)
+
+    def _process_wait_until(self, wait):
+        """
+        Waits until the register field reads the value, polling the DUT with a growing interval.
+        Without DUT the full timeout is waited, like a Wait__delay__ of the timeout.
+
+        Args:
+            wait (dict): Parsed data from the wait until instruction.
+        """
+        registers = wait.get('registers',[])
+        value = wait.get('value')
+        timeout = wait.get('timeout',0)
+        if not self.dut:
+            print(f'!!!! dut not present, waiting the timeout {timeout}s {wait}')
+            self.actions.dft_delay_action({'absValue': timeout})
+            return
+        if registers and (page := registers[0].get('page')) is not None:
+            # symbolic fields carry their page, select it once before polling
+            I2C_write_register(self.dut,PAGE_SELECT_REGISTER,page)
+        # polls are 200us apart at first, time.sleep would oversleep them to the OS tick
+        result = wait_until(lambda: I2C_read_multiple_registers(self.dut,registers),
+                            lambda read_value: read_value == value, timeout, sleep=precise_sleep)
+        if result.ready:
+            print(f'wait until ready after {result.elapsed:.6f}s ({result.polls} polls)')
+        else:
+            print(f'!!!!! wait until fail timeout {timeout}s, read {result.value} expected {value}: {wait}')
+
+    def _process_force(self, force):
+        """
+        Forces a signal, unless the same force is already in effect.
+
+        Args:
+            force (dict): Parsed data from the force instruction.
+        """
+        primary_signal = force.get('primary_signal')
+        secondary_signal = force.get('secondary_signal')
+        if self.setup_state:
+            if self.setup_state.force_in_effect(primary_signal, secondary_signal, force.get('absValue')):
+                print(f'setup already in effect, force dropped: {primary_signal} {force.get("absValue")}{force.get("unit")}')
+                return
+            self.setup_state.record_force(primary_signal, secondary_signal, force.get('absValue'))
+        self._forget_dut_state(primary_signal)
+        self.actions.dft_force_action(force)
+
+    def _forget_dut_state(self, signal):
+        """
+        Forgets the page and register values known of the DUT when one of its supplies is forced,
+        the DUT may reset. The setup state forgets its registers on its own, see SetupState.record_force.
+
+        Args:
+            signal (str): The forced or swept signal.
+        """
+        if ivm6201_supply_check(signal):
+            I2C_forget_page(self.dut)
+            I2C_forget_shadow(self.dut)
+
     def _process_savemeas(self, savemeas):
         """
         Processes a 'save measurement' instruction, saving the measured value to the Vars dictionary.
@@ -245,8 +440,9 @@ class TestAnalyzer:
         if save_variable:
             self.Vars[save_variable] = measured_value
         else:
-            variable_name = f"{self.test_name}_test{len(self.Vars) + 1}"
-            self.Vars[variable_name] = measured_value
+            save_variable = self.Vars.auto_name(self.test_name)
+            self.Vars[save_variable] = measured_value
+        self._record_measurement(save_variable, measured_value)
         # check the number of measurements made if test 
         # if the number of measurements made in test more than 1 either it go in calcaultion or Trimming 
         # check the test is not about triming
@@ -266,6 +462,9 @@ class TestAnalyzer:
         code = []
         if savemeas and trim_reg:
             if self.dut:
+                if self.setup_state:
+                    # the setup does not know the trim codes written below
+                    self.setup_state.forget(I2C_selected_page(self.dut),registers)
                 for register in registers:
                     if register:
                         msb = [msb+register.get('msb') for register in registers][-1]
@@ -312,6 +511,8 @@ class TestAnalyzer:
                     self.Vars[read_variable] = 0
                 else:
                     pass
+                if read_variable:
+                    self._record_measurement(read_variable, self.Vars[read_variable])
                 print(f'read varaible updated : {self.Vars}')
         else:
             if registers:
@@ -323,13 +524,58 @@ class TestAnalyzer:
                     self.Vars[save_variable] = random.randint(2**(msb-lsb)/2,2**(msb-lsb))
                     print(f'Read operation updated Vars : {self.Vars}')
                 pass
+    def _process_save_register(self,save_data):
+        """
+        Saves registers to a snapshot in one burst per run of consecutive addresses,
+        the combined value of the registers goes to the save variable.
+
+        Args:
+            save_data (dict): Parsed data from the save instruction.
+        """
+        registers = save_data.get('registers',[])
+        save_variable = save_data.get('save_variable','')
+        if self.dut:
+            if registers and (snapshot := capture_snapshot(self.dut,registers)):
+                self.snapshots[save_variable] = snapshot
+                self.Vars[save_variable] = snapshot.value(registers)
+                self._record_measurement(save_variable, self.Vars[save_variable])
+                print(f'save varaible updated : {self.Vars}')
+        else:
+            print(f'!!!! dut not present {save_data}')
+
+    def _process_copy_register(self,copy_data):
+        """
+        Copies the bits of one register to another register.
+
+        Args:
+            copy_data (dict): Parsed data from the copy instruction.
+        """
+        # the copy parser keeps the addresses as hex strings
+        copy_register, paste_register = [
+            {**register, 'address': int(register['address'],16) if isinstance(register['address'],str) else register['address']}
+            for register in (copy_data.get('copy_register'), copy_data.get('paste_register'))
+        ]
+        if self.dut:
+            if (register_data := I2C_read_multiple_registers(self.dut,[copy_register])) != None:
+                if self.setup_state:
+                    # the setup does not know the copied value
+                    self.setup_state.forget(I2C_selected_page(self.dut),[paste_register])
+                I2C_write_multiple_registers(self.dut,[paste_register],register_data)
+        else:
+            print(f'!!!! dut not present {copy_data}')
+
     def _process_restore_register(self,restore_data):
         registers = restore_data.get('registers',[])
         msb=0
         lsb=0
+        if self.setup_state:
+            self.setup_state.forget(I2C_selected_page(self.dut), registers)
         if self.dut:
             if registers:
-                if restore_variable := restore_data.get('restore_variable',''):
+                if (restore_variable := restore_data.get('restore_variable','')) in self.snapshots:
+                    # only the registers that changed since Save__ are written back
+                    restore_snapshot(self.dut,self.snapshots[restore_variable],addresses=register_masks(registers))
+                elif restore_variable:
                     restored_value = self.Vars.get(restore_variable,0)
                     register_data = I2C_write_multiple_registers(self.dut,registers,restored_value)
                 else:
@@ -364,17 +610,17 @@ class TestAnalyzer:
         try:
             # check if there is formula process the formula
             if formula:
-                calculated_value = solve_formula(formula_string=formula, variables=self.Vars | self.Const )
+                calculated_value = solve_formula(formula_string=formula, variables=self.Const)  # constants first, then variables
                 if calculate_varaible:
                     self.Vars[calculate_varaible] = calculated_value
                 elif operation:
                     self.Vars[operation] = calculated_value
                 else:
-                    calculate_varaible = f"{self.test_name}_test{len(self.Vars) + 1}"
+                    calculate_varaible = self.Vars.auto_name(self.test_name)
                     self.Vars[calculate_varaible] = calculated_value
 
                 # Perform limits testing
-                self.test_limits(calculated_value)
+                self.test_limits(calculated_value, calculate_varaible or operation)
                 print(
                     f"Calculated {calculate_varaible if calculate_varaible else operation} = {calculated_value} using formula {formula} and values: {self.Vars}")
             # if it is trimming avoid formula calculation
@@ -384,26 +630,129 @@ class TestAnalyzer:
         except Exception as e:
             print(f"Error calculating formula {formula}: {e}")
 
+    def _trigger_probe(self, signal, reference, unit=''):
+        """
+        Measure function of a trigger signal: the status bits when the signal is a register
+        map name and the DUT is present, the bench otherwise.
+
+        Args:
+            signal (str): Trigger signal, pin or register map name.
+            reference (str): Reference of the trigger signal.
+            unit (str): Unit of the samples, '' for a logic level.
+
+        Returns:
+            callable: measure() -> sample of the trigger signal.
+        """
+        if self.dut and (field := resolve_symbol(signal)):
+            if field.page is not None:
+                # the field is read on its page, select it once before the sweep samples it
+                I2C_write_register(self.dut, PAGE_SELECT_REGISTER, field.page)
+            return register_probe(self.dut, [{'address': field.address, 'msb': field.msb, 'lsb': field.lsb}])
+        return lambda: self.actions.dft_measure(signal, reference, unit)
+
+    def _process_trigger(self, trigger):
+        """
+        Runs the force sweep written before a Trigger__ instruction, stopped by the trigger.
+
+        Args:
+            trigger (dict): Parsed data from the trigger instruction.
+        """
+        signal = trigger.get('signal')
+        if not signal:
+            print(f'!!!!! trigger fail no trigger signal: {trigger}')
+            return
+        self._run_pending_sweep(TriggerDetector(trigger.get('action')), self._trigger_probe(signal, 'GND'))
+
+    def _process_meas_match(self, meas_match):
+        """
+        Runs the force sweep written before a Meas__Match__ instruction, the sweep stops when the
+        measured signal crosses the value.
+
+        Args:
+            meas_match (dict): Parsed data from the measurement match instruction.
+        """
+        self._run_pending_sweep(TriggerDetector(None, threshold=meas_match.get('value')),
+                                self._trigger_probe(meas_match.get('primary_signal'), meas_match.get('secondary_signal'),
+                                                    meas_match.get('unit')))
+
+    def _process_force_sweep(self, force_sweep):
+        """
+        Holds a force sweep until the next instruction: a Trigger__ or Meas__Match__ written after
+        the sweep stops it, any other instruction runs it to the end first.
+
+        Args:
+            force_sweep (dict): Parsed data from the force sweep instruction.
+        """
+        self._run_pending_sweep()
+        self.pending_sweep = force_sweep
+
+    def _run_pending_sweep(self, detector=None, measure=None):
+        """
+        Runs the force sweep waiting for its trigger, if any.
+
+        Args:
+            detector (TriggerDetector, optional): Trigger stopping the sweep.
+            measure (callable, optional): measure() -> sample of the trigger signal.
+        """
+        force_sweep, self.pending_sweep = self.pending_sweep, None
+        if force_sweep is None:
+            if detector:
+                print(f'!!!!! trigger fail no force sweep before it')
+            return
+        if self.setup_state:
+            self.setup_state.release(force_sweep.get('primary_signal', ''))
+        self._forget_dut_state(force_sweep.get('primary_signal', ''))
+        result = self.actions.dft_force_sweep(force_sweep, measure, detector)
+        if result and detector:
+            if result.trigger_index is None:
+                print(f'!!!!! force sweep {force_sweep.get("primary_signal")} trigger did not fire')
+            else:
+                print(f'force sweep {force_sweep.get("primary_signal")} triggered at {result.values[result.trigger_index]}')
+
     def _process_sweep_trig_store(self, sweep_trig_store):
         """
-        Processes a 'sweep trigger store' instruction, executing the action and saving the result to the Vars dictionary.
+        Processes a 'sweep trigger store' instruction: sweeps the sweep signal until the trigger
+        signal reaches its trigger state and saves the sweep value to the Vars dictionary.
 
         Args:
             sweep_trig_store (dict): Parsed data from the sweep trigger store instruction.
         """
-        sweep_trig_store_value = self.actions.dft_sweep_trig_store_action(sweep_trig_store)
-        if sweep_trig_store_value:
-            variable = sweep_trig_store.get('variable')
-            if variable:
-                self.Vars[variable] = sweep_trig_store_value
-            else:
-                variable_name = f"{self.test_name}_test{len(self.Vars) + 1}"
-                self.Vars[variable_name] = sweep_trig_store_value
+        sweep_signal = sweep_trig_store.get('sweep_signal')
+        sweeper_reference = sweep_trig_store.get('sweeper_reference') or 'GND'
+        unit = sweep_trig_store.get('unit') or ''
+        try:
+            sweep = Sweep.from_sweep_trig_store(sweep_trig_store)
+            detector = TriggerDetector(sweep_trig_store.get('trig_state'))
+        except (TypeError, ValueError) as error:
+            print(f'!!!!! sweep_trig_store fail {sweep_signal}: {error}')
+            return
+        if self.setup_state:
+            self.setup_state.release(sweep_signal)
+        self._forget_dut_state(sweep_signal)
+        measure = self._trigger_probe(sweep_trig_store.get('trig_signal'), sweep_trig_store.get('trig_reference') or 'GND')
 
-            # Perform limits testing
-            self.test_limits(sweep_trig_store_value)
+        print(f'Sweep {sweep_signal} wrt {sweeper_reference}: {sweep}, '
+              f'trigger {detector.trig_state} on {sweep_trig_store.get("trig_signal")}')
+        result = find_trigger(sweep, lambda value: self.actions.dft_force(sweep_signal, sweeper_reference, value, unit),
+                              measure, detector, self.trigger_search, sleep=precise_sleep)
+        sweep_trig_store_value = result.value
+        if sweep_trig_store_value is None:
+            print(f'!!!!! sweep_trig_store {sweep_signal} trigger did not fire after {result.points} points')
+            return
+
+        variable = sweep_trig_store.get('variable')
+        if variable:
+            self.Vars[variable] = sweep_trig_store_value
+        else:
+            variable_name = self.Vars.auto_name(self.test_name)
+            self.Vars[variable_name] = sweep_trig_store_value
+        self._record_measurement(variable or variable_name, sweep_trig_store_value)
+
+        # Perform limits testing
+        self.test_limits(sweep_trig_store_value, variable or variable_name)
 
-            print(f"sweep_trig_store {variable if variable else variable_name} = {sweep_trig_store_value} and values: {self.Vars}")
+        print(f"sweep_trig_store {variable if variable else variable_name} = {sweep_trig_store_value} "
+              f"({result.points} points) and values: {self.Vars}")
 
     def _process_constant_value(self, const_value):
         """
@@ -418,12 +767,21 @@ class TestAnalyzer:
 
         print(f"Updated Const: {self.Const}")
 
-    def test_limits(self, measured_value):
+    def _record_measurement(self, variable, value):
+        # raw values of the test, the calculations and limit checks can be run again from them
+        if self.record_measurement:
+            self.record_measurement(self.test_name, variable, value)
+
+    def test_limits(self, measured_value, variable=''):
         """
         Tests if the measured value is within the specified limits, now considering various combinations of min, typ, and max.
 
         Args:
             measured_value (float): The value to test against the limits.
+            variable (str): Test variable holding the value, recorded with the result.
+
+        Returns:
+            bool or None: True if the value passed, None if it has no limit to pass.
         """
         min_limit = self.raw_data.loc['Min', self.test_name]
         typ_limit = self.raw_data.loc['Typ', self.test_name]
@@ -437,11 +795,15 @@ class TestAnalyzer:
 
         if pd.isna(measured_value):
             print("Measured value is NaN, cannot perform limit testing.")
-            return
+            return None
+
+        passed = None
+        low_limit, high_limit = min_limit, max_limit
 
         if not pd.isna(min_limit) and not pd.isna(max_limit):
             # Check for min and max limits
-            if min_limit <= measured_value <= max_limit:
+            passed = bool(min_limit <= measured_value <= max_limit)
+            if passed:
                 print(f"PASS: Measured value {measured_value} is within limits ({min_limit}, {max_limit})")
                 if not pd.isna(typ_limit):
                     difference = abs(measured_value - typ_limit)
@@ -453,19 +815,23 @@ class TestAnalyzer:
                     print(f"Measured value {measured_value}, Typical limit {typ_limit}, Difference: {difference}")
         elif not pd.isna(max_limit) and pd.isna(min_limit):
             # Check if only max limit is available
-            if measured_value < max_limit:
+            passed = bool(measured_value < max_limit)
+            if passed:
                 print(f"PASS: Measured value {measured_value} is less than max limit ({max_limit})")
             else:
                 print(f"FAIL: Measured value {measured_value} is not less than max limit ({max_limit})")
         elif not pd.isna(min_limit) and pd.isna(max_limit):
             # Check if only min limit is available
-            if measured_value > min_limit:
+            passed = bool(measured_value > min_limit)
+            if passed:
                 print(f"PASS: Measured value {measured_value} is greater than min limit ({min_limit})")
             else:
                 print(f"FAIL: Measured value {measured_value} is not greater than min limit ({min_limit})")
         elif not pd.isna(min_limit) and not pd.isna(typ_limit) and pd.isna(max_limit):
             # Check if min and typical limits are available
-            if measured_value > min_limit and measured_value <= typ_limit:
+            passed = bool(measured_value > min_limit and measured_value <= typ_limit)
+            high_limit = typ_limit
+            if passed:
                 print(
                     f"PASS: Measured value {measured_value} is greater than min limit ({min_limit}) and not more than typical limit ({typ_limit})")
             else:
@@ -473,7 +839,9 @@ class TestAnalyzer:
                     f"FAIL: Measured value {measured_value} is not greater than min limit ({min_limit}) and not more than typical limit ({typ_limit})")
         elif not pd.isna(typ_limit) and not pd.isna(max_limit) and pd.isna(min_limit):
             # Check if typical and max limits are available
-            if measured_value < max_limit and measured_value >= typ_limit:
+            passed = bool(measured_value < max_limit and measured_value >= typ_limit)
+            low_limit = typ_limit
+            if passed:
                 print(
                     f"PASS: Measured value {measured_value} is less than max limit ({max_limit}) and equal or above typical limit ({typ_limit})")
             else:
@@ -486,9 +854,30 @@ class TestAnalyzer:
         else:
             print("No limits defined for this test.")
 
+        if self.record_result:
+            unit = self.raw_data.loc['Unit ', self.test_name] if 'Unit ' in self.raw_data.index else ''
+            self.record_result(self.test_name, measured_value, low_limit, high_limit,
+                               unit.strip() if isinstance(unit, str) else '', passed, variable)
+        return passed
+
+    def _run_scheduled(self, execute, *args):
+        """
+        Runs an action after the pending delays, the next delays count from its end.
+
+        Args:
+            execute (callable): The action.
+            *args: Arguments of the action.
+        """
+        self.actions.scheduler.wait()
+        try:
+            return execute(*args)
+        finally:
+            self.actions.scheduler.mark()
+
     def _process_instruction(self, instruction):
         """
         Processes a single instruction by parsing it and performing the corresponding action.
+        Wait__delay__ only schedules its delay, other instructions run once the pending delays are over.
 
         Args:
             instruction (str): The instruction string to process.
@@ -496,6 +885,22 @@ class TestAnalyzer:
         instruction = instruction.strip()
         if not instruction:
             return
+        # the trigger of a sweep is written after it, the sweep runs when the next instruction is not its trigger
+        if (self.pending_sweep and not re.match(r'"(?:[^\\"]|\\.)*"', instruction)
+                and not parse_trigger_instruction(instruction) and not parse_meas_match_regex(instruction)):
+            self._run_scheduled(self._run_pending_sweep)
+        if (delay := parse_wait_delay(instruction)):
+            self.actions.dft_delay_action(delay)
+            return
+        self._run_scheduled(self._execute_instruction, instruction)
+
+    def _execute_instruction(self, instruction):
+        """
+        Parses an instruction and performs the corresponding action.
+
+        Args:
+            instruction (str): The instruction string to process.
+        """
 
         if (procedure := parse_procedure_name(instruction)):
             if procedure in self.procedures_df.columns.to_list():
@@ -504,29 +909,26 @@ class TestAnalyzer:
                 print(f'!!!!!Procedure Failed {procedure}!!!!!!!!!')
         elif (delay := parse_wait_delay(instruction)):
             self.actions.dft_delay_action(delay)
+        elif (wait := parse_wait_until(instruction)):
+            self._process_wait_until(wait)
         elif (const_value := parse_constant_value(instruction)):
             self._process_constant_value(const_value)
         elif (register_data := parse_register_notation(instruction)):
             # print('Test Register operation', register_data)
-            registers = register_data.get('registers',[])
-            value = register_data.get('value',None)
             if self.dut :
-                if value != None:
-                    I2C_write_multiple_registers(self.dut,registers,value)
-                else:
-                    print(f'!!!!!!!!!!!!!! fail Value not exists')
+                self._process_register_write(register_data)
+            else:
+                print(f'!!!! dut not present {register_data}')
+        elif (register_data := parse_symbolic_register_notation(instruction)):
+            if self.dut :
+                self._process_symbolic_register_write(register_data)
             else:
                 print(f'!!!! dut not present {register_data}')
-
-            
-                
         elif (force_sweep := parse_force_sweep_instruction(instruction)):
             if (primay_signal := force_sweep.get('primary_signal')) and (ivm6201_pin_check(primay_signal)):
                 if (secondary_signal := force_sweep.get('secondary_signal')):
                     if ivm6201_pin_check(secondary_signal):
-                        # print(force_sweep)
-                        self.actions.dft_force_sweep(force_sweep)
-                        pass
+                        self._process_force_sweep(force_sweep)
                     else:
                         print(
                             f'!!!!! force_sweep secondary fail Signal pin Dose not Exist: {secondary_signal} , {force_sweep}')
@@ -539,7 +941,7 @@ class TestAnalyzer:
             secondary_signal = secondary_signal if (secondary_signal := force.get('secondary_signal')) else 'GND'
             
             if ivm6201_pin_check(primary_signal) and ivm6201_pin_check(secondary_signal):
-                self.actions.dft_force_action(force)
+                self._process_force(force)
             else:
                 print(f'!!!!!!!!!! IVM6201 Pin Check Failed Primary Signal : {primary_signal} Secondary Signal (reference) : {secondary_signal}')
         elif (savemeas := parse_savemeas(instruction)):
@@ -547,8 +949,9 @@ class TestAnalyzer:
             self.savemeas_data = savemeas
             # if measured_value:
             if len(self.Vars) <= 1 and not re.search('trim', self.test_name.lower()) and not re.search('Calculate__MinError',self.raw_data.loc['Instructions', self.test_name]):
+                variable = savemeas.get('save_variable') or self.Vars.auto_name(self.test_name)
                 measured_value = self._process_savemeas(savemeas)
-                self.test_limits(measured_value)
+                self.test_limits(measured_value, variable)
                 print(f"Updated measure Vars: {self.Vars}")
             elif (not re.search('trim', self.test_name.lower()) ) and (not re.search('Calculate__MinError',self.raw_data.loc['Instructions', self.test_name])):
                 measured_value = self._process_savemeas(savemeas)
@@ -571,15 +974,19 @@ class TestAnalyzer:
                         f'!!!!! measurement primary fail Signal pin Does not Exist: {primay_signal} , {measrement}')
         elif (read_data := parse_read_instruction(instruction)):
             self._process_read_register(read_data=read_data)
+        elif (save_data := parse_save_instruction(instruction)):
+            self._process_save_register(save_data)
+        elif (copy_data := parse_copy_instruction(instruction)):
+            self._process_copy_register(copy_data)
         elif (restore_data := parse_restore_instruction(instruction)):
             self._process_restore_register(restore_data)
         elif (trigger := parse_trigger_instruction(instruction)):
-            pass
+            self._process_trigger(trigger)
         elif (trim_reg := parse_trim_instruction(instruction)):
             self.trim_reg_data = trim_reg
             pass
         elif (meas_match := parse_meas_match_regex(instruction)):
-            pass
+            self._process_meas_match(meas_match)
         elif (calculate := parse_calculate_expression(instruction)):
             trim_reg = self.trim_reg_data if self.trim_reg_data else None
             savemeas = self.savemeas_data if self.savemeas_data else None
@@ -591,7 +998,8 @@ class TestAnalyzer:
             trig_reference = sweep_trig_store.get('trig_reference')
             sweep_signal_check = ivm6201_pin_check(sweep_signal) if sweep_signal else False
             sweeper_reference_check = ivm6201_pin_check(sweeper_reference) if sweeper_reference else False
-            trig_signal_check = ivm6201_pin_check(trig_signal) if trig_signal else False
+            # the trigger signal can also be a status register of the register map
+            trig_signal_check = (ivm6201_pin_check(trig_signal) or resolve_symbol(trig_signal) is not None) if trig_signal else False
             trig_reference_check = ivm6201_pin_check(trig_reference) if trig_reference else False
 
             if sweep_signal_check and sweeper_reference_check and trig_signal_check and trig_reference_check:
@@ -611,13 +1019,27 @@ class TestAnalyzer:
     def analyze_test(self):
         """
         Analyzes the test by processing each instruction in the raw data.
+
+        A DUT that stops answering once the retries run out fails the test, recorded without a value,
+        the error is kept in bus_error for the caller to move on.
         """
         print('*' * 10, self.test_name, '*' * 10)
-        for instruction in self.raw_data.loc['Instructions', self.test_name].split('\n'):
-            instruction = instruction.strip()
-            if not instruction:
-                continue
-            self._process_instruction(instruction)
+        try:
+            for instruction in self.raw_data.loc['Instructions', self.test_name].split('\n'):
+                instruction = instruction.strip()
+                if not instruction:
+                    continue
+                self._process_instruction(instruction)
+            if self.pending_sweep:
+                self._run_scheduled(self._run_pending_sweep)
+            self.actions.scheduler.wait()
+        except I2CBusError as error:
+            self.bus_error = error
+            self.pending_sweep = None
+            print(f'!!!!! {self.test_name} fail :> I2C bus error {error}')
+            print(f'I2C recovery: {I2C_recovery_counters(self.dut)}')
+            if self.record_result:
+                self.record_result(self.test_name, None, None, None, '', False, '')
 
         print(
             f" min limit: {self.raw_data.loc['Min', self.test_name]}\n typ limit: {self.raw_data.loc['Typ', self.test_name]}\n max limit: {self.raw_data.loc['Max', self.test_name]} ")
@@ -632,9 +1054,15 @@ def main():
     parser.add_argument("--excel_file", help="Path to the Excel file.")
     parser.add_argument("--sheet_name", help="Name of the sheet to read.")
     parser.add_argument("--test_name", help="Name of the test to analyze.")
+    parser.add_argument("--journal", help="Record the I2C transactions to this journal file.")
+    parser.add_argument("--replay", help="Replay the I2C transactions of this journal file, without hardware.")
+    parser.add_argument("--bisect", action='store_true',
+                        help="Find Sweep__Trig__Store triggers by bisection, for triggers that change once along the sweep.")
     args = parser.parse_args()
 
-    analyzer = TestAnalyzer(args.excel_file, args.sheet_name, args.test_name)
+    dut = open_dut(args.journal, args.replay) if args.journal or args.replay else None
+    analyzer = TestAnalyzer(args.excel_file, args.sheet_name, args.test_name, dut=dut,
+                            trigger_search=BISECT_SEARCH if args.bisect else LINEAR_SEARCH)
     analyzer.analyze_test()
 
 
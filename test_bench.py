@@ -1,6 +1,13 @@
+import argparse
+import sequencer
+from common import open_dut
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the CP bench tests.")
+    parser.add_argument("--journal", help="Record the I2C transactions to this journal file.")
+    parser.add_argument("--replay", help="Replay the I2C transactions of this journal file, without hardware.")
+    args = parser.parse_args()
 
-import test_analyzer
-for test_name in ['NL_ron', 'PL_ron', 'NH_ron', 'PH_ron', 'CP_PGOOD', 'Startup_Current', 'IABSP2N', 'IABSN2P', 'IDISCHARGE', 'Vout_Functional']:
-    analyze = test_analyzer.TestAnalyzer(excel_file="IVM6201_ATE_TM.xlsx", sheet_name="CP", test_name=test_name)
-    analyze.analyze_test()
\ No newline at end of file
+    sequencer.run_sequence(excel_file="IVM6201_ATE_TM.xlsx", sheet_name="CP",
+                           test_names=['NL_ron', 'PL_ron', 'NH_ron', 'PH_ron', 'CP_PGOOD', 'Startup_Current', 'IABSP2N', 'IABSN2P', 'IDISCHARGE', 'Vout_Functional'],
+                           dut=open_dut(args.journal, args.replay) if args.journal or args.replay else None)
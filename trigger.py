@@ -0,0 +1,186 @@
+import time
+from collections import namedtuple
+from common import I2C_read_multiple_registers
+
+EDGE = 'edge'
+LEVEL = 'level'
+# Trigger states of the sweep instructions, the level the trigger signal goes to
+TRIG_LEVELS = {'LH': 1, 'HL': 0}
+
+# Linear sweep until the trigger fires, or coarse sweep refined by bisection
+LINEAR_SEARCH = 'linear'
+BISECT_SEARCH = 'bisect'
+# Coarse step of the bisection search, in steps of the instruction
+COARSE_FACTOR = 8
+
+# value: sweep value the trigger fired at (None if it did not), points: measured points, forces: forced points
+TriggerResult = namedtuple('TriggerResult', ['value', 'points', 'forces'])
+
+
+class TriggerDetector:
+    """
+    Detects the trigger state on the samples of a trigger signal.
+
+    A sample is turned into a logic level, by comparing it to the threshold when one is given
+    or by its truth value (digital reading, register bits). In EDGE mode the trigger fires on
+    the first sample at the target level after a sample at the other level, in LEVEL mode on
+    the first sample at the target level. Without trig_state any edge fires the trigger.
+    """
+
+    def __init__(self, trig_state='LH', threshold=None, mode=EDGE):
+        """
+        Args:
+            trig_state (str or None): 'LH' or 'HL', None for any edge.
+            threshold (float, optional): Level threshold of analog samples.
+            mode (str): EDGE or LEVEL.
+        """
+        if trig_state is not None and trig_state not in TRIG_LEVELS:
+            raise ValueError(f"unknown trigger state {trig_state}")
+        if mode not in (EDGE, LEVEL):
+            raise ValueError(f"unknown trigger mode {mode}")
+        self.trig_state = trig_state
+        self.threshold = threshold
+        self.mode = mode
+        self.previous_level = None
+
+    def level(self, sample):
+        """
+        Returns:
+            int: Logic level of a sample.
+        """
+        return int(sample >= self.threshold) if self.threshold is not None else int(bool(sample))
+
+    def fired(self, level):
+        """
+        Returns:
+            bool: True if the level is the target level of the trigger.
+        """
+        return self.trig_state is None or level == TRIG_LEVELS[self.trig_state]
+
+    def reset(self):
+        self.previous_level = None
+
+    def __call__(self, value, sample):
+        """
+        Feeds one sample, signature of the Sweep.run trigger.
+
+        Returns:
+            bool: True when the trigger fires.
+        """
+        level = self.level(sample)
+        previous_level, self.previous_level = self.previous_level, level
+        if self.mode == LEVEL:
+            return self.fired(level)
+        return previous_level is not None and previous_level != level and self.fired(level)
+
+
+def register_probe(slave, registers):
+    """
+    Measures the trigger signal on DUT status register bits.
+
+    Args:
+        slave: I2C slave of the DUT.
+        registers (list): Register dictionaries of the status bits, MSB first.
+
+    Returns:
+        callable: measure() -> value of the status bits.
+    """
+    return lambda: I2C_read_multiple_registers(slave, registers) or 0
+
+
+def _settle(sweep_time, sleep):
+    if sweep_time:
+        sleep(sweep_time)
+
+
+def bisect_trigger(sweep, force, measure, detector, coarse_factor=COARSE_FACTOR, sleep=time.sleep):
+    """
+    Finds the sweep point where the trigger fires with a coarse sweep refined by bisection.
+
+    The coarse sweep visits every coarse_factor-th point of the sweep until the trigger fires,
+    the points of the last coarse interval are then bisected. Every bisection probe is
+    approached from the start of the sweep, so hysteresis (PGOOD like signals) does not
+    move the result. The result is the point a full sweep would stop at, and the signal is left
+    forced at it as a full sweep leaves it. The trigger has to change once along the sweep,
+    a trigger that fires and releases within a coarse interval can be missed.
+
+    Args:
+        sweep (Sweep): Sweep of the instruction.
+        force (callable): force(value).
+        measure (callable): measure() -> trigger signal sample.
+        detector (TriggerDetector): Trigger condition.
+        coarse_factor (int): Coarse step in sweep points.
+        sleep (callable): Sleep function in seconds.
+
+    Returns:
+        TriggerResult: The first sweep value at the trigger level.
+    """
+    indices = list(range(0, len(sweep), max(1, coarse_factor)))
+    if indices and indices[-1] != len(sweep) - 1:
+        indices.append(len(sweep) - 1)
+
+    detector.reset()
+    points = forces = 0
+    fired = None
+    for position, index in enumerate(indices):
+        force(sweep[index])
+        _settle(sweep.sweep_time, sleep)
+        points += 1
+        forces += 1
+        if detector(sweep[index], measure()):
+            fired = position
+            break
+    if fired is None:
+        return TriggerResult(None, points, forces)
+    if fired == 0:
+        return TriggerResult(sweep[0], points, forces)
+
+    target_level = detector.previous_level
+    before, after = indices[fired - 1], indices[fired]
+    forced = after
+    while after - before > 1:
+        middle = (before + after) // 2
+        # start again from the beginning of the sweep, hysteresis may hold the trigger state
+        # anywhere between the sweep start and the point that fired
+        force(sweep.initial_value)
+        _settle(sweep.sweep_time, sleep)
+        force(sweep[middle])
+        _settle(sweep.sweep_time, sleep)
+        forces += 2
+        points += 1
+        forced = middle
+        if detector.level(measure()) == target_level:
+            after = middle
+        else:
+            before = middle
+    if forced != after:
+        # leave the signal at the trigger point, approached from the start like the probes
+        force(sweep.initial_value)
+        _settle(sweep.sweep_time, sleep)
+        force(sweep[after])
+        _settle(sweep.sweep_time, sleep)
+        forces += 2
+    return TriggerResult(sweep[after], points, forces)
+
+
+def find_trigger(sweep, force, measure, detector, search=LINEAR_SEARCH, sleep=time.sleep):
+    """
+    Sweeps until the trigger fires.
+
+    Args:
+        sweep (Sweep): Sweep of the instruction.
+        force (callable): force(value).
+        measure (callable): measure() -> trigger signal sample.
+        detector (TriggerDetector): Trigger condition.
+        search (str): LINEAR_SEARCH, or BISECT_SEARCH for a trigger that changes once along the sweep.
+        sleep (callable): Sleep function in seconds.
+
+    Returns:
+        TriggerResult: The trigger value, None if the trigger did not fire.
+    """
+    if search == BISECT_SEARCH:
+        return bisect_trigger(sweep, force, measure, detector, sleep=sleep)
+    detector.reset()
+    result = sweep.run(force, measure, detector, sleep=sleep)
+    value = float(result.values[result.trigger_index]) if result.trigger_index is not None else None
+    return TriggerResult(value, result.count, result.count)
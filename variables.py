@@ -0,0 +1,96 @@
+import sys
+from collections.abc import MutableMapping
+import numpy as np
+
+# Initial slots of a store, the value array doubles when it is full
+INITIAL_SLOTS = 16
+
+
+class VariableStore(MutableMapping):
+    """
+    Test variables held in a float array, each name interned to a slot of the array.
+
+    A store can overlay a parent store: names not set in the store are looked up in the parent,
+    writes always go to the store. Formulas are evaluated on the store directly, no dictionary
+    is built per evaluation.
+
+    With several sites every slot holds one value per site, reads return the vector of the sites.
+    With one site reads return a scalar, int for the values stored as int. None is stored as NaN.
+    """
+
+    def __init__(self, parent=None, sites=1):
+        """
+        Args:
+            parent (VariableStore or Mapping, optional): Store looked up for the names not set in this one.
+            sites (int): Values per variable, one per DUT run together.
+        """
+        self.parent = parent
+        self.sites = sites
+        self._slots = {}  # name -> slot, in assignment order
+        self._values = np.full((INITIAL_SLOTS, sites), np.nan)
+        self._is_int = np.zeros(INITIAL_SLOTS, dtype=bool)
+
+    def slot(self, name):
+        """
+        Returns:
+            int: Slot of a variable of the store, allocated if the variable is new.
+        """
+        if (slot := self._slots.get(name)) is not None:
+            return slot
+        slot = len(self._slots)
+        if slot == len(self._values):
+            self._values = np.concatenate([self._values, np.full_like(self._values, np.nan)])
+            self._is_int = np.concatenate([self._is_int, np.zeros_like(self._is_int)])
+        self._slots[sys.intern(name)] = slot
+        return slot
+
+    def auto_name(self, prefix):
+        """
+        Returns:
+            str: Name of the next unnamed variable of a test, '<prefix>_test<n>'.
+        """
+        return f"{prefix}_test{len(self) + 1}"
+
+    def __getitem__(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            if self.parent is None:
+                raise KeyError(name)
+            return self.parent[name]
+        if self.sites > 1:
+            return self._values[slot].copy()
+        value = self._values[slot, 0]
+        return int(value) if self._is_int[slot] else float(value)
+
+    def __setitem__(self, name, value):
+        slot = self.slot(name)
+        self._is_int[slot] = isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+        self._values[slot] = np.nan if value is None else value
+
+    def __delitem__(self, name):
+        # the slots after it move down to keep the array compact
+        slot = self._slots.pop(name)
+        self._values[slot:-1] = self._values[slot + 1:]
+        self._is_int[slot:-1] = self._is_int[slot + 1:]
+        self._values[-1] = np.nan
+        self._is_int[-1] = False
+        self._slots = {other: other_slot - (other_slot > slot) for other, other_slot in self._slots.items()}
+
+    def __contains__(self, name):
+        return name in self._slots or (self.parent is not None and name in self.parent)
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def array(self):
+        """
+        Returns:
+            numpy.ndarray: (variables, sites) values of the store in assignment order, a view on the store.
+        """
+        return self._values[:len(self._slots)]
+
+    def __repr__(self):
+        return repr(dict(self.items()))